@@ -1,17 +1,29 @@
 import os
 import cv2
-import torch
 import numpy as np
-import shutil
 import uuid
 import requests
 import time
 import base64
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Query, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
-from ultralytics import YOLO
+from fastapi.responses import StreamingResponse, JSONResponse, FileResponse, Response
 from dotenv import load_dotenv
+from model_loader import ModelLoader
+from camera_registry import CameraRegistry, CapturePool
+from mjpeg_broadcast import StreamHub, resolve_profile
+from video_analysis import AnalysisJobManager
+from content_store import ContentStore, DetectionCache, model_version
+from detection_stream import BinaryEncoder, frame_message, sse_event, to_json
+from alert_limiter import make_rate_limiter
+from cascade import CascadeDetector, SCREENER_IMGSZ, SCREENER_MODEL_PATH
+from clip_recorder import ClipRecorder
+from cpu_layout import InferenceGate, resolve_layout
+from frame_buffers import thread_buffers
+from snapshot_writer import SnapshotWriter, SNAPSHOT_JPEG_QUALITY
+from local_verifier import (LocalVerifier, classifier_from_model, LOCAL_VERIFY, LOCAL_VERIFY_CLASSIFIER,
+                            LOCAL_VERIFY_CLASSIFIER_IMGSZ, sign_local_check)
 # Note: gemini_fire_verifier is no longer used here - Gemini verification is handled by Next.js
 
 # Load environment variables from .env file
@@ -27,25 +39,66 @@ os.makedirs(TEMP_DIR, exist_ok=True)
 # Create a directory to store detection snapshots
 SNAPSHOT_DIR = "saved_snapshots"
 os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+# Snapshots are encoded by the caller and written in the background; /snapshots serves
+# images from memory until their file is in place (see snapshot_writer.py)
+snapshot_writer = SnapshotWriter(SNAPSHOT_DIR)
 
-# Alert throttling configuration
-ALERT_THROTTLE_SECONDS = 5
-_last_alert_time = {}
+# Alert throttling: token bucket per (camera, class); ALERT_LIMITER_DB shares it across processes
+alert_limiter = make_rate_limiter()
 
 # Note: All cooldown logic is now handled by Next.js via Firebase
 # Python just does YOLO detection and triggers alerts via Next.js API
 
+# CPU layout: concurrent model calls are limited to the layout's worker count and each
+# uses its share of the cores, so many streams don't oversubscribe the CPU (see cpu_layout.py)
+cpu_layout = resolve_layout()
+inference_gate = InferenceGate(cpu_layout)
+INFERENCE_THREADS = min(slot["threads"] for slot in cpu_layout["workers"])
+
 # Model setup
-device = "cuda" if torch.cuda.is_available() else "cpu"
-print(f"[INFO] Using device: {device}")
-try:
-    model = YOLO("best.pt").to(device)
-    class_names = model.names
-    print("[INFO] YOLO model loaded successfully.")
-except Exception as e:
-    print(f"[ERROR] Failed to load model: {e}")
-    # Exit or handle the error appropriately if the model is critical
-    exit()
+# The model loads and warms up in the background so the server binds right away;
+# /readyz reports when it can take traffic.
+model_loader = ModelLoader(os.getenv("MODEL_PATH", "best.pt"), imgsz=640, threads=INFERENCE_THREADS)
+# Optional cascade: a small screener gates the full detector on stream frames (see cascade.py)
+screener_loader = ModelLoader(SCREENER_MODEL_PATH, imgsz=SCREENER_IMGSZ, threads=INFERENCE_THREADS) if SCREENER_MODEL_PATH else None
+# Optional fire/not-fire classifier for the local pre-verification of alerts (see local_verifier.py)
+verifier_loader = (ModelLoader(LOCAL_VERIFY_CLASSIFIER, imgsz=LOCAL_VERIFY_CLASSIFIER_IMGSZ, backend="torch",
+                               warmup_sizes=[], threads=INFERENCE_THREADS)
+                   if LOCAL_VERIFY and LOCAL_VERIFY_CLASSIFIER else None)
+
+# SERVING_MODE=shared: this process holds no model and hands frames to the
+# model_server.py inference process(es) through shared memory instead.
+SERVING_MODE = os.getenv("SERVING_MODE", "local")
+model_client = None
+if SERVING_MODE == "shared":
+    from model_server import InferenceClient
+    model_client = InferenceClient()
+
+# Camera registry (camera_id -> device / file / RTSP URL) and persistent capture handles
+camera_registry = CameraRegistry()
+capture_pool = CapturePool(camera_registry)
+
+# Per-camera buffers of already-encoded stream frames; alerts turn them into pre/post-roll clips
+clip_recorder = ClipRecorder()
+if model_client is not None:
+    # alerts are raised in the inference processes, the frames are buffered here
+    model_client.on_clip = clip_recorder.begin
+    # keyed like the stream buffers, so frames without a camera ID count for the default camera
+    model_client.has_clip_ring = lambda camera_id: clip_recorder.has_frames(alert_camera_id(camera_id))
+
+# Shared MJPEG producers: one inference loop per source, one encode per viewer profile
+stream_hub = StreamHub(recorder=clip_recorder)
+
+# Uploads are stored once per content hash; detections are cached per (content, model, settings)
+content_store = ContentStore()
+detection_cache = DetectionCache()
+# Settings that change stream detections; part of the cache key
+STREAM_CACHE_SETTINGS = {"imgsz": 640}
+if SCREENER_MODEL_PATH:
+    STREAM_CACHE_SETTINGS["screener"] = os.path.basename(SCREENER_MODEL_PATH)
+
+# Offline analysis jobs for uploaded footage (own worker processes, see video_analysis.py)
+analysis_jobs = AnalysisJobManager(os.getenv("MODEL_PATH", "best.pt"), imgsz=640, store=content_store, cache=detection_cache)
 
 # FastAPI app setup
 app = FastAPI()
@@ -57,142 +110,311 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+def start_model_loading():
+    if model_client is None:
+        model_loader.start()
+        if screener_loader is not None:
+            screener_loader.start()
+        if verifier_loader is not None:
+            verifier_loader.start()
+
+@app.on_event("shutdown")
+def release_cameras():
+    capture_pool.close()
+
+@app.on_event("shutdown")
+def stop_analysis_workers():
+    analysis_jobs.close()
+
+@app.on_event("shutdown")
+def flush_snapshots():
+    if not snapshot_writer.flush(timeout=10):
+        print("[SNAPSHOT] ⚠️ Some snapshots were not written before shutdown")
+
+def model_status():
+    if model_client is not None:
+        return model_client.status()
+    return {**model_loader.status(), "cpu": inference_gate.status(), "alerts": alert_limiter.stats()}
+
+def model_ready():
+    return model_client.ready if model_client is not None else model_loader.ready
+
+def current_model_version():
+    """Cache key component for whatever model is serving right now."""
+    if model_client is None:
+        variant = model_loader.backend if model_loader.ready else None
+    else:
+        # the model servers report the variant they loaded
+        variant = next((s.get("backend") for s in model_client.status()["servers"] if s.get("ready")), None)
+    # not loaded anywhere yet: the variant the configured settings resolve to
+    return model_version(model_loader.weights, variant, backend=model_loader.backend)
+
+def model_not_ready_response():
+    """503 returned by model-backed endpoints until the model is ready."""
+    return JSONResponse(
+        content={"error": "Model not ready", **model_status()},
+        status_code=503,
+        headers={"Retry-After": "5"}
+    )
+
 # ------------------------------
 # Core Inference Logic
 # ------------------------------
-def infer_and_draw(frame, camera_id=None):
-    """Runs YOLO inference, draws bounding boxes, and triggers alerts for fire/smoke detections."""
-    results = model(frame, imgsz=640, verbose=False)
-    
-    # Track best detection for alerting
-    best_detection = None
-    best_conf = 0.0
-    
+def run_model(model, class_names, frame, imgsz):
+    """Runs a YOLO model and returns [{"class", "confidence", "bbox": [x1, y1, x2, y2]}, ...] for every box."""
+    with inference_gate:
+        results = model(frame, imgsz=imgsz, verbose=False)
+    detections = []
     for r in results:
         for box in r.boxes:
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-            conf = float(box.conf[0])
-            cls = int(box.cls[0])
-            name = class_names[cls]
-            
-            # Draw rectangle and label for all detections
-            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
-            label = f"{name} {conf:.2f}"
-            cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-            
-            # Track highest confidence fire/smoke detection
-            if name in ["fire", "smoke"] and conf > 0.75:
-                if conf > best_conf:
-                    best_conf = conf
-                    best_detection = {
-                        "class": name,
-                        "confidence": conf,
-                        "bbox": [x1, y1, x2, y2]
-                    }
+            detections.append({
+                "class": class_names[int(box.cls[0].item())],
+                "confidence": float(box.conf[0].item()),
+                "bbox": box.xyxy[0].tolist()
+            })
+    return detections
+
+def detect_objects(frame, camera_id=None):
+    """Runs the full detector on 'frame' (camera_id picks the model server in shared mode)."""
+    if model_client is not None:
+        return model_client.detect(frame, camera_id)
+
+    return run_model(model_loader.get(), model_loader.class_names, frame, 640)
+
+def screen_objects(frame):
+    """Runs the cascade's screener model on 'frame'."""
+    return run_model(screener_loader.get(), screener_loader.class_names, frame, SCREENER_IMGSZ)
+
+cascade = CascadeDetector(screen_objects, detect_objects) if screener_loader is not None else None
+
+_fire_classifier = None
+
+def classify_fire(crop):
+    """Fire probability of a detection crop from the verification classifier (None until it has loaded)."""
+    global _fire_classifier
+    if not verifier_loader.ready:
+        return None
+    if _fire_classifier is None:
+        _fire_classifier = classifier_from_model(verifier_loader.get(), LOCAL_VERIFY_CLASSIFIER_IMGSZ)
+    with inference_gate:
+        return _fire_classifier(crop)
+
+# Local pre-verification: clear REAL_FIRE / NOT_REAL_FIRE cases are settled before Gemini
+local_verifier = LocalVerifier(classify_fire if verifier_loader is not None else None) if LOCAL_VERIFY else None
+
+def stream_detections(frame, camera_id=None):
+    """
+    Detections for a stream frame: through the cascade when a screener is configured and loaded,
+    the full detector otherwise (also while the screener is still loading or if it failed).
+    """
+    if local_verifier is not None:
+        # flicker history for alert verification, before any boxes are drawn
+        local_verifier.observe(alert_camera_id(camera_id), frame)
+    if cascade is not None and screener_loader.ready:
+        return cascade.run(frame, camera_id)
+    return detect_objects(frame, camera_id)
+
+def draw_detections(frame, detections):
+    """Draws a rectangle and label for every detection, in place."""
+    for det in detections:
+        x1, y1, x2, y2 = map(int, det["bbox"])
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
+        label = f"{det['class']} {det['confidence']:.2f}"
+        cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+
+def best_fire_detection(detections):
+    """Highest confidence fire/smoke detection above the alert threshold, or None."""
+    best_detection = None
+    for det in detections:
+        if det["class"] in ["fire", "smoke"] and det["confidence"] > 0.75:
+            if best_detection is None or det["confidence"] > best_detection["confidence"]:
+                best_detection = {
+                    "class": det["class"],
+                    "confidence": det["confidence"],
+                    "bbox": [int(v) for v in det["bbox"]]
+                }
+    return best_detection
+
+def alert_camera_id(camera_id=None):
+    """Camera ID alerts (and clip buffers) are filed under."""
+    return camera_id or os.getenv("DEFAULT_CAMERA_ID", "demo_camera")
+
+def save_snapshot(frame):
+    """
+    JPEG-encodes 'frame' and queues it for the snapshot writer.
+    Returns (image_id, jpeg bytes), or (None, None) when encoding failed.
+    """
+    ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, SNAPSHOT_JPEG_QUALITY])
+    if not ok:
+        return None, None
+    image_id = f"{uuid.uuid4()}.jpg"
+    jpeg = buffer.tobytes()
+    snapshot_writer.submit(image_id, jpeg)
+    return image_id, jpeg
+
+def trigger_alert(frame, best_detection, camera_id=None):
+    """Saves a snapshot of 'frame' and triggers an alert via Next.js, subject to throttling."""
+    safe_camera_id = alert_camera_id(camera_id)
+    detected_at = time.time()
     
-    # If fire detected, save snapshot and trigger alert via Next.js
-    if best_detection:
-        safe_camera_id = camera_id or os.getenv("DEFAULT_CAMERA_ID", "demo_camera")
+    # Check throttle (takes the token up front so concurrent streams can't both alert)
+    if not alert_limiter.allow(safe_camera_id, best_detection["class"]):
+        # Too soon, skip alert
+        return
         
-        # Check throttle
-        current_time = time.time()
-        last_time = _last_alert_time.get(safe_camera_id, 0)
+    try:
+        # Encode once: the JPEG is saved locally as backup (in the background)
+        # and sent as base64 for Firebase storage
+        image_id, jpeg = save_snapshot(frame)
         
-        if current_time - last_time < ALERT_THROTTLE_SECONDS:
-            # Too soon, skip alert
-            return frame
+        if image_id:
+            image_base64 = base64.b64encode(jpeg).decode('utf-8')
+            print(f"[PYTHON] 🔥 Fire detected: {best_detection['class']} ({best_detection['confidence']:.2f})")
+            print(f"[PYTHON] 📸 Snapshot queued: {image_id} (base64 size: {len(image_base64)} chars)")
             
-        try:
-            # Update last alert time immediately to prevent race conditions
-            _last_alert_time[safe_camera_id] = current_time
-
-            # Encode frame as base64 for Firebase storage
-            _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-            image_base64 = base64.b64encode(buffer).decode('utf-8')
+            # Trigger alert via Next.js client-trigger endpoint
+            # This will handle Gemini verification and cooldown logic
+            nextjs_url = os.getenv("NEXTJS_API_URL", "http://localhost:3000")
+            # Pre/post-roll clip from the camera's stream buffer, written in the background (None if not streaming)
+            clip_id = clip_recorder.begin(safe_camera_id)
+            # Clear cases are settled locally in milliseconds; Next.js only asks Gemini about the rest
+            local_check = local_verifier.verify(frame, best_detection, safe_camera_id) if local_verifier is not None else None
+            local_check = sign_local_check(local_check, image_id)
+            if local_check and local_check["result"]:
+                print(f"[PYTHON] 🧪 Local check: {local_check['result']} ({local_check['reason']})")
+            alert_payload = {
+                "cameraId": safe_camera_id,
+                "imageId": image_id,
+                "imageBase64": image_base64,
+                "className": best_detection["class"],
+                "confidence": best_detection["confidence"],
+                "bbox": best_detection["bbox"],
+                "clipId": clip_id,
+                "localCheck": local_check,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(detected_at)) + f".{int(detected_at * 1000) % 1000:03d}Z"
+            }
             
-            # Save snapshot locally as backup
-            image_id = f"{uuid.uuid4()}.jpg"
-            snapshot_path = os.path.join(SNAPSHOT_DIR, image_id)
-            success = cv2.imwrite(snapshot_path, frame)
+            response = requests.post(
+                f"{nextjs_url}/api/alerts/client-trigger",
+                json=alert_payload,
+                headers={"Content-Type": "application/json"},
+                timeout=10  # Increased timeout for larger payload
+            )
             
-            if success:
-                print(f"[PYTHON] 🔥 Fire detected: {best_detection['class']} ({best_detection['confidence']:.2f})")
-                print(f"[PYTHON] 📸 Snapshot saved: {image_id} (base64 size: {len(image_base64)} chars)")
-                
-                # Trigger alert via Next.js client-trigger endpoint
-                # This will handle Gemini verification and cooldown logic
-                nextjs_url = os.getenv("NEXTJS_API_URL", "http://localhost:3000")
-                alert_payload = {
-                    "cameraId": safe_camera_id,
-                    "imageId": image_id,
-                    "imageBase64": image_base64,
-                    "className": best_detection["class"],
-                    "confidence": best_detection["confidence"],
-                    "bbox": best_detection["bbox"],
-                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
-                }
-                
-                response = requests.post(
-                    f"{nextjs_url}/api/alerts/client-trigger",
-                    json=alert_payload,
-                    headers={"Content-Type": "application/json"},
-                    timeout=10  # Increased timeout for larger payload
-                )
+            if response.status_code == 200:
+                print(f"[PYTHON] ✅ Alert triggered successfully for camera {safe_camera_id}")
+            else:
+                print(f"[PYTHON] ⚠️ Alert trigger failed: {response.status_code} - {response.text}")
                 
-                if response.status_code == 200:
-                    print(f"[PYTHON] ✅ Alert triggered successfully for camera {safe_camera_id}")
-                else:
-                    print(f"[PYTHON] ⚠️ Alert trigger failed: {response.status_code} - {response.text}")
-                    
-        except Exception as e:
-            print(f"[PYTHON] ❌ Error triggering alert: {e}")
+    except Exception as e:
+        print(f"[PYTHON] ❌ Error triggering alert: {e}")
+
+def infer_and_draw(frame, camera_id=None):
+    """Runs YOLO inference, draws bounding boxes, and triggers alerts for fire/smoke detections."""
+    if model_client is not None:
+        return model_client.infer_and_draw(frame, camera_id)
 
+    detections = stream_detections(frame, camera_id)
+    draw_detections(frame, detections)
+    
+    # If fire detected, save snapshot and trigger alert via Next.js
+    best_detection = best_fire_detection(detections)
+    if best_detection:
+        trigger_alert(frame, best_detection, camera_id)
 
     return frame
 
+def infer_detections(frame, camera_id=None):
+    """
+    Like infer_and_draw, but leaves 'frame' untouched and returns the detections.
+    Boxes are only drawn (on a reused per-thread copy) when an alert snapshot is needed.
+    """
+    if model_client is not None:
+        return model_client.infer_detections(frame, camera_id)
+
+    detections = stream_detections(frame, camera_id)
+    best_detection = best_fire_detection(detections)
+    if best_detection:
+        annotated = thread_buffers().copy(frame, "annotated")
+        draw_detections(annotated, detections)
+        trigger_alert(annotated, best_detection, camera_id)
+    return detections
+
 
 
 # ------------------------------
 # Video Processing Generator
 # ------------------------------
-def process_video_stream(video_source, camera_id=None):
-    """
-    Opens a video source, processes each frame, and yields it as JPEG bytes.
-    'video_source' can be a file path or a camera index (e.g., 0).
-    'camera_id' is extracted from filename if not provided.
-    """
+def camera_id_for_source(video_source, camera_id=None):
+    """camera_id, or the one encoded in an uploaded file's name ("<camera_id>_<uuid>_<name>")."""
     # Extract camera ID from filename if it's a file path and camera_id not provided
     if camera_id is None and isinstance(video_source, str) and os.path.isfile(video_source):
         filename = os.path.basename(video_source)
         if '_' in filename:
             camera_id = filename.split('_')[0]
             print(f"[INFO] Extracted camera ID from filename: {camera_id}")
+    return camera_id
+
+def iter_processed_frames(video_source, camera_id=None):
+    """
+    Opens a video source, processes each frame, and yields the frame with detections drawn.
+    'video_source' can be a file path, a camera index (e.g., 0) or a pooled capture.
+    'camera_id' is extracted from filename if not provided.
+    Frames are decoded into one reused array, so a yielded frame is only valid until the
+    next one is requested; consumers that keep frames must copy them.
+    """
+    camera_id = camera_id_for_source(video_source, camera_id)
     
-    cap = cv2.VideoCapture(video_source)
+    if isinstance(video_source, int):
+        # Live devices are shared through the capture pool so /capture_frame doesn't fight the stream
+        cap = capture_pool.open_source(video_source)
+    elif hasattr(video_source, "read"):
+        cap = video_source
+    else:
+        cap = cv2.VideoCapture(video_source)
     if not cap.isOpened():
         print(f"[ERROR] Could not open video source: {video_source}")
         return
 
+    # Uploaded files with known content replay cached detections, or record them for next time
+    content_hash = content_store.hash_for(video_source) if isinstance(video_source, str) else None
+    cached = recorded = None
+    if content_hash:
+        model_ver = current_model_version()
+        cached = detection_cache.get("stream", content_hash, model_ver, STREAM_CACHE_SETTINGS)
+        if cached is not None:
+            print(f"[INFO] Replaying cached detections for {content_hash[:12]}")
+        else:
+            recorded = []
+
     try:
+        frame_idx = 0
+        frame = None
         while True:
-            ret, frame = cap.read()
+            ret, frame = cap.read(frame) if frame is not None else cap.read()
             if not ret:
                 print("[INFO] End of video stream.")
+                if recorded is not None:
+                    detection_cache.put("stream", content_hash, model_ver, STREAM_CACHE_SETTINGS, recorded)
                 break
             
-            # Run inference with camera ID context
-            processed_frame = infer_and_draw(frame, camera_id)
-            
-            # Encode frame as JPEG
-            ret, buffer = cv2.imencode(".jpg", processed_frame)
-            if not ret:
-                print("[WARN] Failed to encode frame.")
-                continue
-                
-            frame_bytes = buffer.tobytes()
-            # Yield the frame in the format required for multipart/x-mixed-replace
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+            if cached is not None:
+                detections = cached[frame_idx] if frame_idx < len(cached) else []
+                draw_detections(frame, detections)
+                best_detection = best_fire_detection(detections)
+                if best_detection:
+                    trigger_alert(frame, best_detection, camera_id)
+                yield frame
+            elif recorded is not None:
+                detections = infer_detections(frame, camera_id)
+                recorded.append(detections)
+                draw_detections(frame, detections)
+                yield frame
+            else:
+                # Run inference with camera ID context
+                yield infer_and_draw(frame, camera_id)
+            frame_idx += 1
     finally:
         cap.release()
         print(f"[INFO] Released video source: {video_source}")
@@ -205,9 +427,63 @@ def process_video_stream(video_source, camera_id=None):
             print(f"[CLEANUP] Failed to delete video file {video_source}: {e}")
 
 
+def stream_key(video_source, camera_id=None):
+    """Viewers with the same key share one producer."""
+    if hasattr(video_source, "handle"):
+        return f"camera:{camera_id}:{video_source.handle.source}"
+    if isinstance(video_source, int):
+        return f"device:{video_source}:{camera_id}"
+    return f"file:{os.path.abspath(video_source)}"
+
+def process_video_stream(video_source, camera_id=None, profile=None, adaptive=False):
+    """
+    Yields processed frames as multipart JPEG parts for one viewer.
+    Viewers of the same source share one inference loop, frames are encoded once per
+    distinct profile, and a viewer that can't keep up gets frames dropped.
+    """
+    if profile is None:
+        profile, adaptive = resolve_profile()
+    camera_id = camera_id_for_source(video_source, camera_id)
+    return stream_hub.stream(
+        stream_key(video_source, camera_id),
+        lambda: iter_processed_frames(video_source, camera_id),
+        profile,
+        adaptive,
+        camera_id=alert_camera_id(camera_id)
+    )
+
+
+def iter_camera_detections(camera_id, max_fps=0):
+    """
+    Runs detection on the camera's newest frames and yields metadata messages.
+    Nothing is drawn or JPEG-encoded; alerts are still triggered as in the MJPEG path.
+    """
+    cap = capture_pool.open_camera(camera_id)
+    min_interval = 1.0 / max_fps if max_fps and max_fps > 0 else 0.0
+    last_sent = 0.0
+    seq = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            print(f"[INFO] Detection stream for camera {camera_id} ended.")
+            break
+        if min_interval and time.time() - last_sent < min_interval:
+            continue
+        last_sent = time.time()
+        seq += 1
+        detections = infer_detections(frame, camera_id)
+        yield frame_message(camera_id, seq, cap.frame_time, frame.shape, detections)
+
+
 # ------------------------------
 # API Endpoints
 # ------------------------------
+def uploaded_video_path(video_name):
+    """Path of an uploaded video in TEMP_DIR; anything but a bare filename is rejected with 400."""
+    if not video_name or os.path.basename(video_name) != video_name or video_name in (".", ".."):
+        raise HTTPException(status_code=400, detail="Invalid video name")
+    return os.path.join(TEMP_DIR, video_name)
+
 @app.post("/upload_video")
 async def upload_video(video: UploadFile = File(...)):
     """
@@ -219,9 +495,13 @@ async def upload_video(video: UploadFile = File(...)):
     file_path = os.path.join(TEMP_DIR, unique_filename)
     
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(video.file, buffer)
-        return JSONResponse(content={"filename": unique_filename})
+        content_hash, stored_path, deduplicated = content_store.save_upload(video.file, video.filename)
+        content_store.link(content_hash, stored_path, file_path)
+        return JSONResponse(content={
+            "filename": unique_filename,
+            "contentHash": content_hash,
+            "deduplicated": deduplicated
+        })
     except Exception as e:
         return JSONResponse(content={"error": f"Failed to save file: {e}"}, status_code=500)
 
@@ -236,25 +516,84 @@ async def upload_video_for_camera(camera_id: str, video: UploadFile = File(...))
     file_path = os.path.join(TEMP_DIR, unique_filename)
     
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(video.file, buffer)
+        content_hash, stored_path, deduplicated = content_store.save_upload(video.file, video.filename)
+        content_store.link(content_hash, stored_path, file_path)
         
         # Store camera ID mapping for this video
         camera_video_mapping = {
             "filename": unique_filename,
             "camera_id": camera_id,
             "original_filename": video.filename,
-            "uploaded_at": None  # Will be set by backend if needed
+            "uploaded_at": None,  # Will be set by backend if needed
+            "contentHash": content_hash,
+            "deduplicated": deduplicated
         }
         
         return JSONResponse(content=camera_video_mapping)
     except Exception as e:
         return JSONResponse(content={"error": f"Failed to save file: {e}"}, status_code=500)
 
+@app.post("/analysis_jobs")
+def submit_analysis_job(
+    video_name: str = Form(...),
+    camera_id: str = Form(default=None),
+    stride: int = Form(default=5),
+    batch_size: int = Form(default=8),
+    workers: int = Form(default=0)
+):
+    """
+    Queues faster-than-real-time analysis of an uploaded video (the filename returned
+    by /upload_video). The file is kept; poll /analysis_jobs/{job_id} for progress.
+    """
+    video_path = uploaded_video_path(video_name)
+    if not os.path.exists(video_path):
+        return JSONResponse(content={"error": "Video not found"}, status_code=404)
+
+    params = {"camera_id": camera_id, "stride": stride, "batch_size": batch_size}
+    if workers > 0:
+        params["workers"] = workers
+    job = analysis_jobs.submit(video_path, **params)
+    return JSONResponse(content=job.status(), status_code=202)
+
+@app.get("/analysis_jobs")
+def list_analysis_jobs():
+    return JSONResponse(content={"jobs": analysis_jobs.all()})
+
+@app.get("/analysis_jobs/{job_id}")
+def get_analysis_job(job_id: str):
+    """Job state and progress (frames processed, frames/s, ETA)."""
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse(content=job.status())
+
+@app.get("/analysis_jobs/{job_id}/timeline")
+def get_analysis_timeline(job_id: str, format: str = "json"):
+    """Detection timeline of a finished job as JSON (with events) or CSV (one row per box)."""
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.state != "done":
+        return JSONResponse(content=job.status(), status_code=409)
+    if format == "csv":
+        return FileResponse(os.path.join(job.out_dir, "timeline.csv"), media_type="text/csv", filename=f"{job_id}.csv")
+    return FileResponse(os.path.join(job.out_dir, "timeline.json"), media_type="application/json")
+
+@app.get("/analysis_jobs/{job_id}/snapshots/{name}")
+def get_analysis_snapshot(job_id: str, name: str):
+    """Peak-frame snapshot of one event in a job's timeline."""
+    job = analysis_jobs.get(job_id)
+    snapshot_path = os.path.join(job.out_dir, os.path.basename(name)) if job else None
+    if not snapshot_path or not os.path.exists(snapshot_path):
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(snapshot_path, media_type="image/jpeg")
+
 @app.get("/video_feed/{video_name}")
-def video_feed(video_name: str):
+def video_feed(video_name: str, profile: str = None, max_width: int = 0, max_height: int = 0, quality: int = 0, max_fps: float = 0):
     """Streams a processed video file from the temporary directory."""
-    video_path = os.path.join(TEMP_DIR, video_name)
+    if not model_ready():
+        return model_not_ready_response()
+    video_path = uploaded_video_path(video_name)
     if not os.path.exists(video_path):
         return JSONResponse(content={"error": "Video not found"}, status_code=404)
     
@@ -267,12 +606,15 @@ def video_feed(video_name: str):
             camera_id = potential_camera_id
             print(f"[INFO] Extracted camera ID from filename: {camera_id}")
         
-    return StreamingResponse(process_video_stream(video_path, camera_id=camera_id), media_type="multipart/x-mixed-replace; boundary=frame")
+    stream_profile, adaptive = resolve_profile(profile, max_width, max_height, quality, max_fps)
+    return StreamingResponse(process_video_stream(video_path, camera_id=camera_id, profile=stream_profile, adaptive=adaptive), media_type="multipart/x-mixed-replace; boundary=frame")
 
 @app.get("/video_feed/{camera_id}/{video_name}")
-def video_feed_for_camera(camera_id: str, video_name: str):
+def video_feed_for_camera(camera_id: str, video_name: str, profile: str = None, max_width: int = 0, max_height: int = 0, quality: int = 0, max_fps: float = 0):
     """Streams a processed video file for a specific camera."""
-    video_path = os.path.join(TEMP_DIR, video_name)
+    if not model_ready():
+        return model_not_ready_response()
+    video_path = uploaded_video_path(video_name)
     if not os.path.exists(video_path):
         return JSONResponse(content={"error": "Video not found"}, status_code=404)
     
@@ -280,64 +622,209 @@ def video_feed_for_camera(camera_id: str, video_name: str):
     if not video_name.startswith(f"{camera_id}_"):
         return JSONResponse(content={"error": "Video does not belong to this camera"}, status_code=403)
         
-    return StreamingResponse(process_video_stream(video_path, camera_id), media_type="multipart/x-mixed-replace; boundary=frame")
+    stream_profile, adaptive = resolve_profile(profile, max_width, max_height, quality, max_fps)
+    return StreamingResponse(process_video_stream(video_path, camera_id, profile=stream_profile, adaptive=adaptive), media_type="multipart/x-mixed-replace; boundary=frame")
 
 @app.get("/webcam_feed")
-def webcam_feed():
+def webcam_feed(profile: str = None, max_width: int = 0, max_height: int = 0, quality: int = 0, max_fps: float = 0):
     """Streams processed video from the primary webcam (index 0)."""
-    return StreamingResponse(process_video_stream(0), media_type="multipart/x-mixed-replace; boundary=frame")
+    if not model_ready():
+        return model_not_ready_response()
+    stream_profile, adaptive = resolve_profile(profile, max_width, max_height, quality, max_fps)
+    return StreamingResponse(process_video_stream(0, profile=stream_profile, adaptive=adaptive), media_type="multipart/x-mixed-replace; boundary=frame")
 
 @app.get("/webcam_feed/{camera_id}")
-def webcam_feed_for_camera(camera_id: str):
-    """Streams processed video from the primary webcam (index 0) with a specific camera ID."""
-    return StreamingResponse(process_video_stream(0, camera_id=camera_id), media_type="multipart/x-mixed-replace; boundary=frame")
+def webcam_feed_for_camera(camera_id: str, profile: str = None, max_width: int = 0, max_height: int = 0, quality: int = 0, max_fps: float = 0):
+    """Streams processed video from the camera's registered source (webcam 0 if unregistered)."""
+    if not model_ready():
+        return model_not_ready_response()
+    stream_profile, adaptive = resolve_profile(profile, max_width, max_height, quality, max_fps)
+    return StreamingResponse(process_video_stream(capture_pool.open_camera(camera_id), camera_id=camera_id, profile=stream_profile, adaptive=adaptive), media_type="multipart/x-mixed-replace; boundary=frame")
+
+@app.get("/cascade")
+def cascade_status():
+    """Screener/detector cascade: pass-through rate and per-stage timing."""
+    if model_client is not None:
+        return JSONResponse(content={"enabled": cascade is not None, "servers": model_client.cascade_status()})
+    if cascade is None:
+        return JSONResponse(content={"enabled": False})
+    return JSONResponse(content={"enabled": True, "screener": screener_loader.status(), **cascade.status()})
+
+@app.get("/local_verifier")
+def local_verifier_status():
+    """Local pre-verification: cases checked, share settled without Gemini and timing."""
+    if model_client is not None:
+        return JSONResponse(content={"enabled": LOCAL_VERIFY, "servers": model_client.verifier_status()})
+    if local_verifier is None:
+        return JSONResponse(content={"enabled": False})
+    classifier = verifier_loader.status() if verifier_loader is not None else None
+    return JSONResponse(content={"enabled": True, "classifierModel": classifier, **local_verifier.status()})
+
+@app.get("/cpu_layout")
+def get_cpu_layout():
+    """Cores, worker split and thread counts used for inference, plus how often model calls had to wait."""
+    if model_client is not None:
+        return JSONResponse(content={"mode": "shared", "servers": [s.get("cpu") for s in model_client.status()["servers"]]})
+    return JSONResponse(content={"mode": "local", **inference_gate.status()})
+
+@app.get("/streams")
+def list_streams():
+    """Active MJPEG producers with per-viewer profile, frames sent and frames dropped."""
+    return JSONResponse(content=stream_hub.status())
+
+@app.get("/detections_feed/{camera_id}")
+def detections_feed(camera_id: str, max_fps: float = 0):
+    """
+    Server-Sent Events stream of per-frame detection metadata for a camera
+    (boxes, classes, confidences, capture timestamp). Clients draw the overlays
+    themselves; use /webcam_feed/{camera_id} when pixels are needed.
+    """
+    if not model_ready():
+        return model_not_ready_response()
+    events = (sse_event(msg) for msg in iter_camera_detections(camera_id, max_fps))
+    return StreamingResponse(events, media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.websocket("/ws/detections/{camera_id}")
+async def detections_socket(websocket: WebSocket, camera_id: str, fmt: str = Query("json", alias="format"), max_fps: float = 0):
+    """
+    WebSocket variant of /detections_feed. ?format=json sends one compact JSON
+    text message per frame; ?format=binary sends packed structs (see detection_stream.BinaryEncoder).
+    """
+    await websocket.accept()
+    if not model_ready():
+        await websocket.close(code=1013)  # try again later
+        return
+
+    messages = iter_camera_detections(camera_id, max_fps)
+    encoder = BinaryEncoder() if fmt == "binary" else None
+    try:
+        while True:
+            msg = await run_in_threadpool(next, messages, None)
+            if msg is None:
+                break
+            if encoder is None:
+                await websocket.send_text(to_json(msg))
+                continue
+            for out in encoder.encode(msg):
+                if isinstance(out, bytes):
+                    await websocket.send_bytes(out)
+                else:
+                    await websocket.send_text(out)
+    except WebSocketDisconnect:
+        print(f"[INFO] Detection socket for camera {camera_id} disconnected.")
+    finally:
+        messages.close()
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving HTTP, whether or not the model is loaded."""
+    return JSONResponse(content={"status": "ok"})
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: 200 once the model is loaded and warmed up, 503 before that or if loading failed."""
+    status = model_status()
+    return JSONResponse(content=status, status_code=200 if status["ready"] else 503)
 
 # Note: reset-cooldown and switch-to-false-alarm endpoints removed
 # Cooldown is now fully managed by Next.js via Firebase checkActiveAlert()
 
 @app.get("/snapshots/{image_id}")
 def get_snapshot(image_id: str):
-    """Serves saved detection images by their unique ID."""
+    """Serves saved detection images by their unique ID (from memory while the write is pending)."""
+    pending = snapshot_writer.get(image_id)
+    if pending is not None:
+        return Response(content=pending, media_type="image/jpeg")
+    
     snapshot_path = os.path.join(SNAPSHOT_DIR, image_id)
     
     if not os.path.exists(snapshot_path):
+        # in shared mode alert snapshots are staged by the inference process that raised the alert
+        pending = model_client.pending_snapshot(image_id) if model_client is not None else None
+        if pending is not None:
+            return Response(content=pending, media_type="image/jpeg")
         raise HTTPException(status_code=404, detail="Image not found")
     
     return FileResponse(snapshot_path, media_type="image/jpeg")
 
+@app.get("/snapshot_writer")
+def snapshot_writer_status():
+    """Snapshot write queue, staged (not yet written) images and batch timings."""
+    return JSONResponse(content=snapshot_writer.status())
+
+@app.get("/clips/{clip_id}")
+def get_clip(clip_id: str):
+    """Serves an incident clip by the clipId sent with its alert (available once the post-roll is written)."""
+    clip_path = clip_recorder.clip_path(os.path.basename(clip_id))
+    
+    if not os.path.exists(clip_path):
+        raise HTTPException(status_code=404, detail="Clip not found (it may still be recording)")
+    
+    return FileResponse(clip_path, media_type="video/mp4")
+
+@app.get("/clips")
+def clip_buffers():
+    """Clip buffer memory per camera, pending clips and clips written."""
+    return JSONResponse(content=clip_recorder.status())
+
+@app.get("/cameras")
+def list_cameras():
+    """Lists registered cameras and the state of the open capture handles."""
+    return JSONResponse(content={"cameras": camera_registry.all(), "captures": capture_pool.status()})
+
+@app.post("/cameras/{camera_id}")
+def register_camera(camera_id: str, source: str = Form(...)):
+    """
+    Maps a camera ID to a source: device index ("0") or RTSP / HTTP(S) URL
+    (video file paths only with CAMERA_ALLOW_FILE_SOURCES=1).
+    The mapping is persisted to CAMERA_REGISTRY_FILE.
+    """
+    try:
+        camera_registry.register(camera_id, source)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    print(f"[PYTHON] [Cameras] Registered camera {camera_id} -> {source}")
+    return JSONResponse(content={"cameraId": camera_id, "source": source})
+
+@app.delete("/cameras/{camera_id}")
+def unregister_camera(camera_id: str):
+    """Removes a camera mapping (the camera falls back to DEFAULT_CAMERA_SOURCE)."""
+    if camera_registry.unregister(camera_id) is None:
+        raise HTTPException(status_code=404, detail="Camera not registered")
+    return JSONResponse(content={"cameraId": camera_id, "removed": True})
+
 @app.post("/capture_frame/{camera_id}")
-async def capture_frame(camera_id: str):
+def capture_frame(camera_id: str):
     """
     Captures current frame from camera without triggering alerts.
     Used for periodic image updates during active alerts.
     Returns the imageId of the saved snapshot.
     """
     try:
-        # Get camera ID, or use default webcam (0) if camera_id not found
-        cap = cv2.VideoCapture(0)  # Using default webcam, can be enhanced to map camera_id to specific cameras
-        
-        ret, frame = cap.read()
-        cap.release()
+        # Latest frame from the camera's persistent capture handle (opened on first use)
+        frame, frame_time = capture_pool.latest(camera_id)
         
-        if not ret or frame is None:
+        if frame is None:
             return JSONResponse(
                 content={"error": "Failed to capture frame from camera"},
                 status_code=500
             )
         
         # Save the frame without running inference (no alert trigger)
-        image_id = f"{uuid.uuid4()}.jpg"
-        snapshot_path = os.path.join(SNAPSHOT_DIR, image_id)
-        success = cv2.imwrite(snapshot_path, frame)
+        image_id, _ = save_snapshot(frame)
         
-        if not success:
+        if not image_id:
             return JSONResponse(
                 content={"error": "Failed to save snapshot"},
                 status_code=500
             )
         
         print(f"[PYTHON] [Capture Frame] Saved snapshot for camera {camera_id}: {image_id}")
-        return JSONResponse(content={"imageId": image_id, "cameraId": camera_id})
+        return JSONResponse(content={
+            "imageId": image_id,
+            "cameraId": camera_id,
+            "frameAgeMs": int((time.time() - frame_time) * 1000)
+        })
         
     except Exception as e:
         print(f"[PYTHON] [Capture Frame] Error: {e}")
@@ -354,6 +841,11 @@ async def get_latest_snapshot(camera_id: str):
     Used for periodic image updates during active alerts.
     """
     try:
+        # Snapshots still being written are newer than anything on disk
+        pending_id = snapshot_writer.newest_pending()
+        if pending_id:
+            return JSONResponse(content={"imageId": pending_id, "cameraId": camera_id})
+        
         if not os.path.exists(SNAPSHOT_DIR):
             return JSONResponse(
                 content={"error": "Snapshot directory not found", "imageId": None},
@@ -397,6 +889,9 @@ async def analyze_and_save_frame(
     If fire/smoke is detected above threshold, saves the image and returns detection.
     Gemini verification is handled by Next.js backend.
     """
+    if not model_ready():
+        return model_not_ready_response()
+
     try:
         contents = await file.read()
         nparr = np.frombuffer(contents, np.uint8)
@@ -410,46 +905,44 @@ async def analyze_and_save_frame(
         print("\n[PYTHON] ---------------- NEW FRAME ----------------")
         print("[PYTHON] ✅ Frame received. Running YOLO model...")
         
-        results = model(frame, imgsz=640, verbose=False)
+        if local_verifier is not None:
+            local_verifier.observe(alert_camera_id(camera_id), frame)
+        
+        # off the event loop: in shared mode this is a round trip to a model server
+        detections = await run_in_threadpool(detect_objects, frame, camera_id)
         
         best_detection = None
         
         # Log all detections
         found_anything = False
-        for r in results:
-            for box in r.boxes:
-                conf = float(box.conf[0].item())
-                cls_id = int(box.cls[0].item())
-                class_name = model.names[cls_id]
-                
-                print(f"[PYTHON]   - Found: {class_name} (Confidence: {conf:.2f})")
-                found_anything = True
-                
-                # Check if it's fire/smoke above threshold
-                if class_name in ['fire', 'smoke'] and conf > 0.75:
-                    if best_detection is None or conf > best_detection["confidence"]:
-                        best_detection = {
-                            "class": class_name,
-                            "confidence": conf,
-                            "bbox": box.xyxy[0].tolist()
-                        }
+        for det in detections:
+            conf = det["confidence"]
+            class_name = det["class"]
+            
+            print(f"[PYTHON]   - Found: {class_name} (Confidence: {conf:.2f})")
+            found_anything = True
+            
+            # Check if it's fire/smoke above threshold
+            if class_name in ['fire', 'smoke'] and conf > 0.75:
+                if best_detection is None or conf > best_detection["confidence"]:
+                    best_detection = det
         
         if not found_anything:
             print("[PYTHON]   - Model found no objects in this frame.")
         
         if best_detection:
-            # Fire detected by YOLO - save image and encode as base64
-            image_id = f"{uuid.uuid4()}.jpg"
-            snapshot_path = os.path.join(SNAPSHOT_DIR, image_id)
+            # Fire detected by YOLO - queue the image for saving and encode as base64
+            image_id, jpeg = save_snapshot(frame)
+            if not image_id:
+                print(f"[PYTHON] ❌ Error: Failed to save snapshot.")
+                return JSONResponse(content={"error": "Failed to save snapshot."}, status_code=500)
             
             # Encode frame as base64 for Firebase storage
-            _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-            image_base64 = base64.b64encode(buffer).decode('utf-8')
+            image_base64 = base64.b64encode(jpeg).decode('utf-8')
             
-            success = cv2.imwrite(snapshot_path, frame)
-            if not success:
-                print(f"[PYTHON] ❌ Error: Failed to save snapshot.")
-                return JSONResponse(content={"error": "Failed to save snapshot."}, status_code=500)
+            # Settles clear cases locally; the rest still need Gemini
+            local_check = local_verifier.verify(frame, best_detection, alert_camera_id(camera_id)) if local_verifier is not None else None
+            local_check = sign_local_check(local_check, image_id)
             
             print(f"[PYTHON] 🔥 YOLO detected {best_detection['class']} ({best_detection['confidence']:.2f}). Image saved: {image_id} (base64 size: {len(image_base64)} chars)")
             print("[PYTHON] ➡️ Sending to Next.js for Gemini verification...")
@@ -457,7 +950,8 @@ async def analyze_and_save_frame(
             return JSONResponse(content={
                 "detection": best_detection,
                 "imageId": image_id,
-                "imageBase64": image_base64
+                "imageBase64": image_base64,
+                "localCheck": local_check
             })
         else:
             # No fire detected
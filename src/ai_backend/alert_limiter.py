@@ -0,0 +1,193 @@
+"""
+Alert rate limiting for the AgniShakti AI service.
+
+Alerts are limited per (camera, class) with a token bucket: each key may send
+ALERT_BURST alerts back to back, then one more every ALERT_THROTTLE_SECONDS.
+Buckets that have been idle long enough to be full again are evicted, and the
+number of tracked keys is capped, so memory stays bounded as cameras come and go.
+
+By default buckets live in process memory. Set ALERT_LIMITER_DB to a SQLite
+file to share them between processes (uvicorn workers, model_server.py
+inference processes) so a multi-worker deployment throttles as one.
+"""
+
+import os
+import abc
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# ------------------------------
+# Config
+# ------------------------------
+ALERT_THROTTLE_SECONDS = float(os.getenv("ALERT_THROTTLE_SECONDS", "5"))   # one token per interval
+ALERT_BURST = int(os.getenv("ALERT_BURST", "1"))                           # bucket capacity
+ALERT_LIMITER_MAX_KEYS = int(os.getenv("ALERT_LIMITER_MAX_KEYS", "4096"))
+ALERT_LIMITER_IDLE_SECONDS = float(os.getenv("ALERT_LIMITER_IDLE_SECONDS", "600"))
+ALERT_LIMITER_DB = os.getenv("ALERT_LIMITER_DB", "")                        # "" keeps buckets in memory
+EVICT_EVERY = 256   # calls between idle sweeps
+
+
+def _refill(tokens, updated, now, interval, burst):
+    """Tokens in a bucket last seen at 'updated' with 'tokens', as of 'now'."""
+    if interval <= 0:
+        return float(burst)
+    return min(float(burst), tokens + max(0.0, now - updated) / interval)
+
+
+class _BaseLimiter(abc.ABC):
+    def __init__(self, interval=ALERT_THROTTLE_SECONDS, burst=ALERT_BURST,
+                 max_keys=ALERT_LIMITER_MAX_KEYS, idle_seconds=ALERT_LIMITER_IDLE_SECONDS):
+        self.interval = interval
+        self.burst = max(1, burst)
+        self.max_keys = max_keys
+        # a bucket idle for this long is full again, so forgetting it changes nothing
+        self.idle_seconds = max(idle_seconds, self.interval * self.burst)
+        self.allowed = 0
+        self.throttled = 0
+        self._calls = 0
+        self._stats_lock = threading.Lock()   # allow() runs on many threads at once
+
+    @staticmethod
+    def key(camera_id, class_name=None):
+        return f"{camera_id}|{class_name or '*'}"
+
+    def allow(self, camera_id, class_name=None, now=None):
+        """Takes a token for (camera_id, class_name). Returns False when the alert should be skipped."""
+        now = time.time() if now is None else now
+        ok = self._take(self.key(camera_id, class_name), now)
+        with self._stats_lock:
+            if ok:
+                self.allowed += 1
+            else:
+                self.throttled += 1
+        return ok
+
+    @abc.abstractmethod
+    def _take(self, key, now):
+        """Takes a token from the bucket 'key' if it has one as of 'now'. Returns whether it did."""
+
+    @abc.abstractmethod
+    def size(self):
+        """Number of buckets currently tracked."""
+
+    def stats(self):
+        """Alerts allowed and throttled by this process (shown in /readyz) and the buckets tracked."""
+        keys = self.size()
+        with self._stats_lock:
+            return {
+                "backend": self.backend,
+                "interval_s": self.interval,
+                "burst": self.burst,
+                "keys": keys,
+                "allowed": self.allowed,
+                "throttled": self.throttled,
+            }
+
+
+class MemoryRateLimiter(_BaseLimiter):
+    """Per-process buckets in an LRU-ordered dict."""
+
+    backend = "memory"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()   # key -> (tokens, updated)
+
+    def _take(self, key, now):
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (float(self.burst), now))
+            tokens = _refill(tokens, updated, now, self.interval, self.burst)
+            ok = tokens >= 1.0
+            self._buckets[key] = (tokens - 1.0 if ok else tokens, now)
+
+            self._calls += 1
+            if self._calls % EVICT_EVERY == 0:
+                self._evict_idle(now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return ok
+
+    def _evict_idle(self, now):
+        # keys are in least-recently-used order, so stop at the first recent one
+        while self._buckets:
+            key, (_, updated) = next(iter(self._buckets.items()))
+            if now - updated < self.idle_seconds:
+                break
+            del self._buckets[key]
+
+    def size(self):
+        with self._lock:
+            return len(self._buckets)
+
+
+class SqliteRateLimiter(_BaseLimiter):
+    """Buckets in a SQLite table; BEGIN IMMEDIATE makes each take atomic across processes."""
+
+    backend = "sqlite"
+
+    def __init__(self, path=ALERT_LIMITER_DB, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS alert_buckets "
+                "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS alert_buckets_updated ON alert_buckets (updated)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _take(self, key, now):
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT tokens, updated FROM alert_buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (float(self.burst), now)
+            tokens = _refill(tokens, updated, now, self.interval, self.burst)
+            ok = tokens >= 1.0
+            conn.execute(
+                "INSERT OR REPLACE INTO alert_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                (key, tokens - 1.0 if ok else tokens, now),
+            )
+            with self._stats_lock:
+                self._calls += 1
+                sweep = self._calls % EVICT_EVERY == 0
+            if sweep:
+                conn.execute("DELETE FROM alert_buckets WHERE updated < ?", (now - self.idle_seconds,))
+                conn.execute(
+                    "DELETE FROM alert_buckets WHERE key NOT IN "
+                    "(SELECT key FROM alert_buckets ORDER BY updated DESC LIMIT ?)",
+                    (self.max_keys,),
+                )
+            conn.execute("COMMIT")
+            return ok
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            # fail open: a missed throttle is better than a missed fire alert
+            print(f"[ALERT] ⚠️ Rate limiter store unavailable ({e}), allowing alert")
+            return True
+
+    def size(self):
+        try:
+            return self._conn().execute("SELECT COUNT(*) FROM alert_buckets").fetchone()[0]
+        except sqlite3.Error:
+            return None
+
+
+def make_rate_limiter(db_path=ALERT_LIMITER_DB):
+    """SQLite-backed limiter when a path is configured, in-memory otherwise."""
+    if db_path:
+        return SqliteRateLimiter(db_path)
+    return MemoryRateLimiter()
@@ -0,0 +1,299 @@
+"""
+Camera registry and persistent capture pool for the AgniShakti AI service.
+
+The registry maps camera IDs to sources (device index, video file or RTSP URL).
+The pool keeps one capture thread per source that always holds the latest
+frame, so /capture_frame answers from memory and webcam streams share the
+device instead of fighting over it.
+
+Sources registered over HTTP are limited to device indexes and rtsp/http(s)
+URLs; anything else OpenCV would open (local files, capture-backend pipeline
+strings) needs CAMERA_ALLOW_FILE_SOURCES=1. Entries from CAMERA_SOURCES and
+the registry file are operator configuration and are not checked.
+"""
+
+import os
+import json
+import time
+import threading
+from urllib.parse import urlsplit
+
+import cv2
+import numpy as np
+
+# ------------------------------
+# Config
+# ------------------------------
+CAMERA_REGISTRY_FILE = os.getenv("CAMERA_REGISTRY_FILE", "cameras.json")
+# Source used for camera IDs that aren't registered (the old behaviour was always webcam 0)
+DEFAULT_CAMERA_SOURCE = os.getenv("DEFAULT_CAMERA_SOURCE", "0")
+# Capture threads that nobody has read from for this long release their device
+CAPTURE_IDLE_SECONDS = float(os.getenv("CAPTURE_IDLE_SECONDS", "120"))
+CAPTURE_RECONNECT_SECONDS = 2.0
+CAPTURE_OPEN_TIMEOUT = 10.0
+CAPTURE_MAX_REWIND_FAILURES = 3   # a file that can't be read after this many rewinds in a row is given up
+CAMERA_URL_SCHEMES = ("rtsp", "rtsps", "http", "https")
+CAMERA_ALLOW_FILE_SOURCES = os.getenv("CAMERA_ALLOW_FILE_SOURCES", "0") == "1"
+
+
+def parse_source(source):
+    """"0" -> 0 (device index); anything else stays a path / URL."""
+    if isinstance(source, int):
+        return source
+    source = str(source).strip()
+    return int(source) if source.isdigit() else source
+
+def validate_source(source, allow_files=None):
+    """
+    Raises ValueError unless 'source' is a device index or an rtsp/http(s) URL with a host.
+    Other sources are accepted only with allow_files (default CAMERA_ALLOW_FILE_SOURCES).
+    """
+    allow_files = CAMERA_ALLOW_FILE_SOURCES if allow_files is None else allow_files
+    parsed = parse_source(source)
+    if isinstance(parsed, int) or allow_files:
+        return parsed
+    url = urlsplit(parsed)
+    if url.scheme.lower() in CAMERA_URL_SCHEMES and url.hostname:
+        return parsed
+    raise ValueError(f"Unsupported camera source {parsed!r}: use a device index or a "
+                     f"{'/'.join(CAMERA_URL_SCHEMES)} URL (files need CAMERA_ALLOW_FILE_SOURCES=1)")
+
+# ------------------------------
+# Registry
+# ------------------------------
+class CameraRegistry:
+    """camera_id -> source, persisted as JSON. CAMERA_SOURCES="cam1=0,cam2=rtsp://..." adds env entries."""
+
+    def __init__(self, path=CAMERA_REGISTRY_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._sources = {}
+        if path and os.path.exists(path):
+            with open(path, "r") as f:
+                self._sources.update(json.load(f))
+        for item in os.getenv("CAMERA_SOURCES", "").split(","):
+            camera_id, sep, source = item.partition("=")
+            if sep and camera_id.strip():
+                self._sources[camera_id.strip()] = source.strip()
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._sources, f, indent=2)
+        os.replace(tmp, self.path)
+
+    def register(self, camera_id, source):
+        """Maps camera_id to 'source'. Raises ValueError for sources validate_source() rejects."""
+        validate_source(source)
+        with self._lock:
+            self._sources[camera_id] = str(source)
+            self._save()
+
+    def unregister(self, camera_id):
+        with self._lock:
+            removed = self._sources.pop(camera_id, None)
+            self._save()
+            return removed
+
+    def source_for(self, camera_id):
+        """Registered source for camera_id, or DEFAULT_CAMERA_SOURCE."""
+        with self._lock:
+            source = self._sources.get(camera_id, DEFAULT_CAMERA_SOURCE)
+        return parse_source(source)
+
+    def is_registered(self, camera_id):
+        with self._lock:
+            return camera_id in self._sources
+
+    def all(self):
+        with self._lock:
+            return dict(self._sources)
+
+# ------------------------------
+# Capture pool
+# ------------------------------
+class CaptureHandle:
+    """Reads one source continuously on a background thread and keeps the latest frame."""
+
+    def __init__(self, source, idle_seconds=CAPTURE_IDLE_SECONDS):
+        self.source = source
+        self.idle_seconds = idle_seconds
+        self.frame = None
+        self.frame_time = 0.0
+        self.seq = 0
+        self.error = None
+        self.last_access = time.time()
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"capture-{source}", daemon=True)
+
+    @property
+    def alive(self):
+        return self._thread.is_alive() and not self._stop.is_set()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _open(self):
+        cap = cv2.VideoCapture(self.source)
+        if not cap.isOpened():
+            cap.release()
+            return None
+        return cap
+
+    def _run(self):
+        is_file = isinstance(self.source, str) and os.path.isfile(self.source)
+        cap = None
+        rewinds = 0   # rewinds in a row without reading a frame
+        try:
+            while not self._stop.is_set():
+                if time.time() - self.last_access > self.idle_seconds:
+                    print(f"[CAPTURE] Releasing idle source: {self.source}")
+                    break
+
+                if cap is None:
+                    cap = self._open()
+                    if cap is None:
+                        self.error = f"Could not open source: {self.source}"
+                        print(f"[CAPTURE] {self.error}, retrying in {CAPTURE_RECONNECT_SECONDS}s")
+                        self._stop.wait(CAPTURE_RECONNECT_SECONDS)
+                        continue
+                    self.error = None
+                    fps = cap.get(cv2.CAP_PROP_FPS) or 0
+                    frame_interval = 1.0 / fps if is_file and fps > 0 else 0.0
+                    print(f"[CAPTURE] Opened source: {self.source}")
+
+                ret, frame = cap.read()
+                if not ret or frame is None:
+                    if is_file:
+                        rewinds += 1
+                        if rewinds > CAPTURE_MAX_REWIND_FAILURES:
+                            # empty or undecodable file: rewinding again would spin forever
+                            self.error = f"No readable frames in {self.source}"
+                            print(f"[CAPTURE] {self.error}, giving up")
+                            break
+                        # loop files so they behave like a live camera
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        continue
+                    print(f"[CAPTURE] Lost source: {self.source}, reconnecting")
+                    cap.release()
+                    cap = None
+                    continue
+
+                rewinds = 0
+                with self._cond:
+                    self.frame = frame
+                    self.frame_time = time.time()
+                    self.seq += 1
+                    self._cond.notify_all()
+
+                if frame_interval:
+                    # pace files at their native rate instead of decoding as fast as possible
+                    self._stop.wait(frame_interval)
+        finally:
+            if cap is not None:
+                cap.release()
+            self._stop.set()
+            with self._cond:
+                self._cond.notify_all()
+
+    def latest(self, timeout=CAPTURE_OPEN_TIMEOUT):
+        """Latest frame and its capture time, waiting for the first frame if needed. Don't modify the frame."""
+        self.last_access = time.time()
+        with self._cond:
+            self._cond.wait_for(lambda: self.seq > 0 or self._stop.is_set(), timeout)
+            return self.frame, self.frame_time
+
+    def next_frame(self, last_seq, timeout=CAPTURE_OPEN_TIMEOUT):
+        """
+        Blocks until a frame newer than last_seq arrives.
+        Returns (frame, seq, capture_time); frame is None on timeout/stop.
+        """
+        self.last_access = time.time()
+        with self._cond:
+            got = self._cond.wait_for(lambda: self.seq > last_seq or self._stop.is_set(), timeout)
+            if not got or self.seq <= last_seq:
+                return None, last_seq, 0.0
+            return self.frame, self.seq, self.frame_time
+
+    def status(self):
+        return {
+            "source": str(self.source),
+            "alive": self.alive,
+            "frames": self.seq,
+            "frame_age_s": round(time.time() - self.frame_time, 3) if self.frame_time else None,
+            "error": self.error,
+        }
+
+
+class PooledCapture:
+    """
+    cv2.VideoCapture look-alike over a shared CaptureHandle (each read returns a private copy).
+    Like cv2, read(image) copies into 'image' when it has the frame's shape instead of allocating.
+    """
+
+    def __init__(self, handle):
+        self.handle = handle
+        self._seq = 0
+        self.frame_time = 0.0   # capture time of the frame last returned by read()
+
+    def isOpened(self):
+        return self.handle.alive
+
+    def read(self, image=None):
+        frame, self._seq, frame_time = self.handle.next_frame(self._seq)
+        if frame is None:
+            return False, None
+        self.frame_time = frame_time
+        if image is not None and image.shape == frame.shape and image.dtype == frame.dtype:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame.copy()
+
+    def release(self):
+        # the device stays with the pool; it is released once idle
+        pass
+
+
+class CapturePool:
+    """One CaptureHandle per source, started on first use and restarted if it went idle."""
+
+    def __init__(self, registry):
+        self.registry = registry
+        self._handles = {}
+        self._lock = threading.Lock()
+
+    def handle(self, source):
+        source = parse_source(source)
+        with self._lock:
+            handle = self._handles.get(source)
+            if handle is None or not handle.alive:
+                handle = CaptureHandle(source)
+                handle.start()
+                self._handles[source] = handle
+            return handle
+
+    def latest(self, camera_id, timeout=CAPTURE_OPEN_TIMEOUT):
+        """Latest (frame, capture_time) for camera_id; frame is None if the source has no frame yet."""
+        return self.handle(self.registry.source_for(camera_id)).latest(timeout)
+
+    def open_source(self, source):
+        return PooledCapture(self.handle(source))
+
+    def open_camera(self, camera_id):
+        return self.open_source(self.registry.source_for(camera_id))
+
+    def status(self):
+        with self._lock:
+            return {str(source): h.status() for source, h in self._handles.items()}
+
+    def close(self):
+        with self._lock:
+            for handle in self._handles.values():
+                handle.stop()
+            self._handles.clear()
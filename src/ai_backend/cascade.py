@@ -0,0 +1,177 @@
+"""
+Two-stage cascade inference: a small, low-resolution screener model runs on
+every frame and the full detector only runs where the screener sees fire or
+smoke candidates above a deliberately low threshold.
+
+The full detector still runs on every CASCADE_KEYFRAME_INTERVAL-th frame of a
+stream regardless of the screener, so a screener miss delays a detection by at
+most that many frames. Per-stage timing and the pass-through rate are tracked
+to show the throughput gained.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# ------------------------------
+# Config
+# ------------------------------
+SCREENER_MODEL_PATH = os.getenv("SCREENER_MODEL_PATH", "")      # "" disables the cascade
+SCREENER_IMGSZ = int(os.getenv("SCREENER_IMGSZ", "320"))
+SCREENER_CONFIDENCE = float(os.getenv("SCREENER_CONFIDENCE", "0.15"))
+SCREENER_CLASSES = [c.strip() for c in os.getenv("SCREENER_CLASSES", "fire,smoke").split(",") if c.strip()]
+# "1": run the detector on padded crops around candidates instead of the whole frame
+CASCADE_REGIONS = os.getenv("CASCADE_REGIONS", "0") == "1"
+CASCADE_KEYFRAME_INTERVAL = int(os.getenv("CASCADE_KEYFRAME_INTERVAL", "30"))   # 0 = never force
+REGION_PADDING = 0.5          # grow candidate boxes by this fraction of their size on each side
+REGION_MAX_COVERAGE = 0.5     # crops covering more of the frame than this run as one full frame
+MAX_TRACKED_STREAMS = 1024
+
+
+def candidate_regions(candidates, shape, padding=REGION_PADDING):
+    """
+    Padded, merged [x1, y1, x2, y2] crops around candidate detections, or None when
+    they cover enough of the frame that one full-frame pass is cheaper.
+    """
+    h, w = shape[:2]
+    regions = []
+    for det in candidates:
+        x1, y1, x2, y2 = det["bbox"]
+        pw, ph = (x2 - x1) * padding, (y2 - y1) * padding
+        regions.append([max(0, int(x1 - pw)), max(0, int(y1 - ph)), min(w, int(x2 + pw)), min(h, int(y2 + ph))])
+
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                a, b = regions[i], regions[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    regions[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
+                break
+
+    area = sum((r[2] - r[0]) * (r[3] - r[1]) for r in regions)
+    if area > REGION_MAX_COVERAGE * w * h:
+        return None
+    return regions
+
+
+class CascadeStats:
+    """Thread-safe per-stage counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.frames = 0
+        self.passed = 0          # frames the screener sent to the detector
+        self.keyframes = 0       # frames sent to the detector only because a keyframe was due
+        self.regions = 0         # detector runs on crops
+        self.detector_runs = 0
+        self.screener_time = 0.0
+        self.detector_time = 0.0
+
+    def record(self, screener_time, detector_time, passed, keyframe, detector_runs, regions):
+        with self._lock:
+            self.frames += 1
+            self.passed += int(passed)
+            self.keyframes += int(keyframe and not passed)
+            self.regions += regions
+            self.detector_runs += detector_runs
+            self.screener_time += screener_time
+            self.detector_time += detector_time
+
+    def status(self):
+        with self._lock:
+            frames = max(1, self.frames)
+            screener_ms = 1000 * self.screener_time / frames
+            detector_ms = 1000 * self.detector_time / max(1, self.detector_runs)
+            per_frame_ms = 1000 * (self.screener_time + self.detector_time) / frames
+            return {
+                "frames": self.frames,
+                "pass_through_rate": round(self.passed / frames, 4),
+                "keyframe_rate": round(self.keyframes / frames, 4),
+                "detector_runs": self.detector_runs,
+                "region_runs": self.regions,
+                "screener_ms": round(screener_ms, 2),
+                "detector_ms": round(detector_ms, 2),
+                "per_frame_ms": round(per_frame_ms, 2),
+                # vs running the detector on every frame, using the measured detector cost
+                "speedup": round(detector_ms / per_frame_ms, 2) if self.detector_runs and per_frame_ms else None,
+            }
+
+
+class CascadeDetector:
+    """
+    screen(frame) and detect(frame) both return [{"class", "confidence", "bbox": [x1, y1, x2, y2]}, ...];
+    "class" must be a class name for screen(), detect() may use any label.
+    """
+
+    def __init__(self, screen, detect, classes=SCREENER_CLASSES, confidence=SCREENER_CONFIDENCE,
+                 regions=CASCADE_REGIONS, keyframe_interval=CASCADE_KEYFRAME_INTERVAL):
+        self.screen = screen
+        self.detect = detect
+        self.classes = set(classes)
+        self.confidence = confidence
+        self.regions = regions
+        self.keyframe_interval = keyframe_interval
+        self.stats = CascadeStats()
+        self._lock = threading.Lock()
+        self._since_full = OrderedDict()   # stream key -> frames since the detector last ran
+
+    def _keyframe_due(self, key):
+        if not self.keyframe_interval:
+            return False
+        with self._lock:
+            count = self._since_full.pop(key, self.keyframe_interval - 1) + 1
+            self._since_full[key] = count
+            while len(self._since_full) > MAX_TRACKED_STREAMS:
+                self._since_full.popitem(last=False)
+            return count >= self.keyframe_interval
+
+    def _ran_detector(self, key):
+        with self._lock:
+            if key in self._since_full:
+                self._since_full[key] = 0
+
+    def run(self, frame, key=None):
+        """Screens 'frame' and returns the detector's detections, or [] when the screener found nothing."""
+        t0 = time.time()
+        candidates = [
+            d for d in self.screen(frame)
+            if d["class"] in self.classes and d["confidence"] >= self.confidence
+        ]
+        t1 = time.time()
+        passed = bool(candidates)
+        keyframe = self._keyframe_due(key)
+
+        detections = []
+        runs = 0
+        region_runs = 0
+        if passed or keyframe:
+            self._ran_detector(key)
+            regions = candidate_regions(candidates, frame.shape) if self.regions and passed and not keyframe else None
+            if regions:
+                for x1, y1, x2, y2 in regions:
+                    for det in self.detect(frame[y1:y2, x1:x2]):
+                        bx1, by1, bx2, by2 = det["bbox"]
+                        det["bbox"] = [bx1 + x1, by1 + y1, bx2 + x1, by2 + y1]
+                        detections.append(det)
+                runs = region_runs = len(regions)
+            else:
+                detections = self.detect(frame)
+                runs = 1
+        self.stats.record(t1 - t0, time.time() - t1, passed, keyframe, runs, region_runs)
+        return detections
+
+    def status(self):
+        return {
+            "classes": sorted(self.classes),
+            "confidence": self.confidence,
+            "regions": self.regions,
+            "keyframe_interval": self.keyframe_interval,
+            **self.stats.status(),
+        }
@@ -0,0 +1,244 @@
+"""
+Pre-event ring buffers and incident clip recording.
+
+MJPEG producers hand the JPEGs they already encoded for viewers to a
+per-camera ring buffer (a few frames per second, CLIP_PRE_SECONDS +
+CLIP_POST_SECONDS deep). When an alert fires, the recorder waits for the
+post-roll to arrive and then writes the buffered frames around the alert time
+to CLIP_DIR/<clip_id>.mp4 on a background thread. The memory of all buffers
+together is capped at CLIP_BUFFER_MAX_MB; the largest buffer gives up its
+oldest frames first.
+
+Clips are H.264 (CLIP_FOURCC, default avc1) so browsers can play them. OpenCV
+builds without an H.264 encoder fall back to MPEG-4 Part 2 (mp4v) with a
+warning; those clips download fine but most browsers won't play them inline.
+"""
+
+import os
+import time
+import uuid
+import heapq
+import threading
+from collections import deque
+
+import cv2
+import numpy as np
+
+# ------------------------------
+# Config
+# ------------------------------
+CLIP_DIR = os.getenv("CLIP_DIR", "incident_clips")
+CLIP_PRE_SECONDS = float(os.getenv("CLIP_PRE_SECONDS", "5"))
+CLIP_POST_SECONDS = float(os.getenv("CLIP_POST_SECONDS", "5"))
+CLIP_FPS = float(os.getenv("CLIP_FPS", "10"))                            # frames buffered per second
+CLIP_BUFFER_MAX_BYTES = int(float(os.getenv("CLIP_BUFFER_MAX_MB", "64")) * 1024 * 1024)   # all cameras together
+CLIP_BUFFER_IDLE_SECONDS = 60.0   # buffers that haven't been fed for this long are dropped
+CLIP_FOURCC = os.getenv("CLIP_FOURCC", "avc1")
+FALLBACK_FOURCC = "mp4v"
+
+_fallback_warned = False
+
+
+def _open_writer(path, fps, size):
+    """VideoWriter for CLIP_FOURCC, or for mp4v when this OpenCV build can't encode it."""
+    global _fallback_warned
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*CLIP_FOURCC), fps, size)
+    if writer.isOpened() or CLIP_FOURCC == FALLBACK_FOURCC:
+        return writer
+    writer.release()
+    if not _fallback_warned:
+        _fallback_warned = True
+        print(f"[CLIP] ⚠️ OpenCV can't encode {CLIP_FOURCC} here; writing {FALLBACK_FOURCC} clips "
+              f"(most browsers won't play them inline)")
+    return cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*FALLBACK_FOURCC), fps, size)
+
+
+class FrameRing:
+    """(timestamp, jpeg) pairs for one camera, oldest first, limited to 'horizon' seconds."""
+
+    def __init__(self, horizon):
+        self.horizon = horizon
+        self.frames = deque()
+        self.bytes = 0
+        self.last_add = 0.0
+
+    def append(self, ts, jpeg):
+        self.frames.append((ts, jpeg))
+        self.bytes += len(jpeg)
+        self.last_add = ts
+        while self.frames and ts - self.frames[0][0] > self.horizon:
+            self.pop_oldest()
+
+    def pop_oldest(self):
+        _, jpeg = self.frames.popleft()
+        self.bytes -= len(jpeg)
+        return len(jpeg)
+
+    def between(self, t0, t1):
+        return [(ts, jpeg) for ts, jpeg in self.frames if t0 <= ts <= t1]
+
+
+def write_clip(path, frames, fps=CLIP_FPS):
+    """Decodes buffered JPEGs and writes them as an MP4 (frames are scaled to the first frame's size)."""
+    writer = None
+    size = None
+    written = 0
+    tmp = f"{path}.part.mp4"
+    try:
+        for _, jpeg in frames:
+            img = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                continue
+            if writer is None:
+                size = (img.shape[1], img.shape[0])
+                writer = _open_writer(tmp, fps, size)
+            elif (img.shape[1], img.shape[0]) != size:
+                img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+            writer.write(img)
+            written += 1
+    finally:
+        if writer is not None:
+            writer.release()
+    if written:
+        os.replace(tmp, path)
+    elif os.path.exists(tmp):
+        os.remove(tmp)
+    return written
+
+
+class ClipRecorder:
+    """Per-camera frame rings plus a background thread that turns alerts into clips."""
+
+    def __init__(self, clip_dir=CLIP_DIR, pre_seconds=CLIP_PRE_SECONDS, post_seconds=CLIP_POST_SECONDS,
+                 fps=CLIP_FPS, max_bytes=CLIP_BUFFER_MAX_BYTES):
+        self.clip_dir = clip_dir
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.fps = fps
+        self.max_bytes = max_bytes
+        # Set in model_server.py inference processes: they raise alerts but hold no frames,
+        # so they only hand out clip IDs and the HTTP worker streaming the camera records.
+        self.remote = False
+        self._issued = []         # (camera_id, clip_id, alert_time) handed out in remote mode, not yet reported
+        self._remote_rings = {}   # camera_id -> (worker reported buffered frames, time of the report)
+        self.clips_written = 0
+        os.makedirs(clip_dir, exist_ok=True)
+
+        self._rings = {}          # camera_id -> FrameRing
+        self._bytes = 0
+        self._pending = []        # heap of (deadline, clip_id, camera_id, alert_time)
+        self._lock = threading.Condition()
+        self._thread = None
+
+    # -------- buffering (called by MJPEG producers) --------
+    def wants_frame(self, camera_id, now):
+        """True when the camera's buffer is due for another frame (buffers run at CLIP_FPS)."""
+        if self.max_bytes <= 0:
+            return False
+        with self._lock:
+            ring = self._rings.get(camera_id)
+            return ring is None or not self.fps or now - ring.last_add >= 1.0 / self.fps
+
+    def add(self, camera_id, jpeg, now):
+        with self._lock:
+            ring = self._rings.get(camera_id)
+            if ring is None:
+                ring = self._rings[camera_id] = FrameRing(self.pre_seconds + self.post_seconds + 1.0)
+            before = ring.bytes
+            ring.append(now, jpeg)
+            self._bytes += ring.bytes - before
+            self._enforce_cap(now)
+
+    def _enforce_cap(self, now):
+        for camera_id in [c for c, r in self._rings.items() if now - r.last_add > CLIP_BUFFER_IDLE_SECONDS]:
+            self._bytes -= self._rings.pop(camera_id).bytes
+        while self._bytes > self.max_bytes:
+            largest = max(self._rings.values(), key=lambda r: r.bytes)
+            if not largest.frames:
+                break
+            self._bytes -= largest.pop_oldest()
+
+    # -------- clips --------
+    def begin(self, camera_id, clip_id=None, alert_time=None):
+        """
+        Schedules a clip around 'alert_time' (default now) for camera_id.
+        Returns the clip ID, or None when this process has no buffered frames for the camera.
+        """
+        alert_time = alert_time or time.time()
+        if camera_id is None:
+            # buffers are filed under ai_service.alert_camera_id(), which never returns None
+            print("[CLIP] ⚠️ Alert without a camera ID; no clip recorded")
+            return None
+        if self.remote:
+            with self._lock:
+                # only promise a clip the worker holding the camera's frames can actually record
+                if not self._remote_rings.get(camera_id, (False, 0))[0]:
+                    return None
+                clip_id = clip_id or uuid.uuid4().hex
+                self._issued.append((camera_id, clip_id, alert_time))
+            return clip_id
+        with self._lock:
+            ring = self._rings.get(camera_id)
+            if ring is None or not ring.frames:
+                return None
+            clip_id = clip_id or uuid.uuid4().hex
+            heapq.heappush(self._pending, (alert_time + self.post_seconds, clip_id, camera_id, alert_time))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="clip-recorder", daemon=True)
+                self._thread.start()
+            self._lock.notify()
+        print(f"[CLIP] 🎬 Recording clip {clip_id} for camera {camera_id}")
+        return clip_id
+
+    def has_frames(self, camera_id):
+        """True when this process buffers frames for camera_id (so it can record a clip for it)."""
+        with self._lock:
+            ring = self._rings.get(camera_id)
+            return ring is not None and bool(ring.frames)
+
+    def note_remote_ring(self, camera_id, has_frames, now=None):
+        """Remote mode: what the worker sending camera_id's latest frame said about its buffer."""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._remote_rings[camera_id] = (bool(has_frames), now)
+            # same idle schedule as local buffers: a camera nobody sends frames for is forgotten
+            for idle in [c for c, (_, seen) in self._remote_rings.items() if now - seen > CLIP_BUFFER_IDLE_SECONDS]:
+                del self._remote_rings[idle]
+
+    def take_issued(self):
+        """Clip IDs handed out in remote mode since the last call; the caller records them."""
+        with self._lock:
+            issued, self._issued = self._issued, []
+            return issued
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._pending or self._pending[0][0] > time.time():
+                    self._lock.wait(self._pending[0][0] - time.time() if self._pending else None)
+                _, clip_id, camera_id, alert_time = heapq.heappop(self._pending)
+                ring = self._rings.get(camera_id)
+                frames = ring.between(alert_time - self.pre_seconds, alert_time + self.post_seconds) if ring else []
+            path = self.clip_path(clip_id)
+            try:
+                written = write_clip(path, frames, self.fps)
+                if written:
+                    self.clips_written += 1
+                    print(f"[CLIP] ✅ Saved {path} ({written} frames)")
+                else:
+                    print(f"[CLIP] ⚠️ No frames for clip {clip_id}")
+            except Exception as e:
+                print(f"[CLIP] ❌ Failed to write clip {clip_id}: {e}")
+
+    def clip_path(self, clip_id):
+        return os.path.join(self.clip_dir, f"{clip_id}.mp4")
+
+    def status(self):
+        with self._lock:
+            return {
+                "buffered_bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "cameras": {c: {"frames": len(r.frames), "bytes": r.bytes} for c, r in self._rings.items()},
+                "pending_clips": len(self._pending),
+                "clips_written": self.clips_written,
+            }
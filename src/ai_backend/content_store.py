@@ -0,0 +1,233 @@
+"""
+Content-addressed upload storage and on-disk detection cache.
+
+Uploads are hashed while they stream in and stored once per SHA-256, so the
+same incident clip uploaded several times takes space once. The names handed
+back to clients are hard links (copies where links aren't supported) to the
+stored content, so /video_feed can still delete them after streaming.
+
+Detection results are cached per (content hash, model version, settings):
+re-streaming or re-analyzing an identical video reuses them instead of
+running YOLO again.
+
+Both are bounded: the store keeps at most UPLOAD_STORE_MAX_MB of content and
+the cache DETECTION_CACHE_MAX_ENTRIES results. The least recently used
+entries are evicted first (file mtimes are touched on every reuse). The alias
+index keeps the newest UPLOAD_STORE_MAX_ALIASES upload names; an older name
+loses its cache hits but its content stays until it is evicted.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+
+from model_backend import DEFAULT_MODEL_PATH, resolve_variant, variant_name
+
+# ------------------------------
+# Config
+# ------------------------------
+UPLOAD_STORE_DIR = os.getenv("UPLOAD_STORE_DIR", "video_store")
+DETECTION_CACHE_DIR = os.getenv("DETECTION_CACHE_DIR", "detection_cache")
+UPLOAD_STORE_MAX_MB = float(os.getenv("UPLOAD_STORE_MAX_MB", "4096"))
+UPLOAD_STORE_MAX_ALIASES = int(os.getenv("UPLOAD_STORE_MAX_ALIASES", "2000"))   # upload names remembered
+DETECTION_CACHE_MAX_ENTRIES = int(os.getenv("DETECTION_CACHE_MAX_ENTRIES", "1000"))
+HASH_CHUNK_BYTES = 1024 * 1024
+
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+
+def file_fingerprint(path):
+    """SHA-256 of a file, memoized on (path, size, mtime)."""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime)
+    with _fingerprints_lock:
+        if key in _fingerprints:
+            return _fingerprints[key]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    with _fingerprints_lock:
+        _fingerprints[key] = digest.hexdigest()
+    return _fingerprints[key]
+
+
+def _touch(path):
+    """Marks 'path' as just used for LRU eviction."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _oldest_first(paths):
+    """(mtime, size, path) for the paths that still exist, least recently used first."""
+    entries = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+    return sorted(entries)
+
+
+def model_version(weights=DEFAULT_MODEL_PATH, variant=None, backend=None, device="cpu"):
+    """
+    Identifies the detector for cache keys: weights hash plus the backend/precision serving it.
+    Without 'variant' (the one a loaded model reports), it is the variant load_model() resolves
+    for 'backend' (MODEL_BACKEND / MODEL_PRECISION when None) on 'device', after runtime and
+    approval fallbacks. That only looks at files and installed runtimes; torch is not imported.
+    """
+    variant = variant or variant_name(*resolve_variant(weights, backend, device, warn=False))
+    try:
+        return f"{file_fingerprint(weights)[:16]}:{variant}"
+    except OSError:
+        return f"missing:{variant}"
+
+# ------------------------------
+# Upload store
+# ------------------------------
+class ContentStore:
+    """Stores uploads as <root>/<sha256><ext> and remembers which upload names point at which hash."""
+
+    def __init__(self, root=UPLOAD_STORE_DIR, max_bytes=UPLOAD_STORE_MAX_MB * 1024 * 1024,
+                 max_aliases=UPLOAD_STORE_MAX_ALIASES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_aliases = max(1, max_aliases)
+        os.makedirs(root, exist_ok=True)
+        self._index_path = os.path.join(root, "index.json")
+        self._lock = threading.Lock()
+        self._aliases = {}
+        if os.path.exists(self._index_path):
+            with open(self._index_path, "r") as f:
+                self._aliases = json.load(f)
+
+    def save_upload(self, fileobj, original_name):
+        """
+        Streams 'fileobj' into the store, hashing as it goes.
+        Returns (content_hash, stored_path, deduplicated).
+        """
+        ext = os.path.splitext(original_name or "")[1].lower()
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in iter(lambda: fileobj.read(HASH_CHUNK_BYTES), b""):
+                    digest.update(chunk)
+                    out.write(chunk)
+            content_hash = digest.hexdigest()
+            stored_path = os.path.join(self.root, f"{content_hash}{ext}")
+            if os.path.exists(stored_path):
+                os.remove(tmp_path)
+                _touch(stored_path)
+                return content_hash, stored_path, True
+            os.replace(tmp_path, stored_path)
+            self._evict(keep=stored_path)
+            return content_hash, stored_path, False
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def link(self, content_hash, stored_path, alias_path):
+        """Exposes stored content under 'alias_path' (hard link, copy as fallback) and records the alias."""
+        try:
+            os.link(stored_path, alias_path)
+        except OSError:
+            shutil.copyfile(stored_path, alias_path)
+        name = os.path.basename(alias_path)
+        with self._lock:
+            # oldest names first: drop the ones beyond max_aliases
+            self._aliases.pop(name, None)
+            self._aliases[name] = content_hash
+            for old in list(self._aliases)[:max(0, len(self._aliases) - self.max_aliases)]:
+                del self._aliases[old]
+            self._write_index()
+
+    def _write_index(self):
+        tmp = f"{self._index_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._aliases, f)
+        os.replace(tmp, self._index_path)
+
+    def _evict(self, keep):
+        """Drops least recently used content (never 'keep') until the store fits in max_bytes."""
+        names = [n for n in os.listdir(self.root) if n != "index.json" and not n.endswith((".part", ".tmp"))]
+        entries = _oldest_first(os.path.join(self.root, n) for n in names)
+        total = sum(size for _, size, _ in entries)
+        evicted = set()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"[CACHE] Could not evict {path}: {e}")
+                continue
+            total -= size
+            evicted.add(os.path.splitext(os.path.basename(path))[0])
+        if not evicted:
+            return
+        print(f"[CACHE] Evicted {len(evicted)} stored upload(s) to stay under {self.max_bytes / (1024 * 1024):.0f} MB")
+        with self._lock:
+            self._aliases = {a: h for a, h in self._aliases.items() if h not in evicted}
+            self._write_index()
+
+    def hash_for(self, name):
+        """Content hash behind an upload name, or None for files that didn't come through the store."""
+        with self._lock:
+            return self._aliases.get(os.path.basename(name))
+
+# ------------------------------
+# Detection cache
+# ------------------------------
+class DetectionCache:
+    """JSON results keyed by (kind, content hash, model version, settings)."""
+
+    def __init__(self, root=DETECTION_CACHE_DIR, max_entries=DETECTION_CACHE_MAX_ENTRIES):
+        self.root = root
+        self.max_entries = max_entries
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, kind, content_hash, model_ver, settings):
+        key = json.dumps([content_hash, model_ver, settings], sort_keys=True)
+        return os.path.join(self.root, f"{kind}_{hashlib.sha256(key.encode()).hexdigest()}.json")
+
+    def get(self, kind, content_hash, model_ver, settings):
+        path = self._path(kind, content_hash, model_ver, settings)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r") as f:
+                value = json.load(f)
+            _touch(path)
+            return value
+        except (OSError, ValueError) as e:
+            print(f"[CACHE] Ignoring unreadable cache entry {path}: {e}")
+            return None
+
+    def put(self, kind, content_hash, model_ver, settings, value):
+        path = self._path(kind, content_hash, model_ver, settings)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(value, f)
+        os.replace(tmp, path)
+        print(f"[CACHE] Stored {kind} results for {content_hash[:12]} ({model_ver})")
+        self._evict()
+
+    def _evict(self):
+        """Removes the least recently used results beyond max_entries."""
+        entries = _oldest_first(os.path.join(self.root, n) for n in os.listdir(self.root) if n.endswith(".json"))
+        for _, _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
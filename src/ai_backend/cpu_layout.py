@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+CPU core partitioning for inference workers.
+
+Every torch model call uses an intra-op thread pool as wide as the machine by
+default, so several concurrent streams (or several model_server processes)
+oversubscribe the cores and total throughput collapses. A layout splits the
+available cores into one disjoint group per inference worker. Each worker
+pins itself to its group (CPU_AFFINITY, Linux only) and sizes its torch and
+OpenCV thread pools to match.
+
+The number of workers comes from CPU_WORKERS, or from a short calibration
+that times 1, 2, 4, ... concurrent worker processes on the real model and keeps
+the fastest split (cached in CPU_LAYOUT_FILE):
+
+    python cpu_layout.py --calibrate
+"""
+
+import os
+import json
+import time
+import argparse
+import threading
+import multiprocessing
+
+# ------------------------------
+# Config
+# ------------------------------
+CPU_WORKERS = os.getenv("CPU_WORKERS", "auto")               # "auto" or a number of inference workers
+CPU_THREADS_PER_WORKER = int(os.getenv("CPU_THREADS_PER_WORKER", "0"))   # 0 = cores / workers
+CPU_RESERVED_CORES = int(os.getenv("CPU_RESERVED_CORES", "0"))          # left for decoding / HTTP
+CPU_AFFINITY = os.getenv("CPU_AFFINITY", "1") == "1"
+CPU_LAYOUT_FILE = os.getenv("CPU_LAYOUT_FILE", "cpu_layout.json")
+DEFAULT_CORES_PER_WORKER = 4    # "auto" without a calibration
+CALIBRATION_SECONDS = 3.0       # timed inference per candidate split
+CALIBRATION_MARGIN = 0.05       # prefer fewer workers unless more are this much faster
+
+
+def available_cores():
+    """Cores this process may run on (respects taskset / container cpusets)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def plan_layout(workers, threads=None, reserved=None, cores=None, source="config"):
+    """
+    Splits the cores into 'workers' contiguous groups (the last 'reserved' cores stay free).
+    With more workers than cores, groups share cores and each worker gets one thread.
+    """
+    threads = CPU_THREADS_PER_WORKER if threads is None else threads
+    reserved = CPU_RESERVED_CORES if reserved is None else reserved
+    cores = list(cores if cores is not None else available_cores())
+    if reserved and len(cores) > reserved:
+        cores, spare = cores[:-reserved], cores[-reserved:]
+    else:
+        spare = []
+    workers = max(1, int(workers))
+    slots = []
+    for i in range(workers):
+        if workers <= len(cores):
+            size, extra = divmod(len(cores), workers)
+            start = i * size + min(i, extra)
+            group = cores[start:start + size + (1 if i < extra else 0)]
+        else:
+            group = [cores[i % len(cores)]]
+        slots.append({"index": i, "cores": group, "threads": threads or len(group)})
+    return {"source": source, "cores": cores, "reserved": spare, "workers": slots}
+
+
+def default_workers(cores=None):
+    return max(1, len(cores if cores is not None else available_cores()) // DEFAULT_CORES_PER_WORKER)
+
+
+def load_calibration(path=CPU_LAYOUT_FILE, cores=None):
+    """Cached calibration for this core set, or None."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get("cores") != list(cores if cores is not None else available_cores()):
+        return None
+    return cached
+
+
+def resolve_layout(workers=None, cores=None):
+    """Layout from CPU_WORKERS, a cached calibration, or the DEFAULT_CORES_PER_WORKER heuristic."""
+    workers = CPU_WORKERS if workers is None else workers
+    cores = list(cores if cores is not None else available_cores())
+    if str(workers).isdigit():
+        return plan_layout(int(workers), cores=cores)
+    cached = load_calibration(cores=cores)
+    if cached:
+        layout = plan_layout(cached["best_workers"], cores=cores, source="calibration")
+        layout["calibration"] = cached["throughput_fps"]
+        return layout
+    return plan_layout(default_workers(cores), cores=cores, source="default")
+
+
+def apply_worker(slot, affinity=CPU_AFFINITY):
+    """
+    Pins the calling process to the slot's cores and sizes torch / OpenCV thread pools.
+    Call in a worker process before the model runs.
+    """
+    import cv2
+    import torch
+
+    if affinity and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, slot["cores"])
+        except OSError as e:
+            print(f"[CPU] Could not pin worker {slot['index']} to cores {slot['cores']}: {e}")
+    torch.set_num_threads(max(1, slot["threads"]))
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # can only be set once, before any inter-op work
+    cv2.setNumThreads(max(1, slot["threads"]))
+    print(f"[CPU] Worker {slot['index']} (pid {os.getpid()}): cores {slot['cores']}, {slot['threads']} threads")
+
+
+class InferenceGate:
+    """
+    Limits concurrent model calls in one process to the layout's worker count, with each
+    call using its share of the cores, instead of every stream running a full-width pool.
+    """
+
+    def __init__(self, layout):
+        self.layout = layout
+        self.slots = len(layout["workers"])
+        self._sem = threading.BoundedSemaphore(self.slots)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.waited = 0
+        self.wait_time = 0.0
+
+    def __enter__(self):
+        t0 = time.time()
+        if not self._sem.acquire(blocking=False):
+            self._sem.acquire()
+            with self._lock:
+                self.waited += 1
+                self.wait_time += time.time() - t0
+        with self._lock:
+            self.calls += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._sem.release()
+
+    def status(self):
+        with self._lock:
+            return {
+                **self.layout,
+                "calls": self.calls,
+                "waited": self.waited,
+                "mean_wait_ms": round(1000 * self.wait_time / self.waited, 2) if self.waited else 0.0,
+            }
+
+# ------------------------------
+# Calibration
+# ------------------------------
+def _calibration_worker(weights, imgsz, slot, frame_shape, seconds, ready, start, results):
+    import numpy as np
+    from model_backend import load_model
+
+    apply_worker(slot)
+    model, _ = load_model(weights, imgsz=imgsz, device="cpu")
+    frame = np.random.default_rng(slot["index"]).integers(0, 255, frame_shape, dtype=np.uint8)
+    model(frame, imgsz=imgsz, verbose=False)   # warm up
+    ready.put(slot["index"])
+    start.wait()
+    runs = 0
+    t0 = time.time()
+    while time.time() - t0 < seconds:
+        model(frame, imgsz=imgsz, verbose=False)
+        runs += 1
+    results.put(runs / (time.time() - t0))
+
+
+def measure_split(weights, imgsz, workers, cores, frame_shape=(720, 1280, 3), seconds=CALIBRATION_SECONDS):
+    """Aggregate frames/s of 'workers' pinned worker processes running inference at once."""
+    ctx = multiprocessing.get_context("spawn")
+    layout = plan_layout(workers, cores=cores)
+    ready, results, start = ctx.Queue(), ctx.Queue(), ctx.Event()
+    procs = [ctx.Process(target=_calibration_worker, daemon=True,
+                         args=(weights, imgsz, slot, frame_shape, seconds, ready, start, results))
+             for slot in layout["workers"]]
+    for p in procs:
+        p.start()
+    try:
+        for _ in procs:
+            ready.get(timeout=300)
+        start.set()
+        return sum(results.get(timeout=seconds + 120) for _ in procs)
+    finally:
+        for p in procs:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+
+
+def calibrate(weights, imgsz=640, cores=None, path=CPU_LAYOUT_FILE):
+    """
+    Times 1, 2, 4, ... workers (up to one per core) and caches the best split.
+    Returns the calibrated layout.
+    """
+    cores = list(cores if cores is not None else available_cores())
+    usable = len(cores) - CPU_RESERVED_CORES if len(cores) > CPU_RESERVED_CORES else len(cores)
+    candidates = []
+    n = 1
+    while n <= usable:
+        candidates.append(n)
+        n *= 2
+    throughput = {}
+    for n in candidates:
+        throughput[n] = round(measure_split(weights, imgsz, n, cores), 2)
+        print(f"[CPU] {n} worker(s): {throughput[n]:.1f} frames/s")
+    best = candidates[0]
+    for n in candidates[1:]:
+        if throughput[n] > throughput[best] * (1 + CALIBRATION_MARGIN):
+            best = n
+    if path:
+        with open(path, "w") as f:
+            json.dump({"cores": cores, "weights": weights, "imgsz": imgsz, "best_workers": best,
+                       "throughput_fps": {str(k): v for k, v in throughput.items()}}, f, indent=2)
+    print(f"[CPU] Best split: {best} worker(s) on {usable} cores")
+    layout = plan_layout(best, cores=cores, source="calibration")
+    layout["calibration"] = {str(k): v for k, v in throughput.items()}
+    return layout
+
+# ---------------------------
+# CLI
+# ---------------------------
+def parse_args():
+    from model_backend import DEFAULT_MODEL_PATH
+
+    p = argparse.ArgumentParser(description="Plan or calibrate the CPU layout of inference workers")
+    p.add_argument("--calibrate", action="store_true", help="time candidate splits and cache the best one")
+    p.add_argument("--weights", type=str, default=DEFAULT_MODEL_PATH)
+    p.add_argument("--imgsz", type=int, default=640)
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    layout = calibrate(args.weights, args.imgsz) if args.calibrate else resolve_layout()
+    print(json.dumps(layout, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Detection-metadata messages for dashboards that already show the raw camera
+feed and draw overlays client-side. Instead of re-encoding every frame to JPEG,
+the service sends per-frame boxes / classes / confidences as compact JSON
+(SSE or WebSocket) or packed binary (WebSocket).
+"""
+
+import json
+import struct
+
+
+def frame_message(camera_id, seq, frame_time, shape, detections):
+    """
+    Compact per-frame message:
+    {"cam", "seq", "ts" (capture time, epoch ms), "w", "h",
+     "det": [[class, confidence, x1, y1, x2, y2], ...]}
+    """
+    h, w = shape[:2]
+    return {
+        "cam": camera_id,
+        "seq": seq,
+        "ts": int(frame_time * 1000),
+        "w": w,
+        "h": h,
+        "det": [
+            [d["class"], round(d["confidence"], 3)] + [int(v) for v in d["bbox"]]
+            for d in detections
+        ],
+    }
+
+
+def to_json(msg):
+    return json.dumps(msg, separators=(",", ":"))
+
+
+def sse_event(msg):
+    """Formats a message as one Server-Sent Event."""
+    return f"id: {msg['seq']}\nevent: detections\ndata: {to_json(msg)}\n\n".encode()
+
+
+class BinaryEncoder:
+    """
+    Packs frame messages for WebSocket binary frames (little-endian):
+        header: f64 ts_ms, u32 seq, u16 w, u16 h, u16 n
+        n x box: u16 x1, u16 y1, u16 x2, u16 y2, u8 class_idx, f32 confidence
+    Class indices refer to a table sent as a JSON text message
+    ({"classes": [...]}) whenever a new class name first appears.
+    """
+
+    HEADER = struct.Struct("<dIHHH")
+    BOX = struct.Struct("<HHHHBf")
+
+    def __init__(self):
+        self.classes = []
+        self._index = {}
+
+    def encode(self, msg):
+        """Returns the list of WebSocket messages (str for text, bytes for binary) for one frame."""
+        out = []
+        new_class = False
+        for d in msg["det"]:
+            if d[0] not in self._index:
+                self._index[d[0]] = len(self.classes)
+                self.classes.append(d[0])
+                new_class = True
+        if new_class:
+            out.append(to_json({"cam": msg["cam"], "classes": self.classes}))
+
+        parts = [self.HEADER.pack(float(msg["ts"]), msg["seq"] & 0xFFFFFFFF, msg["w"], msg["h"], len(msg["det"]))]
+        for name, conf, x1, y1, x2, y2 in msg["det"]:
+            parts.append(self.BOX.pack(_u16(x1), _u16(y1), _u16(x2), _u16(y2), self._index[name], conf))
+        out.append(b"".join(parts))
+        return out
+
+
+def _u16(v):
+    return max(0, min(0xFFFF, int(v)))
@@ -0,0 +1,185 @@
+"""
+Reusable frame buffers for the per-frame video paths.
+
+A decoded 1080p frame is ~6 MB; copying it for display, resizing it into a
+fresh array for inference and copying it again to remember the last drawn
+frame allocates tens of MB per second on a live preview. FrameBuffers keeps one
+named numpy array per purpose and only reallocates when the shape changes, so
+frames are decoded, resized and composited into the same memory every time.
+
+OverlayLayer holds boxes and status text drawn once per inference pass; it is
+composited onto every displayed frame (including frames skipped for
+inference) instead of redrawing or copying the last annotated frame.
+
+AllocStats reports what the loop still allocates per frame: buffer
+(re)allocations, garbage collections, peak RSS, and (with tracing on) the
+bytes allocated per frame as seen by tracemalloc.
+"""
+
+import sys
+import gc
+import threading
+import tracemalloc
+
+import cv2
+import numpy as np
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+
+class FrameBuffers:
+    """Named numpy arrays that are reused as long as the requested shape / dtype stays the same."""
+
+    def __init__(self):
+        self._buffers = {}
+        self.allocations = 0
+        self.allocated_bytes = 0
+        self.reuses = 0
+
+    def get(self, name, shape, dtype=np.uint8):
+        shape = tuple(shape)
+        buf = self._buffers.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype)
+            self._buffers[name] = buf
+            self.allocations += 1
+            self.allocated_bytes += buf.nbytes
+        else:
+            self.reuses += 1
+        return buf
+
+    def resize(self, frame, size, name="resize", interpolation=cv2.INTER_LINEAR):
+        """cv2.resize into the buffer 'name'; size is (width, height) like cv2.resize."""
+        w, h = size
+        dst = self.get(name, (h, w) + frame.shape[2:], frame.dtype)
+        return cv2.resize(frame, (w, h), dst=dst, interpolation=interpolation)
+
+    def copy(self, frame, name="copy"):
+        """frame copied into the buffer 'name' (a reusable frame.copy())."""
+        dst = self.get(name, frame.shape, frame.dtype)
+        np.copyto(dst, frame)
+        return dst
+
+    def stats(self):
+        return {
+            "buffers": len(self._buffers),
+            "bytes": sum(b.nbytes for b in self._buffers.values()),
+            "allocations": self.allocations,
+            "allocated_bytes": self.allocated_bytes,
+            "reuses": self.reuses,
+        }
+
+
+class OverlayLayer:
+    """
+    Annotations drawn on their own layer: begin() returns a cleared canvas to draw on,
+    finish() builds the mask of drawn pixels, composite(frame) stamps them onto a frame.
+    Pure black pixels count as "not drawn", so annotation colors must not be (0, 0, 0).
+    """
+
+    def __init__(self, buffers):
+        self.buffers = buffers
+        self.image = None
+        self.mask = None
+        self.ready = False
+
+    def begin(self, shape):
+        self.image = self.buffers.get("overlay", shape)
+        self.mask = self.buffers.get("overlay_mask", shape[:2])
+        self.image.fill(0)
+        self.ready = False
+        return self.image
+
+    def finish(self):
+        cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY, dst=self.mask)
+        cv2.threshold(self.mask, 0, 255, cv2.THRESH_BINARY, dst=self.mask)
+        self.ready = True
+
+    def composite(self, frame):
+        """Draws the layer onto 'frame' in place. Returns False when sizes don't match."""
+        if not self.ready or frame.shape != self.image.shape:
+            return False
+        cv2.copyTo(self.image, self.mask, frame)
+        return True
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None where unavailable)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class AllocStats:
+    """
+    Per-frame allocation counters for a frame loop: frame_start() / frame_end() around each frame.
+    trace=True also measures Python and numpy heap allocations per frame with tracemalloc
+    (accurate, but slows the loop down noticeably).
+    """
+
+    def __init__(self, trace=False):
+        self.trace = trace
+        self.frames = 0
+        self.gc_collections = 0
+        self.frame_alloc_total = 0
+        self.frame_alloc_max = 0
+        self._base = 0
+        self._started_tracing = False
+        gc.callbacks.append(self._on_gc)
+        if trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def _on_gc(self, phase, info):
+        if phase == "start":
+            self.gc_collections += 1
+
+    def frame_start(self):
+        if self.trace:
+            tracemalloc.reset_peak()
+            self._base = tracemalloc.get_traced_memory()[0]
+
+    def frame_end(self):
+        self.frames += 1
+        if self.trace:
+            _, peak = tracemalloc.get_traced_memory()
+            allocated = max(0, peak - self._base)
+            self.frame_alloc_total += allocated
+            self.frame_alloc_max = max(self.frame_alloc_max, allocated)
+
+    def close(self):
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def report(self, buffers=None):
+        frames = max(1, self.frames)
+        report = {
+            "frames": self.frames,
+            "gc_collections": self.gc_collections,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        if self.trace:
+            report["alloc_kb_per_frame"] = round(self.frame_alloc_total / frames / 1024, 1)
+            report["alloc_kb_max_frame"] = round(self.frame_alloc_max / 1024, 1)
+        if buffers is not None:
+            report["buffers"] = buffers.stats()
+        return report
+
+
+_thread_local = threading.local()
+
+
+def thread_buffers():
+    """The calling thread's FrameBuffers (stream producers each run on their own thread)."""
+    buffers = getattr(_thread_local, "buffers", None)
+    if buffers is None:
+        buffers = _thread_local.buffers = FrameBuffers()
+    return buffers
@@ -0,0 +1,604 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test for the AgniShakti AI service.
+
+Simulates N cameras posting frames to /analyze_and_save_frame and M viewers
+pulling /video_feed MJPEG streams, against a local stand-in for the Next.js
+/api/alerts/client-trigger endpoint that records arrival times and can inject
+latency and errors. Reports throughput, request and detection-to-alert latency
+percentiles, dropped frames and server CPU / memory.
+
+    python load_test.py load_scenarios/baseline.json --out report.json
+
+Scenarios are JSON files (see load_scenarios/). With "launch": true the
+harness starts uvicorn itself with NEXTJS_API_URL pointed at the stub sink;
+otherwise start the service with NEXTJS_API_URL=http://127.0.0.1:<sink port>
+and pass --server-pid to sample its resource usage.
+
+The service itself only raises alerts on the streaming path (the viewers'
+/video_feed streams). /analyze_and_save_frame never calls trigger_alert: the
+owner dashboard posts client-trigger itself when a frame comes back with a
+detection. Set "forward_alerts": true on the cameras to do the same, so camera
+detections reach the sink too. The report counts alerts per path.
+
+The scenario files refer to media in load_scenarios/media/. To generate
+synthetic stand-ins (flame-colored flicker on a dark scene, and an empty
+scene):
+
+    python load_test.py load_scenarios/baseline.json --make-media
+
+They load the service like real frames, but the detector may not fire on
+them; use real fire footage under the same names for alert numbers.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+try:
+    import psutil
+except ImportError:  # resource sampling is skipped without psutil
+    psutil = None
+
+# ------------------------------
+# Config
+# ------------------------------
+DEFAULT_SCENARIO = {
+    "name": "default",
+    "service_url": "http://127.0.0.1:8000",
+    "launch": False,            # start uvicorn ai_service:app for the run
+    "duration_s": 60,
+    "warmup_s": 5,              # traffic before this isn't counted
+    "seed": 1,
+    "cameras": {
+        "count": 4,
+        "fps": 2,
+        "images": [],           # JPEG files posted round-robin
+        "video": None,          # or sample frames from a video (needs OpenCV)
+        "jpeg_quality": 80,
+        "timeout_s": 10,
+        "forward_alerts": False,  # post client-trigger for detections, like the owner dashboard
+    },
+    "viewers": {
+        "count": 2,
+        "video": None,          # uploaded once per stream; viewers of a stream share it
+        "streams": 1,
+        "profile": "medium",
+    },
+    "alert_sink": {
+        "host": "127.0.0.1",
+        "port": 3100,
+        "latency_ms": [0, 0],   # uniform injected delay before answering
+        "error_rate": 0.0,      # share of alerts answered with error_status
+        "error_status": 500,
+    },
+    "sample_interval_s": 1.0,
+}
+READY_TIMEOUT = 300
+CAMERA_PREFIX = "loadcam"
+STREAM_PREFIX = "loadstream"
+MEDIA_SIZE = (640, 480)
+MEDIA_CLIP_SECONDS = 10
+MEDIA_CLIP_FPS = 15
+
+
+def load_scenario(path):
+    """Reads a scenario file and fills in defaults for missing keys."""
+    with open(path, "r") as f:
+        raw = json.load(f)
+    scenario = {}
+    for key, default in DEFAULT_SCENARIO.items():
+        value = raw.get(key, default)
+        scenario[key] = {**default, **value} if isinstance(default, dict) else value
+    base = os.path.dirname(os.path.abspath(path))
+    # media paths are relative to the scenario file
+    cams, viewers = scenario["cameras"], scenario["viewers"]
+    cams["images"] = [os.path.join(base, p) for p in cams["images"]]
+    for section in (cams, viewers):
+        if section.get("video"):
+            section["video"] = os.path.join(base, section["video"])
+    return scenario
+
+
+def percentiles(values, points=(50, 90, 99)):
+    """Nearest-rank percentiles, in the unit of 'values'. None for an empty list."""
+    if not values:
+        return {**{f"p{p}": None for p in points}, "max": None}
+    ordered = sorted(values)
+    out = {f"p{p}": ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))] for p in points}
+    out["max"] = ordered[-1]
+    return out
+
+
+def ms(stats):
+    return {k: round(v * 1000, 1) if v is not None else None for k, v in stats.items()}
+
+# ------------------------------
+# Stand-in for Next.js /api/alerts/client-trigger
+# ------------------------------
+class AlertSink:
+    """Records alert arrivals; optionally delays answers and fails a share of them."""
+
+    def __init__(self, host="127.0.0.1", port=3100, latency_ms=(0, 0), error_rate=0.0, error_status=500, seed=1):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.alerts = []          # (arrival, detected_at, camera_id, clip_id, injected_error)
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                arrival = time.time()
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path != "/api/alerts/client-trigger":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                sink._handle(self, arrival, body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.url = f"http://{host}:{port}"
+        self._thread = threading.Thread(target=self.server.serve_forever, name="alert-sink", daemon=True)
+
+    def _handle(self, handler, arrival, body):
+        try:
+            payload = json.loads(body)
+            detected_at = parse_timestamp(payload.get("timestamp"))
+        except ValueError:
+            payload, detected_at = {}, None
+        with self._lock:
+            delay = self._random.uniform(*self.latency_ms) / 1000.0
+            fail = self._random.random() < self.error_rate
+            self.alerts.append((arrival, detected_at, payload.get("cameraId"), payload.get("clipId"), fail))
+        if delay:
+            time.sleep(delay)
+        status = self.error_status if fail else 200
+        data = json.dumps({"ok": not fail}).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+
+    def report(self, since):
+        with self._lock:
+            alerts = [a for a in self.alerts if a[0] >= since]
+        latencies = [a[0] - a[1] for a in alerts if a[1] is not None]
+        per_camera = {}
+        for a in alerts:
+            per_camera[a[2]] = per_camera.get(a[2], 0) + 1
+        # camera posts only reach the sink when the harness forwards them ("forward_alerts")
+        from_cameras = sum(1 for a in alerts if str(a[2]).startswith(CAMERA_PREFIX))
+        return {
+            "received": len(alerts),
+            "from_streams": len(alerts) - from_cameras,
+            "from_cameras": from_cameras,
+            "injected_errors": sum(1 for a in alerts if a[4]),
+            "with_clip": sum(1 for a in alerts if a[3]),
+            "detection_to_alert_ms": ms(percentiles(latencies)),
+            "per_camera": per_camera,
+        }
+
+
+def parse_timestamp(value):
+    """Alert payload timestamp ("2025-01-01T12:00:00.123Z") -> epoch seconds."""
+    if not value:
+        return None
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%fZ").replace(tzinfo=timezone.utc).timestamp()
+
+# ------------------------------
+# Load generators
+# ------------------------------
+def read_camera_frames(cfg):
+    """JPEG payloads for camera simulators: the image files, or frames sampled from a video."""
+    if cfg["images"]:
+        frames = []
+        for path in cfg["images"]:
+            with open(path, "rb") as f:
+                frames.append(f.read())
+        return frames
+    if cfg["video"]:
+        import cv2
+
+        cap = cv2.VideoCapture(cfg["video"])
+        frames = []
+        idx = 0
+        while len(frames) < 100 and cap.grab():
+            if idx % 10 == 0:
+                ret, frame = cap.retrieve()
+                if ret:
+                    frames.append(cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, cfg["jpeg_quality"]])[1].tobytes())
+            idx += 1
+        cap.release()
+        if frames:
+            return frames
+    raise ValueError("cameras need 'images' or a readable 'video'")
+
+
+class CameraSim(threading.Thread):
+    """
+    Posts frames at a fixed rate like a camera client. A frame whose slot passes while
+    the previous request is still in flight is dropped, as a real camera loop would.
+    """
+
+    def __init__(self, camera_id, url, frames, fps, timeout, stop, start_offset=0.0, alert_url=None):
+        super().__init__(name=f"camera-{camera_id}", daemon=True)
+        self.camera_id = camera_id
+        self.url = url
+        self.alert_url = alert_url   # set: forward detections to client-trigger like the dashboard
+        self.frames = frames
+        self.interval = 1.0 / fps
+        self.timeout = timeout
+        self.stop_event = stop
+        self.start_offset = start_offset
+        self.results = []   # (sent_at, latency, status, detected)
+        self.dropped = []   # times of skipped frame slots
+
+    def run(self):
+        session = requests.Session()
+        next_slot = time.time() + self.start_offset
+        idx = 0
+        while not self.stop_event.is_set():
+            now = time.time()
+            if now < next_slot:
+                self.stop_event.wait(next_slot - now)
+                continue
+            missed = int((now - next_slot) / self.interval)
+            self.dropped.extend([now] * missed)
+            next_slot += (missed + 1) * self.interval
+
+            jpeg = self.frames[idx % len(self.frames)]
+            idx += 1
+            t0 = time.time()
+            try:
+                r = session.post(self.url, files={"file": ("frame.jpg", jpeg, "image/jpeg")},
+                                 data={"camera_id": self.camera_id}, timeout=self.timeout)
+                result = r.json() if r.status_code == 200 else {}
+                detected = bool(result.get("detection"))
+                self.results.append((t0, time.time() - t0, r.status_code, detected))
+            except (requests.RequestException, ValueError):
+                self.results.append((t0, time.time() - t0, None, False))
+                continue
+            if detected and self.alert_url:
+                self._forward(session, result, t0)
+
+    def _forward(self, session, result, detected_at):
+        """Posts the alert the owner dashboard would post for this detection."""
+        detection = result["detection"]
+        payload = {
+            "cameraId": self.camera_id,
+            "imageId": result.get("imageId"),
+            "className": detection.get("class"),
+            "confidence": detection.get("confidence"),
+            "bbox": detection.get("bbox"),
+            "localCheck": result.get("localCheck"),
+            "timestamp": datetime.fromtimestamp(detected_at, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z",
+        }
+        try:
+            session.post(self.alert_url, json=payload, timeout=self.timeout)
+        except requests.RequestException:
+            pass
+
+
+class ViewerSim(threading.Thread):
+    """Pulls an MJPEG stream and counts the parts received."""
+
+    BOUNDARY = b"--frame\r\n"
+
+    def __init__(self, name, url, stop):
+        super().__init__(name=f"viewer-{name}", daemon=True)
+        self.url = url
+        self.stop_event = stop
+        self.frame_times = []
+        self.error = None
+
+    def run(self):
+        try:
+            with requests.get(self.url, stream=True, timeout=(10, 60)) as r:
+                r.raise_for_status()
+                tail = b""
+                for chunk in r.iter_content(chunk_size=65536):
+                    if self.stop_event.is_set():
+                        break
+                    data = tail + chunk
+                    now = time.time()
+                    self.frame_times.extend([now] * data.count(self.BOUNDARY))
+                    tail = data[-(len(self.BOUNDARY) - 1):]
+        except requests.RequestException as e:
+            self.error = str(e)
+
+
+def make_media(directory, seed=1):
+    """
+    Writes synthetic stand-ins for the media the shipped scenarios use: fire_frame.jpg,
+    no_fire_frame.jpg and fire_clip.mp4 (flame-colored flicker on a dark scene).
+    Returns the paths written.
+    """
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    w, h = MEDIA_SIZE
+    os.makedirs(directory, exist_ok=True)
+
+    def scene():
+        frame = np.full((h, w, 3), 40, dtype=np.uint8)
+        cv2.rectangle(frame, (0, int(h * 0.7)), (w, h), (60, 70, 80), -1)
+        return frame
+
+    def flame(frame):
+        cx, base = w // 2, int(h * 0.75)
+        for _ in range(40):
+            x = int(cx + rng.normal(0, w * 0.05))
+            y = int(base - abs(rng.normal(0, h * 0.15)))
+            color = (int(rng.integers(0, 60)), int(rng.integers(120, 230)), 255)   # BGR: red-orange-yellow
+            cv2.circle(frame, (x, y), int(rng.integers(8, 28)), color, -1)
+        return frame
+
+    paths = [os.path.join(directory, n) for n in ("fire_frame.jpg", "no_fire_frame.jpg", "fire_clip.mp4")]
+    cv2.imwrite(paths[0], flame(scene()))
+    cv2.imwrite(paths[1], scene())
+    writer = cv2.VideoWriter(paths[2], cv2.VideoWriter_fourcc(*"mp4v"), MEDIA_CLIP_FPS, (w, h))
+    try:
+        for _ in range(MEDIA_CLIP_SECONDS * MEDIA_CLIP_FPS):
+            writer.write(flame(scene()))
+    finally:
+        writer.release()
+    return paths
+
+
+def check_media(scenario):
+    """Fails early, with a hint, when media named by the scenario is missing."""
+    cams, view = scenario["cameras"], scenario["viewers"]
+    paths = list(cams["images"]) + [p for p in (cams["video"], view["video"]) if p]
+    missing = [p for p in paths if not os.path.exists(p)]
+    if missing:
+        raise FileNotFoundError(f"Missing scenario media: {missing}. Add real footage there or generate "
+                                f"synthetic stand-ins with --make-media.")
+
+
+def upload_video(service_url, path, camera_id):
+    with open(path, "rb") as f:
+        r = requests.post(f"{service_url}/upload_video/{camera_id}",
+                          files={"video": (os.path.basename(path), f, "video/mp4")}, timeout=120)
+    r.raise_for_status()
+    return r.json()["filename"]
+
+# ------------------------------
+# Server side
+# ------------------------------
+class ResourceSampler(threading.Thread):
+    """Samples CPU% and RSS of the service process (and its children) while the test runs."""
+
+    def __init__(self, pid, interval, stop):
+        super().__init__(name="resource-sampler", daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.stop_event = stop
+        self.samples = []   # (time, cpu_percent, rss_bytes)
+
+    def run(self):
+        if psutil is None or not self.pid:
+            return
+        try:
+            proc = psutil.Process(self.pid)
+            procs = {}
+            while not self.stop_event.wait(self.interval):
+                cpu = 0.0
+                rss = 0
+                for p in [proc] + proc.children(recursive=True):
+                    # the first cpu_percent() call of a process only primes the counter
+                    if p.pid not in procs:
+                        procs[p.pid] = p
+                        p.cpu_percent(None)
+                    cpu += procs[p.pid].cpu_percent(None)
+                    rss += p.memory_info().rss
+                self.samples.append((time.time(), cpu, rss))
+        except psutil.Error as e:
+            print(f"[LOAD] Resource sampling stopped: {e}")
+
+    def report(self, since):
+        samples = [s for s in self.samples if s[0] >= since]
+        if not samples:
+            return {"available": psutil is not None and bool(self.pid)}
+        return {
+            "available": True,
+            "cpu_percent_mean": round(sum(s[1] for s in samples) / len(samples), 1),
+            "cpu_percent_max": round(max(s[1] for s in samples), 1),
+            "rss_mb_max": round(max(s[2] for s in samples) / 1e6, 1),
+        }
+
+
+def launch_service(service_url, sink_url):
+    port = service_url.rsplit(":", 1)[-1].split("/")[0]
+    env = {**os.environ, "NEXTJS_API_URL": sink_url}
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "ai_service:app", "--host", "127.0.0.1", "--port", port],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+    )
+    print(f"[LOAD] Started service (pid {proc.pid})")
+    return proc
+
+
+def wait_ready(service_url, timeout=READY_TIMEOUT):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{service_url}/readyz", timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    return False
+
+# ------------------------------
+# Run
+# ------------------------------
+def run_scenario(scenario, server_pid=None):
+    random.seed(scenario["seed"])
+    url = scenario["service_url"].rstrip("/")
+    sink_cfg = scenario["alert_sink"]
+    sink = AlertSink(sink_cfg["host"], sink_cfg["port"], tuple(sink_cfg["latency_ms"]),
+                     sink_cfg["error_rate"], sink_cfg["error_status"], seed=scenario["seed"])
+    sink.start()
+    print(f"[LOAD] Alert sink listening on {sink.url}")
+
+    service = launch_service(url, sink.url) if scenario["launch"] else None
+    stop = threading.Event()
+    try:
+        if not wait_ready(url):
+            raise RuntimeError(f"Service at {url} did not become ready")
+        sampler = ResourceSampler(service.pid if service else server_pid, scenario["sample_interval_s"], stop)
+
+        cams = scenario["cameras"]
+        cam_frames = read_camera_frames(cams) if cams["count"] else []
+        alert_url = f"{sink.url}/api/alerts/client-trigger" if cams["forward_alerts"] else None
+        cameras = [
+            CameraSim(f"{CAMERA_PREFIX}{i}", f"{url}/analyze_and_save_frame", cam_frames, cams["fps"], cams["timeout_s"],
+                      stop, start_offset=random.uniform(0, 1.0 / cams["fps"]), alert_url=alert_url)
+            for i in range(cams["count"])
+        ]
+
+        view = scenario["viewers"]
+        viewers = []
+        if view["count"]:
+            if not view["video"]:
+                raise ValueError("viewers need a 'video'")
+            # every stream is its own upload (and camera), viewers are spread over the streams
+            streams = []
+            for s in range(max(1, view["streams"])):
+                camera_id = f"{STREAM_PREFIX}{s}"
+                streams.append(f"{url}/video_feed/{camera_id}/{upload_video(url, view['video'], camera_id)}"
+                               f"?profile={view['profile']}")
+            viewers = [ViewerSim(str(i), streams[i % len(streams)], stop) for i in range(view["count"])]
+
+        started = time.time()
+        measure_from = started + scenario["warmup_s"]
+        print(f"[LOAD] Running '{scenario['name']}': {len(cameras)} cameras, {len(viewers)} viewers, "
+              f"{scenario['duration_s']}s (+{scenario['warmup_s']}s warmup)")
+        sampler.start()
+        for t in cameras + viewers:
+            t.start()
+        stop.wait(scenario["warmup_s"] + scenario["duration_s"])
+        try:
+            streams_status = requests.get(f"{url}/streams", timeout=5).json()
+        except (requests.RequestException, ValueError):
+            streams_status = {}
+        ended = time.time()
+        stop.set()
+        for t in cameras:
+            t.join(timeout=cams["timeout_s"] + 1)
+
+        return build_report(scenario, cameras, viewers, sink, sampler, streams_status, measure_from, ended)
+    finally:
+        stop.set()
+        sink.stop()
+        if service is not None:
+            service.terminate()
+            service.wait(timeout=30)
+
+
+def build_report(scenario, cameras, viewers, sink, sampler, streams_status, since, ended):
+    window = max(1e-6, ended - since)
+    results = [r for c in cameras for r in c.results if r[0] >= since]
+    ok = [r for r in results if r[2] == 200]
+    cam_report = {
+        "requests": len(results),
+        "throughput_fps": round(len(ok) / window, 2),
+        "target_fps": scenario["cameras"]["fps"] * len(cameras),
+        "errors": sum(1 for r in results if r[2] != 200),
+        "not_ready_503": sum(1 for r in results if r[2] == 503),
+        "detections": sum(1 for r in ok if r[3]),
+        "dropped_frames": sum(1 for c in cameras for t in c.dropped if t >= since),
+        "latency_ms": ms(percentiles([r[1] for r in ok])),
+    }
+
+    per_viewer_fps = [sum(1 for t in v.frame_times if t >= since) / window for v in viewers]
+    server_dropped = sum(s.get("dropped", 0) for b in streams_status.values() for s in b.get("viewers", []))
+    viewer_report = {
+        "viewers": len(viewers),
+        "frames_received": sum(sum(1 for t in v.frame_times if t >= since) for v in viewers),
+        "fps_mean": round(sum(per_viewer_fps) / len(per_viewer_fps), 2) if per_viewer_fps else None,
+        "fps_min": round(min(per_viewer_fps), 2) if per_viewer_fps else None,
+        "server_dropped_frames": server_dropped,
+        "errors": [v.error for v in viewers if v.error],
+    }
+
+    return {
+        "scenario": scenario["name"],
+        "window_s": round(window, 1),
+        "cameras": cam_report,
+        "viewers": viewer_report,
+        "alerts": sink.report(since),
+        "server": sampler.report(since),
+    }
+
+
+def print_report(report):
+    cams, view, alerts, server = report["cameras"], report["viewers"], report["alerts"], report["server"]
+    print(f"\n[LOAD] ===== {report['scenario']} ({report['window_s']}s measured) =====")
+    print(f"[LOAD] cameras: {cams['throughput_fps']}/{cams['target_fps']} fps, {cams['errors']} errors "
+          f"({cams['not_ready_503']} x 503), {cams['dropped_frames']} dropped, latency {cams['latency_ms']}")
+    print(f"[LOAD] viewers: {view['viewers']} at {view['fps_mean']} fps (min {view['fps_min']}), "
+          f"{view['server_dropped_frames']} frames dropped server-side")
+    print(f"[LOAD] alerts: {alerts['received']} received ({alerts['from_streams']} from streams, "
+          f"{alerts['from_cameras']} forwarded from cameras, {alerts['injected_errors']} failed on purpose), "
+          f"detection->alert {alerts['detection_to_alert_ms']}")
+    if server.get("cpu_percent_mean") is not None:
+        print(f"[LOAD] server: cpu {server['cpu_percent_mean']}% mean / {server['cpu_percent_max']}% max, "
+              f"rss {server['rss_mb_max']} MB max")
+    elif not server.get("available"):
+        print("[LOAD] server: resource usage not sampled (needs psutil and --server-pid or \"launch\": true)")
+
+# ---------------------------
+# CLI
+# ---------------------------
+def parse_args():
+    p = argparse.ArgumentParser(description="Load-test the AI service with simulated cameras and viewers")
+    p.add_argument("scenario", type=str, help="scenario JSON file")
+    p.add_argument("--server-pid", type=int, default=None, help="pid of an already running service to sample")
+    p.add_argument("--out", type=str, default=None, help="write the JSON report here")
+    p.add_argument("--make-media", action="store_true",
+                   help="generate synthetic media into the scenario's media/ directory and exit")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.make_media:
+        media_dir = os.path.join(os.path.dirname(os.path.abspath(args.scenario)), "media")
+        for path in make_media(media_dir):
+            print(f"[LOAD] Wrote {path}")
+        return
+    scenario = load_scenario(args.scenario)
+    check_media(scenario)
+    report = run_scenario(scenario, server_pid=args.server_pid)
+    print_report(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[LOAD] Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
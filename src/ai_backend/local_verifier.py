@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Local pre-verification of fire alerts before they go to Gemini.
+
+Gemini takes seconds per alert, and many false positives are easy to tell
+apart on the CPU. Orange lighting and sunsets are fire-colored but steady.
+Screens and reflections often have no flame colors at all. For each alert,
+the verifier looks at the detection box:
+
+- color: share of flame-colored pixels (red-yellow hue, saturated, bright,
+  R >= G >= B) plus bright yellow-white flame cores
+- flicker: how much the box changes between recent frames of the same camera,
+  beyond the change of the frame as a whole (flames flicker; lamps, the sky
+  and parked screens don't)
+- an optional small classifier (LOCAL_VERIFY_CLASSIFIER, a YOLO classify model
+  with a "fire" class) scoring the crop
+
+Clear cases are settled on the spot as REAL_FIRE or NOT_REAL_FIRE, the same
+results Gemini returns. Anything ambiguous (including every smoke detection
+the classifier can't settle) is left to Gemini. The rules only reject a fire
+detection when the evidence is plain. A miss costs far more than a Gemini call.
+Grayscale / IR images (no color to judge) and scenes where the whole frame
+moves (no usable flicker reading) always go to Gemini.
+
+Slow feeds such as the owner dashboard (~2 fps) don't fill the flicker window;
+the window is then stretched up to LOCAL_VERIFY_MAX_WINDOW seconds to get
+MIN_FLICKER_FRAMES frames.
+
+Next.js only acts on a verdict it can trust: with LOCAL_CHECK_SECRET set (the
+same value on both sides), each check is signed with an HMAC over imageId,
+result and classifier score. Unsigned or tampered checks are stored as
+advisory and the alert still goes to Gemini.
+
+Measure the share handled locally and the agreement with Gemini on a labeled set:
+
+    python local_verifier.py labeled_cases.json [--gemini] [--classifier fire_cls.pt]
+"""
+
+import os
+import hmac
+import json
+import hashlib
+import time
+import argparse
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# ------------------------------
+# Config
+# ------------------------------
+LOCAL_VERIFY = os.getenv("LOCAL_VERIFY", "0") == "1"
+LOCAL_VERIFY_CLASSIFIER = os.getenv("LOCAL_VERIFY_CLASSIFIER", "")      # "" = color / flicker only
+LOCAL_VERIFY_CLASSIFIER_IMGSZ = int(os.getenv("LOCAL_VERIFY_CLASSIFIER_IMGSZ", "224"))
+LOCAL_VERIFY_WINDOW = float(os.getenv("LOCAL_VERIFY_WINDOW", "2.0"))    # seconds of history used for flicker
+LOCAL_VERIFY_MAX_WINDOW = float(os.getenv("LOCAL_VERIFY_MAX_WINDOW", "4.0"))  # stretched window for slow feeds
+LOCAL_CHECK_SECRET = os.getenv("LOCAL_CHECK_SECRET", "")                # "" = unsigned, Next.js treats checks as advisory
+HISTORY_FRAMES = 24          # downscaled frames kept per camera
+HISTORY_WIDTH = 160          # width of the downscaled history frames
+MIN_FLICKER_FRAMES = 6       # fewer frames in the window: no flicker estimate
+MIN_FLICKER_PIXELS = 8       # box side (in history pixels) needed for a flicker estimate
+BOX_INSET = 3                # skip the drawn box outline when the frame is annotated
+MAX_TRACKED_CAMERAS = 256
+FIRE_CLASSES = {"fire"}                   # classes the color rules apply to
+CLASSIFIER_FIRE_LABELS = ("fire", "real_fire", "REAL_FIRE")
+
+# Flame colors (OpenCV HSV: hue 0-180)
+FLAME_MAX_HUE = 35
+FLAME_MIN_SAT = 80
+FLAME_MIN_VAL = 150
+CORE_MIN_VAL = 230           # bright, washed-out flame core
+MIN_CHROMA_SAT = 12          # mean saturation below this: grayscale / IR image, color rules don't apply
+# Decision thresholds
+COLOR_MIN = 0.03             # fire box with less flame color than this is not a fire
+COLOR_FIRE = 0.20
+FLICKER_STEADY = 0.004       # mean excess change per pixel (0-1) of a steady light
+FLICKER_FIRE = 0.02
+SCENE_MOTION_MAX = 0.03      # mean change per pixel (0-1) of the whole frame above which flicker is unreliable
+CLASSIFIER_NOT_FIRE = 0.05
+CLASSIFIER_UNSURE = 0.5
+CLASSIFIER_FIRE = 0.95
+
+REAL_FIRE = "REAL_FIRE"
+NOT_REAL_FIRE = "NOT_REAL_FIRE"
+
+
+def flame_color_fraction(crop):
+    """
+    Share of flame-colored pixels (including bright flame cores) in a BGR crop,
+    or None when the crop carries no color (grayscale / IR cameras).
+    """
+    if crop.size == 0:
+        return 0.0
+    if crop.ndim < 3 or crop.shape[2] == 1:
+        return None
+    hsv = cv2.cvtColor(crop, cv2.COLOR_BGR2HSV)
+    h, s, v = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    if float(s.mean()) < MIN_CHROMA_SAT:
+        return None
+    b, g, r = crop[..., 0], crop[..., 1], crop[..., 2]
+    ordered = (r >= g) & (g >= b)
+    flame = (h <= FLAME_MAX_HUE) & (s >= FLAME_MIN_SAT) & (v >= FLAME_MIN_VAL)
+    core = (v >= CORE_MIN_VAL) & (r > b)
+    return float(np.count_nonzero(ordered & (flame | core))) / (crop.shape[0] * crop.shape[1])
+
+
+def inset_box(bbox, shape, inset=BOX_INSET):
+    """Integer [x1, y1, x2, y2] clipped to the frame and shrunk by 'inset' where there is room."""
+    h, w = shape[:2]
+    x1, y1, x2, y2 = [int(round(v)) for v in bbox]
+    x1, y1, x2, y2 = max(0, x1), max(0, y1), min(w, x2), min(h, y2)
+    if x2 - x1 > 4 * inset and y2 - y1 > 4 * inset:
+        x1, y1, x2, y2 = x1 + inset, y1 + inset, x2 - inset, y2 - inset
+    return x1, y1, x2, y2
+
+
+class FrameHistory:
+    """Ring of downscaled grayscale frames (and their times) for one camera, in preallocated arrays."""
+
+    def __init__(self, shape, size=HISTORY_FRAMES, width=HISTORY_WIDTH):
+        h, w = shape[:2]
+        self.source_shape = shape[:2]
+        self.scale = min(1.0, width / w)
+        self.size = (max(1, int(w * self.scale)), max(1, int(h * self.scale)))
+        self.frames = np.zeros((size, self.size[1], self.size[0]), dtype=np.uint8)
+        self.times = np.zeros(size)
+        self.count = 0
+        self.next = 0
+
+    def add(self, frame, now):
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=self.frames[self.next])
+        self.times[self.next] = now
+        self.next = (self.next + 1) % len(self.frames)
+        self.count = min(self.count + 1, len(self.frames))
+
+    def recent(self, now, window):
+        """Frames within 'window' seconds of 'now', oldest first."""
+        order = [(self.next - self.count + i) % len(self.frames) for i in range(self.count)]
+        return [self.frames[i] for i in order if now - self.times[i] <= window]
+
+    def flicker(self, bbox, now, window=LOCAL_VERIFY_WINDOW, max_window=LOCAL_VERIFY_MAX_WINDOW):
+        """
+        (flicker, frames used). flicker is the mean per-pixel change (0-1) inside bbox between
+        consecutive recent frames minus the change of the whole frame (camera shake, exposure);
+        negative when the box changes less than the scene. None when there isn't enough history
+        or the whole frame moves too much for a reading.
+        """
+        frames = self.recent(now, window)
+        if len(frames) < MIN_FLICKER_FRAMES and max_window > window:
+            frames = self.recent(now, max_window)[-MIN_FLICKER_FRAMES:]
+        if len(frames) < MIN_FLICKER_FRAMES:
+            return None, len(frames)
+        x1, y1, x2, y2 = [int(round(v * self.scale)) for v in bbox]
+        x1, y1 = max(0, x1), max(0, y1)
+        if min(x2 - x1, y2 - y1) < MIN_FLICKER_PIXELS:
+            return None, len(frames)
+        local = overall = 0.0
+        for prev, cur in zip(frames, frames[1:]):
+            diff = cv2.absdiff(prev, cur)
+            local += float(diff[y1:y2, x1:x2].mean())
+            overall += float(diff.mean())
+        pairs = len(frames) - 1
+        if overall / pairs / 255.0 > SCENE_MOTION_MAX:
+            return None, len(frames)
+        return (local - overall) / pairs / 255.0, len(frames)
+
+
+class VerifierStats:
+    """Thread-safe counts of local results."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.real = 0
+        self.not_real = 0
+        self.forwarded = 0
+        self.time = 0.0
+
+    def record(self, result, elapsed):
+        with self._lock:
+            self.checked += 1
+            self.time += elapsed
+            if result == REAL_FIRE:
+                self.real += 1
+            elif result == NOT_REAL_FIRE:
+                self.not_real += 1
+            else:
+                self.forwarded += 1
+
+    def status(self):
+        with self._lock:
+            checked = max(1, self.checked)
+            return {
+                "checked": self.checked,
+                "real_fire": self.real,
+                "not_real_fire": self.not_real,
+                "forwarded": self.forwarded,
+                "handled_locally": round((self.real + self.not_real) / checked, 4),
+                "mean_ms": round(1000 * self.time / checked, 2),
+            }
+
+
+class LocalVerifier:
+    """
+    observe(camera_id, frame) on every stream frame (before boxes are drawn) keeps the flicker history;
+    verify(frame, detection, camera_id) returns {"result": REAL_FIRE | NOT_REAL_FIRE | None, "reason", ...}.
+    classify(crop), when given, returns the crop's fire probability or None (e.g. while loading).
+    """
+
+    def __init__(self, classify=None, window=LOCAL_VERIFY_WINDOW):
+        self.classify = classify
+        self.window = window
+        self.stats = VerifierStats()
+        self._lock = threading.Lock()
+        self._histories = OrderedDict()   # camera_id -> FrameHistory, least recently fed first
+
+    def observe(self, camera_id, frame, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            history = self._histories.pop(camera_id, None)
+            if history is None or history.source_shape != frame.shape[:2]:
+                history = FrameHistory(frame.shape)
+            self._histories[camera_id] = history
+            while len(self._histories) > MAX_TRACKED_CAMERAS:
+                self._histories.popitem(last=False)
+            history.add(frame, now)
+
+    def _flicker(self, camera_id, bbox, shape, now):
+        with self._lock:
+            history = self._histories.get(camera_id)
+            if history is None or history.source_shape != shape[:2]:
+                return None, 0
+            return history.flicker(bbox, now, self.window)
+
+    def verify(self, frame, detection, camera_id=None, now=None):
+        t0 = time.time()
+        now = t0 if now is None else now
+        x1, y1, x2, y2 = inset_box(detection["bbox"], frame.shape)
+        crop = frame[y1:y2, x1:x2]
+        color = flame_color_fraction(crop)
+        flicker, frames = self._flicker(camera_id, (x1, y1, x2, y2), frame.shape, now)
+        score = self.classify(crop) if self.classify is not None and crop.size else None
+
+        result, reason = decide(detection["class"], color, flicker, frames, score)
+        elapsed = time.time() - t0
+        self.stats.record(result, elapsed)
+        return {
+            "result": result,
+            "reason": reason,
+            "colorFraction": round(color, 4) if color is not None else None,
+            "flicker": round(flicker, 4) if flicker is not None else None,
+            "classifierScore": round(score, 4) if score is not None else None,
+            "ms": round(1000 * elapsed, 2),
+        }
+
+    def status(self):
+        with self._lock:
+            cameras = len(self._histories)
+        return {
+            "window_s": self.window,
+            "classifier": self.classify is not None,
+            "cameras": cameras,
+            **self.stats.status(),
+        }
+
+
+def local_check_message(image_id, check):
+    """The string a check's signature covers; backend.js builds the same one to verify it."""
+    score = check.get("classifierScore")
+    return f"{image_id}|{check.get('result') or ''}|{'' if score is None else f'{score:.4f}'}"
+
+
+def sign_local_check(check, image_id, secret=LOCAL_CHECK_SECRET):
+    """Adds "signature" (hex HMAC-SHA256, None without a secret) binding the check to image_id."""
+    if check is None:
+        return None
+    check["signature"] = hmac.new(secret.encode(), local_check_message(image_id, check).encode(),
+                                  hashlib.sha256).hexdigest() if secret else None
+    return check
+
+
+def decide(class_name, color, flicker, frames, score):
+    """
+    (REAL_FIRE | NOT_REAL_FIRE | None, reason) from the local cues; None leaves the case to Gemini.
+    color is None for images without color, flicker is None without a usable reading.
+    """
+    if color is None:
+        return None, "no color information (grayscale / IR image), needs Gemini"
+    # steady means an excess near zero; a box changing clearly less than the rest of the
+    # scene is not a reading of the light in it
+    steady = flicker is not None and abs(flicker) < FLICKER_STEADY
+    if score is not None and score <= CLASSIFIER_NOT_FIRE:
+        return NOT_REAL_FIRE, f"local classifier: fire probability {score:.2f}"
+    if class_name in FIRE_CLASSES:
+        if color < COLOR_MIN and (score is None or score < CLASSIFIER_FIRE):
+            return NOT_REAL_FIRE, f"almost no flame colors in the detection ({color:.1%})"
+        if steady and (score is None or score < CLASSIFIER_UNSURE):
+            return NOT_REAL_FIRE, f"steady light over {frames} frames, no flame flicker"
+        if color >= COLOR_FIRE and flicker is not None and flicker >= FLICKER_FIRE and (score is None or score >= CLASSIFIER_UNSURE):
+            return REAL_FIRE, f"flame colors ({color:.0%}) flickering over {frames} frames"
+    if score is not None and score >= CLASSIFIER_FIRE and not (steady and class_name in FIRE_CLASSES):
+        return REAL_FIRE, f"local classifier: fire probability {score:.2f}"
+    return None, "ambiguous, needs Gemini"
+
+# ------------------------------
+# Evaluation on a labeled set
+# ------------------------------
+def classifier_from_model(model, imgsz=LOCAL_VERIFY_CLASSIFIER_IMGSZ):
+    """classify(crop) for an ultralytics classification model with a fire class."""
+    names = model.names
+    fire_idx = next((i for i, n in names.items() if n in CLASSIFIER_FIRE_LABELS), None)
+    if fire_idx is None:
+        raise ValueError(f"Classifier has no fire class (classes: {list(names.values())})")
+
+    def classify(crop):
+        probs = model(crop, imgsz=imgsz, verbose=False)[0].probs
+        return float(probs.data[fire_idx])
+
+    return classify
+
+
+def load_cases(path):
+    """
+    Labeled cases from a JSON list of
+    {"image", "label": REAL_FIRE | NOT_REAL_FIRE, "class": "fire", "bbox": [x1, y1, x2, y2],
+     "frames": [frames before the image, oldest first], "fps": 10, "gemini": REAL_FIRE | NOT_REAL_FIRE}.
+    Paths are relative to the JSON file; "bbox" defaults to the whole image; "gemini" is an
+    earlier Gemini result (used unless --gemini asks for fresh ones).
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, "r") as f:
+        cases = json.load(f)
+    for case in cases:
+        case["image"] = os.path.join(base, case["image"])
+        case["frames"] = [os.path.join(base, p) for p in case.get("frames", [])]
+    return cases
+
+
+def evaluate(cases, classify=None, use_gemini=False):
+    """Runs every case locally (and through Gemini if asked) and returns the agreement report."""
+    if use_gemini:
+        from gemini_fire_verifier import verify_fire_with_gemini
+
+    verifier = LocalVerifier(classify)
+    rows = []
+    for i, case in enumerate(cases):
+        image = cv2.imread(case["image"])
+        if image is None:
+            print(f"[VERIFY] ⚠️ Could not read {case['image']}, skipping")
+            continue
+        fps = case.get("fps", 10)
+        t = 0.0
+        for path in case["frames"]:
+            frame = cv2.imread(path)
+            if frame is not None:
+                verifier.observe(i, frame, now=t)
+            t += 1.0 / fps
+        verifier.observe(i, image, now=t)
+        bbox = case.get("bbox") or [0, 0, image.shape[1], image.shape[0]]
+        local = verifier.verify(image, {"class": case.get("class", "fire"), "bbox": bbox}, camera_id=i, now=t)
+
+        gemini = case.get("gemini")
+        if use_gemini:
+            is_fire, _, error = verify_fire_with_gemini(case["image"])
+            gemini = None if error else (REAL_FIRE if is_fire else NOT_REAL_FIRE)
+        rows.append({"image": case["image"], "label": case.get("label"), "local": local["result"],
+                     "reason": local["reason"], "gemini": gemini, "ms": local["ms"]})
+    return build_report(rows, verifier.stats.status())
+
+
+def _share(hits, total):
+    return round(hits / total, 4) if total else None
+
+
+def build_report(rows, stats):
+    handled = [r for r in rows if r["local"]]
+    labeled_handled = [r for r in handled if r["label"]]
+    with_gemini = [r for r in handled if r["gemini"]]
+    labeled_gemini = [r for r in rows if r["label"] and r["gemini"]]
+    # what the pipeline decides: the local result when there is one, Gemini's otherwise
+    final = [r for r in rows if r["label"] and (r["local"] or r["gemini"])]
+    return {
+        "cases": len(rows),
+        "handled_locally": _share(len(handled), len(rows)),
+        "local_real_fire": sum(r["local"] == REAL_FIRE for r in rows),
+        "local_not_real_fire": sum(r["local"] == NOT_REAL_FIRE for r in rows),
+        "local_accuracy": _share(sum(r["local"] == r["label"] for r in labeled_handled), len(labeled_handled)),
+        "local_missed_fires": sum(r["local"] == NOT_REAL_FIRE and r["label"] == REAL_FIRE for r in rows),
+        "agreement_with_gemini": _share(sum(r["local"] == r["gemini"] for r in with_gemini), len(with_gemini)),
+        "gemini_accuracy": _share(sum(r["gemini"] == r["label"] for r in labeled_gemini), len(labeled_gemini)),
+        "pipeline_accuracy": _share(sum((r["local"] or r["gemini"]) == r["label"] for r in final), len(final)),
+        "mean_local_ms": stats["mean_ms"],
+        "rows": rows,
+    }
+
+# ---------------------------
+# CLI
+# ---------------------------
+def parse_args():
+    p = argparse.ArgumentParser(description="Measure local pre-verification against labels and Gemini")
+    p.add_argument("cases", help="JSON list of labeled cases (see load_cases)")
+    p.add_argument("--classifier", type=str, default=LOCAL_VERIFY_CLASSIFIER, help="optional fire classifier (.pt)")
+    p.add_argument("--imgsz", type=int, default=LOCAL_VERIFY_CLASSIFIER_IMGSZ)
+    p.add_argument("--gemini", action="store_true", help="call Gemini for every case instead of using recorded results")
+    p.add_argument("--out", type=str, default=None, help="write the full report (with per-case rows) here")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    classify = None
+    if args.classifier:
+        from model_backend import load_model
+        model, _ = load_model(args.classifier, backend="torch", imgsz=args.imgsz, precision="fp32",
+                              require_approval=False)
+        classify = classifier_from_model(model, args.imgsz)
+    report = evaluate(load_cases(args.cases), classify, use_gemini=args.gemini)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps({k: v for k, v in report.items() if k != "rows"}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
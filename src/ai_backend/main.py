@@ -11,9 +11,17 @@ VIDEO_PATH = r"D:\AgniShakti\AgniShakti\Firefighter s Raw POV.mp4"   # <<--- REP
 
 # Path to your trained YOLOv8 model:
 MODEL_PATH = r"D:\AgniShakti\AgniShakti\best.pt"
+
+# Inference backend: "torch", "onnx", "openvino" or "auto"
+BACKEND = "torch"
+
+# Optional small screener model for cascade inference (None = full detector on every frame)
+SCREENER_PATH = None
+
+# Measure per-frame allocations with tracemalloc during the live run (slower)
+TRACE_ALLOC = False
 # ================================
 
-import torch
 import time
 import argparse
 import os
@@ -23,8 +31,9 @@ import math
 
 import cv2
 import numpy as np
-import pandas as pd 
-from ultralytics import YOLO
+from model_backend import load_model
+from cascade import CascadeDetector, SCREENER_IMGSZ
+from frame_buffers import FrameBuffers, OverlayLayer, AllocStats
 # ---------------------------
 # Utility / Config
 # ---------------------------
@@ -34,6 +43,11 @@ ADAPT_WINDOW = 20          # number of frames to average inference times over
 MIN_SCALE = 0.3            # don't downscale below this fraction of original
 SCALE_STEP = 0.8           # multiply scale by this when reducing quality
 MAX_SKIP = 5               # maximum frames to skip between inference passes
+IOU_THRESHOLDS = [round(0.5 + 0.05 * i, 2) for i in range(10)]   # mAP@0.5:0.95 (COCO)
+CONF_BINS = 1000           # confidence resolution of the streaming AP histograms
+EVAL_REPORT_EVERY = 300    # frames between interim evaluation summaries
+LIVE_LOG_FRAMES = 1000     # per-frame live stats kept per model (older entries are dropped)
+ALLOC_REPORT_EVERY = 0     # frames between live allocation reports (0 = only at the end)
 
 # Colors for boxes (BGR)
 BOX_COLOR = (0, 0, 255)    # red for fire/smoke
@@ -74,54 +88,290 @@ def box_iou(boxA, boxB):
         return 0.0
     return interArea / union
 
+def count_matches(boxes, refs, iou_threshold=0.5):
+    """
+    One-to-one greedy matching of boxes against reference boxes.
+    Each box claims its best-IoU reference; a reference can only be claimed once.
+    Returns the number of matched boxes.
+    """
+    ref_matched = [False]*len(refs)
+    matched = 0
+    for b in boxes:
+        best_iou = 0
+        best_j = -1
+        for j, g in enumerate(refs):
+            iou = box_iou(b, g[:4])
+            if iou > best_iou:
+                best_iou = iou
+                best_j = j
+        if best_iou >= iou_threshold and not ref_matched[best_j]:
+            ref_matched[best_j] = True
+            matched += 1
+    return matched
+
+def count_class_matches(boxes, classes, ref_boxes, ref_classes, iou_threshold=0.5):
+    """Like count_matches, but only boxes of the same class can match."""
+    matched = 0
+    for cls in set(classes) & set(ref_classes):
+        own = [b for b, c in zip(boxes, classes) if c == cls]
+        ref = [b for b, c in zip(ref_boxes, ref_classes) if c == cls]
+        matched += count_matches(own, ref, iou_threshold)
+    return matched
+
+def average_precision(tp_hist, det_hist, n_gt):
+    """
+    COCO-style 101-point AP from confidence histograms (bin 0 = lowest confidence).
+    tp_hist / det_hist: true positives / all detections per confidence bin.
+    """
+    if n_gt == 0:
+        return None
+    tp = np.cumsum(tp_hist[::-1])
+    det = np.cumsum(det_hist[::-1])
+    if det.size == 0 or det[-1] == 0:
+        return 0.0
+    precision = tp / np.maximum(det, 1)
+    recall = tp / n_gt
+    # precision envelope: best precision at this recall or higher
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    idx = np.searchsorted(recall, np.linspace(0, 1, 101), side="left")
+    return float(np.mean([precision[i] if i < len(precision) else 0.0 for i in idx]))
+
+class StreamingEvaluator:
+    """
+    Constant-memory metrics for one model over a video.
+    Per class, detections are matched to ground truth in descending confidence order at every
+    IoU threshold and only counted into CONF_BINS confidence bins, so precision / recall and
+    mAP@0.5 / mAP@0.5:0.95 can be read at any frame without keeping per-frame data.
+    """
+
+    def __init__(self, iou_threshold=0.5, class_names=None):
+        self.thresholds = sorted(set(IOU_THRESHOLDS) | {round(iou_threshold, 2)})
+        self.primary = self.thresholds.index(round(iou_threshold, 2))
+        # class id -> name; ultralytics models expose a dict, callers may pass a list
+        if isinstance(class_names, dict):
+            self.class_names = {int(i): n for i, n in class_names.items()}
+        else:
+            self.class_names = dict(enumerate(class_names or []))
+        self._class_ids = {n: i for i, n in self.class_names.items()}
+        self.frames = 0
+        self.gt_frames = 0
+        self.infer_time = 0.0
+        self.detections = 0
+        self.conf_sum = 0.0   # sum of per-frame mean confidences
+        self.classes = {}     # class -> {"tp_hist", "det_hist", "n_gt", "tp"}
+
+    def _class(self, cls):
+        if cls not in self.classes:
+            self.classes[cls] = {
+                "tp_hist": np.zeros((len(self.thresholds), CONF_BINS), dtype=np.int64),
+                "det_hist": np.zeros(CONF_BINS, dtype=np.int64),
+                "n_gt": 0,
+                "tp": 0,
+            }
+        return self.classes[cls]
+
+    def _gt_class(self, cls):
+        """Model class id for a GT class given as an id or a name (GT files may name classes)."""
+        if isinstance(cls, str) and cls in self._class_ids:
+            return self._class_ids[cls]
+        try:
+            return int(cls)
+        except (TypeError, ValueError):
+            raise ValueError(f"Unknown ground-truth class {cls!r}; model classes are "
+                             f"{sorted(self._class_ids)}") from None
+
+    def add_frame(self, infer_time, boxes, confs, classes, gts=None):
+        """
+        Accumulates one frame. gts: [[x1,y1,x2,y2,class], ...] or None when the frame isn't annotated.
+        Returns (tp, fp, fn) at the primary IoU threshold, or (None, None, None) without GT.
+        """
+        n_det = len(boxes)
+        self.frames += 1
+        self.infer_time += infer_time
+        self.detections += n_det
+        self.conf_sum += sum(confs) / n_det if n_det else 0.0
+        if gts is None:
+            return None, None, None
+
+        self.gt_frames += 1
+        dets_by_class = defaultdict(list)
+        for box, conf, cls in zip(boxes, confs, classes):
+            dets_by_class[cls].append((conf, box))
+        gts_by_class = defaultdict(list)
+        for g in gts:
+            gts_by_class[self._gt_class(g[4])].append(g[:4])
+
+        tp_frame = 0
+        for cls in set(dets_by_class) | set(gts_by_class):
+            stats = self._class(cls)
+            dets = sorted(dets_by_class.get(cls, []), key=lambda d: -d[0])
+            refs = gts_by_class.get(cls, [])
+            stats["n_gt"] += len(refs)
+            if not dets:
+                continue
+            bins = [min(int(conf * CONF_BINS), CONF_BINS - 1) for conf, _ in dets]
+            np.add.at(stats["det_hist"], bins, 1)
+            if not refs:
+                continue
+            ious = [[box_iou(box, g) for g in refs] for _, box in dets]
+            for t, thr in enumerate(self.thresholds):
+                claimed = [False] * len(refs)
+                for i, row in enumerate(ious):
+                    best_j, best_iou = -1, thr
+                    for j, iou in enumerate(row):
+                        if not claimed[j] and iou >= best_iou:
+                            best_j, best_iou = j, iou
+                    if best_j >= 0:
+                        claimed[best_j] = True
+                        stats["tp_hist"][t, bins[i]] += 1
+                        if t == self.primary:
+                            stats["tp"] += 1
+                            tp_frame += 1
+        return tp_frame, n_det - tp_frame, len(gts) - tp_frame
+
+    def _class_label(self, cls):
+        if isinstance(cls, int) and cls in self.class_names:
+            return self.class_names[cls]
+        return str(cls)
+
+    def per_class(self):
+        """Per-class TP / FP / FN at the primary IoU threshold plus AP@0.5 and AP@0.5:0.95."""
+        out = {}
+        for cls, st in self.classes.items():
+            n_det = int(st["det_hist"].sum())
+            aps = [average_precision(st["tp_hist"][self.thresholds.index(t)], st["det_hist"], st["n_gt"])
+                   for t in IOU_THRESHOLDS]
+            out[self._class_label(cls)] = {
+                "tp": st["tp"],
+                "fp": n_det - st["tp"],
+                "fn": st["n_gt"] - st["tp"],
+                "ap50": aps[0],
+                "ap50_95": float(np.mean(aps)) if st["n_gt"] else None,
+            }
+        return out
+
+    def summary(self):
+        frames = max(1, self.frames)
+        out = {
+            "frames": self.frames,
+            "mean_infer_time_s": self.infer_time / frames,
+            "detections_per_frame": self.detections / frames,
+            "mean_confidence": self.conf_sum / frames,
+            "precision": None, "recall": None, "map50": None, "map50_95": None,
+            "tp": None, "n_gt": None,
+        }
+        if not self.gt_frames:
+            return out
+        per_class = self.per_class().values()
+        TP = sum(c["tp"] for c in per_class)
+        FP = sum(c["fp"] for c in per_class)
+        FN = sum(c["fn"] for c in per_class)
+        out["precision"] = TP / (TP + FP) if (TP + FP) > 0 else 0.0
+        out["recall"] = TP / (TP + FN) if (TP + FN) > 0 else 0.0
+        out["tp"] = TP
+        out["n_gt"] = TP + FN
+        # classes without any ground truth don't count towards mAP
+        scored = [c for c in per_class if c["ap50"] is not None]
+        if scored:
+            out["map50"] = float(np.mean([c["ap50"] for c in scored]))
+            out["map50_95"] = float(np.mean([c["ap50_95"] for c in scored]))
+        return out
+
 # ---------------------------
 # Core inference loop
 # ---------------------------
 class InferenceRunner:
-    def __init__(self, model_paths, class_names=None, device=None, imgsz=DEFAULT_IMG_SIZE, save_log_dir="logs"):
+    def __init__(self, model_paths, class_names=None, device=None, imgsz=DEFAULT_IMG_SIZE, save_log_dir="logs", backends=None,
+                 require_approval=True, screener_path=None, screener_imgsz=SCREENER_IMGSZ):
         """
         model_paths: list of .pt strings (can be single)
-        class_names: optional list mapping class ids to names
+        class_names: optional list mapping class ids to names (default: the first model's names)
+        backends: optional list of backends ("torch", "onnx", "openvino", "auto"), optionally with a
+                  precision ("onnx:int8", "openvino:fp16"). Each model is loaded once per backend, so a
+                  single .pt with backends=["torch", "onnx"] compares the two runtimes.
+        require_approval: set False to load reduced-precision variants that haven't passed validation yet
+        screener_path: optional small model; when set, run_live runs it on every frame and the
+                       detector only on frames where it reports fire/smoke candidates (see cascade.py)
         """
         if isinstance(model_paths, str):
             model_paths = [model_paths]
+        if isinstance(backends, str):
+            backends = [backends]
+        backends = backends or ["torch"]
+        import torch  # deferred so the CLI / helpers don't pay for it
         device = "cuda" if torch.cuda.is_available() else "cpu"
         print(f"[INFO] Using device: {device}")
-        self.models = [YOLO(m).to(device) for m in model_paths]  # loads model(s)
-        self.model_paths = model_paths
-        self.class_names = class_names or []
+        self.models = []
+        self.model_paths = []
+        self.backends = []
+        for m in model_paths:
+            for b in backends:
+                model, backend = load_model(m, backend=b, imgsz=imgsz, device=device, require_approval=require_approval)
+                self.models.append(model)
+                self.model_paths.append(m)
+                self.backends.append(backend)
+        # label used for logs / CSV names; only carries the backend when comparing runtimes
+        if len(backends) > 1:
+            self.model_labels = [f"{m}[{b}]" for m, b in zip(self.model_paths, self.backends)]
+        else:
+            self.model_labels = list(self.model_paths)
+        self.screener = None
+        if screener_path:
+            self.screener, _ = load_model(screener_path, backend=backends[0], imgsz=screener_imgsz, device=device,
+                                          require_approval=require_approval)
+        self.screener_imgsz = screener_imgsz
+        self.cascades = {}  # model index -> CascadeDetector
+        # default to the model's own names so name-labelled GT matches class ids
+        self.class_names = class_names or [self.models[0].names[i] for i in sorted(self.models[0].names)]
         self.imgsz = imgsz
         self.save_log_dir = save_log_dir
         safe_mkdir(save_log_dir)
         # stats
         self.infer_times = [deque(maxlen=ADAPT_WINDOW) for _ in self.models]
         self.frame_count = 0
-        self.logs = defaultdict(list)  # per-model lists of per-frame stats
+        self.logs = defaultdict(lambda: deque(maxlen=LIVE_LOG_FRAMES))  # per-model recent per-frame stats
 
     def _infer_frame(self, model_index, frame):
         """Run inference on a single frame and return boxes, confs, classes."""
-        model = self.models[model_index]
+        return self._predict(self.models[model_index], frame, self.imgsz)
+
+    def _predict(self, model, frame, imgsz):
         t0 = time.time()
         # ultralytics: model(frame) returns Results object or list
-        results = model(frame, imgsz=self.imgsz, verbose=False)  # returns list-like of Results
+        results = model(frame, imgsz=imgsz, verbose=False)  # returns list-like of Results
         t1 = time.time()
         infer_time = t1 - t0
         # parse results[0].boxes
         r = results[0]
-        boxes = []
-        confs = []
-        classes = []
-        if hasattr(r, "boxes") and r.boxes is not None:
-            for b in r.boxes:
-                # b.xyxy, b.conf, b.cls
-                xyxy = b.xyxy.cpu().numpy().flatten().tolist()  # flatten in case it’s 2D
-                conf = float(b.conf.item())  # safely get scalar
-                cls = int(b.cls.item())
-                boxes.append(xyxy)
-                confs.append(conf)
-                classes.append(cls)
+        boxes, confs, classes = [], [], []
+        if hasattr(r, "boxes") and r.boxes is not None and len(r.boxes):
+            # one device -> host transfer per field instead of one per box
+            boxes = r.boxes.xyxy.cpu().numpy().reshape(-1, 4).tolist()
+            confs = r.boxes.conf.cpu().numpy().ravel().tolist()
+            classes = r.boxes.cls.cpu().numpy().astype(int).ravel().tolist()
         return boxes, confs, classes, infer_time
 
+    def _cascade(self, model_index):
+        if model_index not in self.cascades:
+            def screen(frame):
+                boxes, confs, classes, _ = self._predict(self.screener, frame, self.screener_imgsz)
+                return [{"class": self.screener.names[c], "confidence": p, "bbox": b}
+                        for b, p, c in zip(boxes, confs, classes)]
+
+            def detect(frame):
+                boxes, confs, classes, _ = self._infer_frame(model_index, frame)
+                return [{"class": c, "confidence": p, "bbox": b} for b, p, c in zip(boxes, confs, classes)]
+
+            self.cascades[model_index] = CascadeDetector(screen, detect)
+        return self.cascades[model_index]
+
+    def _infer_cascade(self, model_index, frame):
+        """Like _infer_frame, but the detector only runs where the screener finds candidates."""
+        t0 = time.time()
+        dets = self._cascade(model_index).run(frame)
+        infer_time = time.time() - t0
+        return [d["bbox"] for d in dets], [d["confidence"] for d in dets], [d["class"] for d in dets], infer_time
+
     def adaptive_control(self, times_deque, current_scale, current_skip):
         """Given a deque of recent inference times, decide whether to scale down or skip frames more."""
         if len(times_deque) == 0:
@@ -144,11 +394,16 @@ class InferenceRunner:
                 current_scale = min(1.0, current_scale / SCALE_STEP)  # slightly increase scale
         return current_scale, current_skip
 
-    def run_live(self, source=0, use_webcam=False, model_index=0, show=True):
+    def run_live(self, source=0, use_webcam=False, model_index=0, show=True, trace_alloc=False,
+                 alloc_report_every=ALLOC_REPORT_EVERY):
         """
         source: video path or RTSP or webcam index
         model_index: which model to run (0-based). If multiple models are provided and you want to compare,
                      use evaluate_models() instead.
+        trace_alloc: measure bytes allocated per frame with tracemalloc (slower; for profiling runs)
+        alloc_report_every: print allocation stats every N frames (0 = only at the end)
+        Frames are decoded and resized into reused buffers, and boxes / status text live on an
+        overlay layer that is redrawn only after inference and stamped onto every displayed frame.
         """
         if use_webcam:
             cap = cv2.VideoCapture(int(source), cv2.CAP_DSHOW)
@@ -159,178 +414,237 @@ class InferenceRunner:
         orig_w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         orig_h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         print(f"[INFO] opened source: {source}, resolution {orig_w}x{orig_h}")
+        infer = self._infer_cascade if self.screener is not None else self._infer_frame
 
         scale = 1.0
         skip = 0
         frame_idx = 0
-        last_drawn_frame = None
-
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                print("[INFO] End of stream or cannot read frame.")
-                break
-            frame_idx += 1
-
-            # decide whether to run inference on this frame (skipping to maintain speed)
-            if frame_idx % (skip + 1) != 0 and last_drawn_frame is not None:
-                # reuse last drawn frame for display, optionally update timestamp overlay
-                if show:
-                    display = last_drawn_frame.copy()
-                    now = time.strftime("%Y-%m-%d %H:%M:%S")
-                    cv2.putText(display, f"FPS(Target={TARGET_FPS}) Skip={skip} Scale={scale:.2f}",
-                                (10, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-                    cv2.imshow("Detection", display)
-                    if cv2.waitKey(1) & 0xFF == ord('q'):
-                        break
-                continue
+        frame = None
+        buffers = FrameBuffers()
+        overlay = OverlayLayer(buffers)
+        alloc = AllocStats(trace=trace_alloc)
 
-            # optionally resize (scale) before inference
-            if scale < 1.0:
-                small = cv2.resize(frame, (int(frame.shape[1]*scale), int(frame.shape[0]*scale)))
-            else:
-                small = frame
-
-            # inference
-            boxes, confs, classes, infer_time = self._infer_frame(model_index, small)
-            # adjust boxes back to original coordinates if scaled
-            if scale != 1.0 and len(boxes) > 0:
-                factor_x = frame.shape[1] / small.shape[1]
-                factor_y = frame.shape[0] / small.shape[0]
-                boxes = [[b[0]*factor_x, b[1]*factor_y, b[2]*factor_x, b[3]*factor_y] for b in boxes]
-
-            # log stats
-            self.infer_times[model_index].append(infer_time)
-            self.logs[self.model_paths[model_index]].append({
-                "frame": frame_idx,
-                "infer_time": infer_time,
-                "n_detections": len(boxes),
-                "mean_conf": (sum(confs)/len(confs) if confs else 0.0)
-            })
-            self.frame_count += 1
-
-            # draw on frame to display
-            display = frame.copy()
-            if boxes:
-                draw_boxes(display, boxes, confs, classes, class_names=self.class_names)
-            now = time.strftime("%Y-%m-%d %H:%M:%S")
-            cv2.putText(display, f"FPS(Target={TARGET_FPS}) Skip={skip} Scale={scale:.2f}",
-                        (10, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-            cv2.putText(display, f"Model: {os.path.basename(self.model_paths[model_index])}",
-                        (10, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 200, 200), 1)
-
-            last_drawn_frame = display.copy()
-            if show:
-                cv2.imshow("Detection", display)
-                if cv2.waitKey(1) & 0xFF == ord('q'):
+        try:
+            while True:
+                alloc.frame_start()
+                # decode into the previous frame's array (OpenCV reallocates only if the size changes)
+                ret, frame = cap.read(frame) if frame is not None else cap.read()
+                if not ret:
+                    print("[INFO] End of stream or cannot read frame.")
                     break
+                frame_idx += 1
 
-            # adaptive control based on recent inference times
-            scale, skip = self.adaptive_control(self.infer_times[model_index], scale, skip)
+                # decide whether to run inference on this frame (skipping to maintain speed)
+                if frame_idx % (skip + 1) != 0 and overlay.ready:
+                    # show the new frame with the last pass's boxes and status
+                    if show:
+                        overlay.composite(frame)
+                        cv2.imshow("Detection", frame)
+                        if cv2.waitKey(1) & 0xFF == ord('q'):
+                            break
+                    alloc.frame_end()
+                    continue
+
+                # optionally resize (scale) before inference
+                if scale < 1.0:
+                    small = buffers.resize(frame, (int(frame.shape[1]*scale), int(frame.shape[0]*scale)), name="small")
+                else:
+                    small = frame
+
+                # inference
+                boxes, confs, classes, infer_time = infer(model_index, small)
+                # adjust boxes back to original coordinates if scaled
+                if scale != 1.0 and len(boxes) > 0:
+                    factor_x = frame.shape[1] / small.shape[1]
+                    factor_y = frame.shape[0] / small.shape[0]
+                    boxes = [[b[0]*factor_x, b[1]*factor_y, b[2]*factor_x, b[3]*factor_y] for b in boxes]
+
+                # log stats
+                self.infer_times[model_index].append(infer_time)
+                self.logs[self.model_labels[model_index]].append({
+                    "frame": frame_idx,
+                    "infer_time": infer_time,
+                    "n_detections": len(boxes),
+                    "mean_conf": (sum(confs)/len(confs) if confs else 0.0)
+                })
+                self.frame_count += 1
+
+                # redraw the overlay layer, then stamp it onto the frame for display
+                layer = overlay.begin(frame.shape)
+                if boxes:
+                    draw_boxes(layer, boxes, confs, classes, class_names=self.class_names)
+                cv2.putText(layer, f"FPS(Target={TARGET_FPS}) Skip={skip} Scale={scale:.2f}",
+                            (10, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+                cv2.putText(layer, f"Model: {os.path.basename(self.model_labels[model_index])}",
+                            (10, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 200, 200), 1)
+                if self.screener is not None:
+                    cs = self.cascades[model_index].stats.status()
+                    cv2.putText(layer, f"Cascade: pass={cs['pass_through_rate']:.0%} screen={cs['screener_ms']:.1f}ms "
+                                       f"detect={cs['detector_ms']:.1f}ms",
+                                (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 200, 200), 1)
+                overlay.finish()
 
-        cap.release()
-        if show:
-            cv2.destroyAllWindows()
+                if show:
+                    overlay.composite(frame)
+                    cv2.imshow("Detection", frame)
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        break
 
-    def evaluate_models_on_video(self, video_path, save_csv=True, gt_annotations=None, iou_threshold=0.5):
+                # adaptive control based on recent inference times
+                scale, skip = self.adaptive_control(self.infer_times[model_index], scale, skip)
+                alloc.frame_end()
+                if alloc_report_every and alloc.frames % alloc_report_every == 0:
+                    print(f"[INFO] allocation stats: {alloc.report(buffers)}")
+        finally:
+            cap.release()
+            if show:
+                cv2.destroyAllWindows()
+            alloc.close()
+        print(f"[INFO] allocation stats: {alloc.report(buffers)}")
+        if self.screener is not None:
+            print(f"[INFO] cascade stats: {self._cascade(model_index).status()}")
+
+    def evaluate_models_on_video(self, video_path, save_csv=True, gt_annotations=None, iou_threshold=0.5, reference_index=0,
+                                 report_every=EVAL_REPORT_EVERY):
         """
         Run each model on the same video, log basic metrics.
         gt_annotations: optional dict mapping frame_idx -> list of gt boxes [[x1,y1,x2,y2,class], ...]
-                        If provided, compute IoU-based precision/recall (one-to-one greedy matching).
+                        If provided, compute per-class precision/recall at iou_threshold and
+                        mAP@0.5 / mAP@0.5:0.95 (confidence-ordered greedy matching).
+        reference_index: model whose detections the others are compared against. Every model sees
+                         the same decoded frame, so 'agreement' (F1 of same-class IoU matches vs the
+                         reference) and 'speedup_vs_reference' show what a backend swap costs.
+        report_every: print running summaries every N frames (0 = only at the end)
+        With a screener, the reference model is also evaluated through the cascade (extra
+        "<label>[cascade]" row) so its recall and speedup can be compared with the detector alone.
+        Metrics are accumulated as frames go by and per-frame CSV rows are written immediately,
+        so memory doesn't grow with video length.
         Returns a pandas DataFrame with summary stats for each model.
         """
-        summaries = []
-        for midx, model_path in enumerate(self.model_paths):
-            print(f"[EVAL] Running model {model_path} on {video_path}")
-            cap = cv2.VideoCapture(video_path)
-            if not cap.isOpened():
-                print(f"[EVAL] Cannot open {video_path}")
-                continue
-            frame_idx = 0
-            per_frame_stats = []
+        import pandas as pd
+
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            print(f"[EVAL] Cannot open {video_path}")
+            return pd.DataFrame()
+        labels = list(self.model_labels)
+        paths = list(self.model_paths)
+        backends = list(self.backends)
+        if self.screener is not None:
+            labels.append(f"{labels[reference_index]}[cascade]")
+            paths.append(paths[reference_index])
+            backends.append(f"{backends[reference_index]}+cascade")
+        for label in labels:
+            print(f"[EVAL] Running model {label} on {video_path}")
+
+        n_models = len(labels)
+        evaluators = [StreamingEvaluator(iou_threshold, self.class_names) for _ in range(n_models)]
+        agree_matched = [0]*n_models
+        agree_total = [0]*n_models
+
+        csv_files = []
+        writers = []
+        if save_csv:
+            for label in labels:
+                out_csv = os.path.join(self.save_log_dir, f"perframe_{os.path.basename(label).replace(':', '-')}.csv")
+                f = open(out_csv, "w", newline="")
+                writer = csv.writer(f)
+                writer.writerow(["frame", "infer_time", "n_detections", "mean_conf", "tp", "fp", "fn"])
+                csv_files.append(f)
+                writers.append(writer)
+
+        frame_idx = 0
+        try:
             while True:
                 ret, frame = cap.read()
                 if not ret:
                     break
                 frame_idx += 1
-                boxes, confs, classes, inf_t = self._infer_frame(midx, frame)
-                n_det = len(boxes)
-                mean_conf = sum(confs) / n_det if n_det else 0.0
-                matched = 0
-                tp = 0
-                fp = 0
-                fn = 0
-                if gt_annotations and frame_idx in gt_annotations:
-                    gts = gt_annotations[frame_idx]
-                    gt_matched = [False]*len(gts)
-                    for b in boxes:
-                        best_iou = 0
-                        best_j = -1
-                        for j, g in enumerate(gts):
-                            iou = box_iou(b, g[:4])
-                            if iou > best_iou:
-                                best_iou = iou
-                                best_j = j
-                        if best_iou >= iou_threshold:
-                            if not gt_matched[best_j]:
-                                tp += 1
-                                gt_matched[best_j] = True
-                            else:
-                                fp += 1
-                        else:
-                            fp += 1
-                    fn = sum(1 for matched_flag in gt_matched if not matched_flag)
-                else:
-                    # Without GT we cannot compute precision/recall
-                    tp = fp = fn = None
-
-                per_frame_stats.append({
-                    "frame": frame_idx,
-                    "infer_time": inf_t,
-                    "n_detections": n_det,
-                    "mean_conf": mean_conf,
-                    "tp": tp, "fp": fp, "fn": fn
-                })
+                outputs = [self._infer_frame(midx, frame) for midx in range(len(self.models))]
+                if self.screener is not None:
+                    outputs.append(self._infer_cascade(reference_index, frame))
+                ref_boxes, _, ref_classes, _ = outputs[reference_index]
+                gts = gt_annotations.get(frame_idx) if gt_annotations else None
+
+                for midx, (boxes, confs, classes, inf_t) in enumerate(outputs):
+                    n_det = len(boxes)
+                    # Without GT for this frame tp/fp/fn stay None
+                    tp, fp, fn = evaluators[midx].add_frame(inf_t, boxes, confs, classes, gts)
+
+                    agree_matched[midx] += 2 * count_class_matches(boxes, classes, ref_boxes, ref_classes, iou_threshold)
+                    agree_total[midx] += n_det + len(ref_boxes)
+
+                    if writers:
+                        mean_conf = sum(confs) / n_det if n_det else 0.0
+                        writers[midx].writerow([frame_idx, inf_t, n_det, mean_conf, tp, fp, fn])
+
+                if report_every and frame_idx % report_every == 0:
+                    for f in csv_files:
+                        f.flush()
+                    for midx, label in enumerate(labels):
+                        print(f"[EVAL] frame {frame_idx}: {label} {self._format_interim(evaluators[midx].summary())}")
+        finally:
             cap.release()
+            for f in csv_files:
+                f.close()
+                print(f"[EVAL] saved per-frame CSV: {f.name}")
 
-            df = pd.DataFrame(per_frame_stats)
-            mean_infer = df['infer_time'].mean()
-            detections_per_frame = df['n_detections'].mean()
-            mean_conf = df['mean_conf'].mean()
-
-            # compute aggregated precision/recall if GT present
-            if gt_annotations:
-                TP = df['tp'].sum()
-                FP = df['fp'].sum()
-                FN = df['fn'].sum()
-                precision = TP / (TP + FP) if (TP + FP) > 0 else 0.0
-                recall = TP / (TP + FN) if (TP + FN) > 0 else 0.0
-            else:
-                precision = recall = None
+        summaries = []
+        for midx, label in enumerate(labels):
+            ev = evaluators[midx]
+            if not ev.frames:
+                continue
+            stats = ev.summary()
+            # both models found nothing on every frame -> full agreement
+            agreement = agree_matched[midx] / agree_total[midx] if agree_total[midx] else 1.0
 
             summary = {
-                "model": model_path,
-                "mean_infer_time_s": mean_infer,
-                "detections_per_frame": detections_per_frame,
-                "mean_confidence": mean_conf,
-                "precision": precision,
-                "recall": recall
+                "model": paths[midx],
+                "backend": backends[midx],
+                "mean_infer_time_s": stats["mean_infer_time_s"],
+                "detections_per_frame": stats["detections_per_frame"],
+                "mean_confidence": stats["mean_confidence"],
+                "precision": stats["precision"],
+                "recall": stats["recall"],
+                "map50": stats["map50"],
+                "map50_95": stats["map50_95"],
+                "tp": stats["tp"],
+                "n_gt": stats["n_gt"],
+                "agreement": agreement
             }
             summaries.append(summary)
 
-            # save per-frame csv for this model
-            if save_csv:
-                out_csv = os.path.join(self.save_log_dir, f"perframe_{os.path.basename(model_path)}.csv")
-                df.to_csv(out_csv, index=False)
-                print(f"[EVAL] saved per-frame CSV: {out_csv}")
-
+            # per-class breakdown when GT is available
+            if save_csv and ev.gt_frames:
+                out_csv = os.path.join(self.save_log_dir, f"perclass_{os.path.basename(label).replace(':', '-')}.csv")
+                with open(out_csv, "w", newline="") as f:
+                    writer = csv.writer(f)
+                    writer.writerow(["class", "tp", "fp", "fn", "ap50", "ap50_95"])
+                    for name, c in ev.per_class().items():
+                        writer.writerow([name, c["tp"], c["fp"], c["fn"], c["ap50"], c["ap50_95"]])
+                print(f"[EVAL] saved per-class CSV: {out_csv}")
+
+        if self.screener is not None:
+            print(f"[EVAL] cascade stats: {self._cascade(reference_index).status()}")
         summary_df = pd.DataFrame(summaries)
+        if not summary_df.empty:
+            ref_infer = summary_df.loc[reference_index, 'mean_infer_time_s']
+            summary_df['speedup_vs_reference'] = ref_infer / summary_df['mean_infer_time_s']
         if save_csv:
             summary_csv = os.path.join(self.save_log_dir, "summary_models.csv")
             summary_df.to_csv(summary_csv, index=False)
             print(f"[EVAL] saved summary CSV: {summary_csv}")
         return summary_df
 
+    @staticmethod
+    def _format_interim(stats):
+        line = f"infer={stats['mean_infer_time_s']*1000:.1f}ms det/frame={stats['detections_per_frame']:.2f}"
+        if stats["precision"] is not None:
+            line += f" P={stats['precision']:.3f} R={stats['recall']:.3f}"
+        if stats["map50"] is not None:
+            line += f" mAP50={stats['map50']:.3f} mAP50-95={stats['map50_95']:.3f}"
+        return line
+
 # ---------------------------
 # CLI
 # ---------------------------
@@ -343,18 +657,23 @@ def parse_args():
     p.add_argument("--compare", action="store_true", help="run evaluation of multiple models on video (--models required)")
     p.add_argument("--imgsz", type=int, default=DEFAULT_IMG_SIZE, help="inference image size for model (default 640)")
     p.add_argument("--save_logs", type=str, default="logs", help="directory to save csv logs")
+    p.add_argument("--backends", nargs='+', default=["torch"], help="inference backends: torch, onnx, openvino or auto, optionally with :fp16/:int8 (several = compare)")
+    p.add_argument("--screener", type=str, default=None, help="small screener model; enables cascade inference")
+    p.add_argument("--screener_imgsz", type=int, default=SCREENER_IMGSZ, help="screener image size (default 320)")
+    p.add_argument("--trace_alloc", action="store_true", help="measure bytes allocated per live frame with tracemalloc")
     return p.parse_args()
 def main():
     # Load your model (auto GPU if available)
-    runner = InferenceRunner([MODEL_PATH], imgsz=DEFAULT_IMG_SIZE, save_log_dir="logs")
+    runner = InferenceRunner([MODEL_PATH], imgsz=DEFAULT_IMG_SIZE, save_log_dir="logs", backends=[BACKEND],
+                             screener_path=SCREENER_PATH)
 
     if TEST_MODE == "video":
         print(f"[MAIN] Running on video file: {VIDEO_PATH}")
-        runner.run_live(source=VIDEO_PATH, use_webcam=False, model_index=0, show=True)
+        runner.run_live(source=VIDEO_PATH, use_webcam=False, model_index=0, show=True, trace_alloc=TRACE_ALLOC)
 
     elif TEST_MODE == "webcam":
         print("[MAIN] Running on webcam (index 0)")
-        runner.run_live(source=0, use_webcam=True, model_index=0, show=True)
+        runner.run_live(source=0, use_webcam=True, model_index=0, show=True, trace_alloc=TRACE_ALLOC)
 
     else:
         print("ERROR: Invalid TEST_MODE. Please choose 'video' or 'webcam' at the top of the script.")
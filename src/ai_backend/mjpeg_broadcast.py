@@ -0,0 +1,301 @@
+"""
+Shared MJPEG broadcasting with per-client profiles.
+
+All viewers of one source share a single inference loop. Each processed frame
+is encoded once per distinct (resolution, quality) profile that has a viewer
+due for a frame, and handed to viewers through a one-frame mailbox: a slow
+client simply misses frames (counted as drops) instead of stalling the producer.
+Adaptive viewers step down / up a profile ladder based on those drops.
+Producers also feed the incident clip recorder (clip_recorder.py), reusing
+an encode made for viewers whenever there is one.
+"""
+
+import time
+import threading
+from collections import namedtuple
+
+import cv2
+
+from frame_buffers import FrameBuffers
+
+# ------------------------------
+# Profiles
+# ------------------------------
+# max_width / max_height of 0 keep the source size, quality 0 keeps OpenCV's default,
+# max_fps 0 means as fast as the source produces frames.
+StreamProfile = namedtuple("StreamProfile", ["name", "max_width", "max_height", "quality", "max_fps"])
+
+# Ordered best -> worst; adaptive viewers move along this ladder
+PROFILE_LADDER = [
+    StreamProfile("full", 0, 0, 0, 0),
+    StreamProfile("high", 1280, 720, 80, 15),
+    StreamProfile("medium", 854, 480, 70, 10),
+    StreamProfile("low", 640, 360, 60, 5),
+    StreamProfile("minimal", 426, 240, 50, 2),
+]
+PROFILES = {p.name: p for p in PROFILE_LADDER}
+# Preferred encode for incident clip buffers; used when no viewer encoded the frame
+CLIP_PROFILE = PROFILES["medium"]
+
+ADAPT_WINDOW_SECONDS = 3.0      # drop ratio is measured over this window
+DOWNGRADE_DROP_RATIO = 0.3      # step down when more than this share of frames is dropped
+UPGRADE_AFTER_SECONDS = 10.0    # step back up after this long without drops
+SUBSCRIBER_TIMEOUT = 30.0       # give up on a viewer that hasn't had a frame for this long
+
+
+def resolve_profile(name=None, max_width=0, max_height=0, quality=0, max_fps=0):
+    """
+    Builds the viewer's profile from a preset name and/or explicit limits.
+    Returns (profile, adaptive); name "auto" starts at "full" and adapts.
+    """
+    adaptive = name == "auto"
+    base = PROFILES.get(name or "full", PROFILES["full"]) if not adaptive else PROFILES["full"]
+    profile = StreamProfile(
+        "custom" if (max_width or max_height or quality or max_fps) else base.name,
+        max_width or base.max_width,
+        max_height or base.max_height,
+        quality or base.quality,
+        max_fps or base.max_fps,
+    )
+    return profile, adaptive
+
+
+def encode_key(profile):
+    """Viewers whose profiles share a key share the encoded bytes."""
+    return (profile.max_width, profile.max_height, profile.quality)
+
+
+def encode_frame(frame, profile, buffers=None):
+    """
+    Downscales (never upscales) to fit the profile and JPEG-encodes it.
+    With 'buffers' (a FrameBuffers) the downscaled frame is written into a reused array.
+    """
+    h, w = frame.shape[:2]
+    scale = 1.0
+    if profile.max_width and w > profile.max_width:
+        scale = min(scale, profile.max_width / w)
+    if profile.max_height and h > profile.max_height:
+        scale = min(scale, profile.max_height / h)
+    if scale < 1.0:
+        size = (int(w * scale), int(h * scale))
+        if buffers is not None:
+            frame = buffers.resize(frame, size, name=("encode",) + size, interpolation=cv2.INTER_AREA)
+        else:
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    params = [cv2.IMWRITE_JPEG_QUALITY, profile.quality] if profile.quality else []
+    ret, buffer = cv2.imencode(".jpg", frame, params)
+    return buffer.tobytes() if ret else None
+
+# ------------------------------
+# Viewers
+# ------------------------------
+class Subscriber:
+    """One MJPEG viewer: a one-frame mailbox plus send statistics."""
+
+    def __init__(self, profile, adaptive=False):
+        self.profile = profile
+        self.ceiling = profile
+        self.adaptive = adaptive
+        self.sent = 0
+        self.dropped = 0
+        self.closed = False
+        self._cond = threading.Condition()
+        self._pending = None
+        self._last_delivery = 0.0
+        self._window_start = time.time()
+        self._window_delivered = 0
+        self._window_dropped = 0
+        self._last_drop = time.time()
+
+    def due(self, now):
+        return not self.profile.max_fps or now - self._last_delivery >= 1.0 / self.profile.max_fps
+
+    def deliver(self, jpeg, now):
+        """Called by the producer; never blocks. An unread frame is replaced and counted as dropped."""
+        with self._cond:
+            if self._pending is not None:
+                self.dropped += 1
+                self._window_dropped += 1
+                self._last_drop = now
+            self._pending = jpeg
+            self._last_delivery = now
+            self._window_delivered += 1
+            self._cond.notify()
+        if self.adaptive:
+            self._adapt(now)
+
+    def _adapt(self, now):
+        if now - self._window_start < ADAPT_WINDOW_SECONDS:
+            return
+        ratio = self._window_dropped / max(1, self._window_delivered)
+        idx = PROFILE_LADDER.index(self.profile) if self.profile in PROFILE_LADDER else 0
+        ceiling_idx = PROFILE_LADDER.index(self.ceiling) if self.ceiling in PROFILE_LADDER else 0
+        if ratio > DOWNGRADE_DROP_RATIO and idx < len(PROFILE_LADDER) - 1:
+            self.profile = PROFILE_LADDER[idx + 1]
+            print(f"[STREAM] Viewer falling behind ({ratio:.0%} dropped), switching to '{self.profile.name}'")
+        elif now - self._last_drop > UPGRADE_AFTER_SECONDS and idx > ceiling_idx:
+            self.profile = PROFILE_LADDER[idx - 1]
+            self._last_drop = now
+            print(f"[STREAM] Viewer keeping up, switching to '{self.profile.name}'")
+        self._window_start = now
+        self._window_delivered = 0
+        self._window_dropped = 0
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+    def next_jpeg(self, timeout=SUBSCRIBER_TIMEOUT):
+        """Waits for the next frame for this viewer. Returns None once the stream is over."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending is not None or self.closed, timeout)
+            jpeg, self._pending = self._pending, None
+        if jpeg is not None:
+            self.sent += 1
+        return jpeg
+
+    def stats(self):
+        return {
+            "profile": self.profile.name,
+            "adaptive": self.adaptive,
+            "sent": self.sent,
+            "dropped": self.dropped,
+        }
+
+# ------------------------------
+# Per-source producer
+# ------------------------------
+class SourceBroadcaster:
+    """Runs one processed-frame iterator and fans encoded frames out to its viewers."""
+
+    def __init__(self, key, frames_factory, hub, camera_id=None):
+        self.key = key
+        self.hub = hub
+        self.camera_id = camera_id
+        self.subscribers = []
+        self.encodes = 0
+        self.frames = 0
+        self.closed = False
+        self.buffers = FrameBuffers()   # downscale targets, reused across frames
+        self._frames_factory = frames_factory
+        self._thread = threading.Thread(target=self._run, name=f"mjpeg-{key}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        frames = self._frames_factory()
+        try:
+            for frame in frames:
+                self.frames += 1
+                subscribers = self.hub.snapshot(self)
+                if not subscribers:
+                    break
+                now = time.time()
+                groups = {}
+                for sub in subscribers:
+                    if sub.due(now):
+                        groups.setdefault(encode_key(sub.profile), []).append(sub)
+                encoded = {}
+                for key, subs in groups.items():
+                    jpeg = encode_frame(frame, subs[0].profile, self.buffers)
+                    if jpeg is None:
+                        print("[WARN] Failed to encode frame.")
+                        continue
+                    self.encodes += 1
+                    encoded[key] = jpeg
+                    for sub in subs:
+                        sub.deliver(jpeg, now)
+                self._buffer(frame, encoded, now)
+        except Exception as e:
+            print(f"[STREAM] ❌ Producer for {self.key} failed: {e}")
+        finally:
+            frames.close()
+            self.hub.finish(self)
+
+    def _buffer(self, frame, encoded, now):
+        """Feeds the camera's clip buffer, reusing this frame's viewer encode when there is one."""
+        recorder = self.hub.recorder
+        if recorder is None or self.camera_id is None or not recorder.wants_frame(self.camera_id, now):
+            return
+        jpeg = encoded.get(encode_key(CLIP_PROFILE)) or next(iter(encoded.values()), None)
+        if jpeg is None:
+            jpeg = encode_frame(frame, CLIP_PROFILE, self.buffers)
+            self.encodes += 1
+        if jpeg is not None:
+            recorder.add(self.camera_id, jpeg, now)
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "encodes": self.encodes,
+            "buffers": self.buffers.stats(),
+            "viewers": [s.stats() for s in self.subscribers],
+        }
+
+
+class StreamHub:
+    """Source key -> SourceBroadcaster; viewers of the same key share one producer."""
+
+    def __init__(self, recorder=None):
+        self.recorder = recorder
+        self._lock = threading.Lock()
+        self._broadcasters = {}
+
+    def subscribe(self, key, frames_factory, profile, adaptive=False, camera_id=None):
+        sub = Subscriber(profile, adaptive)
+        with self._lock:
+            broadcaster = self._broadcasters.get(key)
+            created = broadcaster is None
+            if created:
+                broadcaster = SourceBroadcaster(key, frames_factory, self, camera_id)
+                self._broadcasters[key] = broadcaster
+            broadcaster.subscribers.append(sub)
+        if created:
+            broadcaster.start()
+        return broadcaster, sub
+
+    def unsubscribe(self, broadcaster, sub):
+        sub.close()
+        with self._lock:
+            if sub in broadcaster.subscribers:
+                broadcaster.subscribers.remove(sub)
+
+    def snapshot(self, broadcaster):
+        """Current viewers; an empty list retires the broadcaster so new viewers start a fresh one."""
+        with self._lock:
+            subs = list(broadcaster.subscribers)
+            if not subs and self._broadcasters.get(broadcaster.key) is broadcaster:
+                del self._broadcasters[broadcaster.key]
+                broadcaster.closed = True
+            return subs
+
+    def finish(self, broadcaster):
+        with self._lock:
+            if self._broadcasters.get(broadcaster.key) is broadcaster:
+                del self._broadcasters[broadcaster.key]
+            broadcaster.closed = True
+            subs = list(broadcaster.subscribers)
+        for sub in subs:
+            sub.close()
+
+    def stream(self, key, frames_factory, profile, adaptive=False, camera_id=None):
+        """
+        Generator of multipart/x-mixed-replace parts for one viewer.
+        camera_id: alert camera ID of the source; its frames feed that camera's clip buffer.
+        """
+        broadcaster, sub = self.subscribe(key, frames_factory, profile, adaptive, camera_id)
+        try:
+            while True:
+                jpeg = sub.next_jpeg()
+                if jpeg is None:
+                    break
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+        finally:
+            self.unsubscribe(broadcaster, sub)
+
+    def status(self):
+        with self._lock:
+            return {str(key): b.stats() for key, b in self._broadcasters.items()}
@@ -0,0 +1,277 @@
+"""
+Model backend selection for the AgniShakti fire/smoke detector.
+Exports best.pt to ONNX / OpenVINO and loads it through the matching runtime,
+so CPU-only edge boxes don't have to run eager PyTorch.
+"""
+
+import os
+import json
+import time
+import importlib.util
+
+# ------------------------------
+# Config
+# ------------------------------
+DEFAULT_MODEL_PATH = os.getenv("MODEL_PATH", "best.pt")
+# "torch", "onnx", "openvino" or "auto" (best available runtime for the device)
+DEFAULT_BACKEND = os.getenv("MODEL_BACKEND", "torch")
+
+# "fp32", "fp16" or "int8". Reduced-precision variants are only served once
+# quantize_model.py has validated them against the FP32 model.
+DEFAULT_PRECISION = os.getenv("MODEL_PRECISION", "fp32")
+
+BACKENDS = ("torch", "onnx", "openvino")
+PRECISIONS = ("fp32", "fp16", "int8")
+
+# Precisions each backend can serve on CPU
+SUPPORTED_PRECISIONS = {
+    "torch": ("fp32",),
+    "onnx": ("fp32", "int8"),
+    "openvino": ("fp32", "fp16", "int8"),
+}
+
+# Validation results for reduced-precision variants, stored next to the weights
+VARIANTS_MANIFEST = "model_variants.json"
+
+# Python module each backend needs at runtime
+_RUNTIME_MODULES = {
+    "torch": "torch",
+    "onnx": "onnxruntime",
+    "openvino": "openvino",
+}
+
+# ------------------------------
+# Helpers
+# ------------------------------
+def backend_available(backend):
+    """True if the runtime for 'backend' can be imported."""
+    module = _RUNTIME_MODULES.get(backend)
+    return module is not None and importlib.util.find_spec(module) is not None
+
+
+def default_device():
+    """"cuda" when torch sees a GPU, else "cpu" (the device the loaders pick)."""
+    try:
+        import torch
+    except ImportError:
+        return "cpu"
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def resolve_backend(backend=None, device="cpu", warn=True):
+    """
+    Normalizes a backend name and falls back to torch when the requested
+    runtime isn't installed. "auto" picks OpenVINO, then ONNX Runtime on CPU
+    and keeps torch on CUDA.
+    """
+    backend = (backend or DEFAULT_BACKEND).strip().lower()
+    if backend == "auto":
+        if device != "cpu":
+            return "torch"
+        for candidate in ("openvino", "onnx"):
+            if backend_available(candidate):
+                return candidate
+        return "torch"
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown model backend '{backend}'. Choose from {BACKENDS} or 'auto'.")
+
+    if not backend_available(backend):
+        if warn:
+            print(f"[WARN] Backend '{backend}' requested but {_RUNTIME_MODULES[backend]} is not installed. Falling back to torch.")
+        return "torch"
+    return backend
+
+
+def exported_path(weights, backend):
+    """Path of the artifact ultralytics writes next to 'weights' for 'backend'."""
+    stem, _ = os.path.splitext(weights)
+    if backend == "onnx":
+        return f"{stem}.onnx"
+    if backend == "openvino":
+        return f"{stem}_openvino_model"
+    return weights
+
+
+def parse_variant(spec):
+    """Splits a variant spec like "onnx:int8" into (backend, precision). Precision may be None."""
+    backend, _, precision = spec.strip().lower().partition(":")
+    if precision and precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}'. Choose from {PRECISIONS}.")
+    return backend, (precision or None)
+
+
+def variant_path(weights, backend, precision="fp32"):
+    """Path of the reduced-precision artifact for (backend, precision)."""
+    if precision == "fp32":
+        return exported_path(weights, backend)
+    stem, _ = os.path.splitext(weights)
+    if backend == "onnx":
+        return f"{stem}_{precision}.onnx"
+    if backend == "openvino":
+        return f"{stem}_{precision}_openvino_model"
+    raise ValueError(f"Backend '{backend}' has no {precision} variant.")
+
+
+def _manifest_path(weights):
+    return os.path.join(os.path.dirname(os.path.abspath(weights)), VARIANTS_MANIFEST)
+
+
+def read_manifest(weights):
+    """Returns the variant manifest for 'weights' ({} if none has been written yet)."""
+    path = _manifest_path(weights)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def artifact_fingerprint(path):
+    """
+    (mtime, size) of an artifact; for directory artifacts (OpenVINO) the newest
+    mtime and total size of the files inside. None if it doesn't exist.
+    """
+    if not os.path.exists(path):
+        return None
+    if not os.path.isdir(path):
+        st = os.stat(path)
+        return [st.st_mtime, st.st_size]
+    mtime, size = os.path.getmtime(path), 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            st = os.stat(os.path.join(root, name))
+            mtime = max(mtime, st.st_mtime)
+            size += st.st_size
+    return [mtime, size]
+
+
+def record_variant(weights, backend, precision, report, approved):
+    """Stores the validation report for a variant, whether it may be served and which build was validated."""
+    artifact = variant_path(weights, backend, precision)
+    manifest = read_manifest(weights)
+    manifest[f"{backend}:{precision}"] = {
+        "artifact": artifact,
+        "fingerprint": artifact_fingerprint(artifact),
+        "approved": bool(approved),
+        "validated_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()),
+        "report": report,
+    }
+    with open(_manifest_path(weights), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def is_approved(weights, backend, precision):
+    """
+    True if the variant passed its accuracy check and hasn't been invalidated
+    since, either by newer weights or by rebuilding the artifact itself.
+    """
+    if precision == "fp32":
+        return True
+    entry = read_manifest(weights).get(f"{backend}:{precision}")
+    if not entry or not entry.get("approved"):
+        return False
+    artifact = variant_path(weights, backend, precision)
+    if _is_stale(artifact, weights):
+        return False
+    return entry.get("fingerprint") == artifact_fingerprint(artifact)
+
+
+def _is_stale(artifact, weights):
+    """True if the exported artifact is missing or older than the source weights."""
+    if not os.path.exists(artifact):
+        return True
+    return os.path.getmtime(artifact) < os.path.getmtime(weights)
+
+
+def export_model(weights=DEFAULT_MODEL_PATH, backend="onnx", imgsz=640, force=False):
+    """
+    Exports 'weights' to the format used by 'backend' and returns the artifact path.
+    Re-uses an existing export unless it is older than the weights or 'force' is set.
+    """
+    if backend == "torch":
+        return weights
+
+    artifact = exported_path(weights, backend)
+    if not force and not _is_stale(artifact, weights):
+        return artifact
+
+    from ultralytics import YOLO
+
+    print(f"[INFO] Exporting {weights} to {backend} (imgsz={imgsz})...")
+    exported = YOLO(weights).export(format=backend, imgsz=imgsz, verbose=False)
+    print(f"[INFO] Export complete: {exported}")
+    return str(exported)
+
+
+def _resolve_precision(weights, backend, precision, require_approval, warn=True):
+    """Falls back to fp32 when a reduced-precision variant can't or shouldn't be served."""
+    if precision == "fp32":
+        return precision
+    if precision not in SUPPORTED_PRECISIONS[backend]:
+        reason = f"{backend} backend has no {precision} variant"
+    elif not os.path.exists(variant_path(weights, backend, precision)):
+        reason = f"{variant_path(weights, backend, precision)} not found (build it with quantize_model.py)"
+    elif require_approval and not is_approved(weights, backend, precision):
+        reason = f"{backend}:{precision} has not passed its accuracy check. Refusing to serve it"
+    else:
+        return precision
+    if warn:
+        print(f"[WARN] {reason}. Using fp32.")
+    return "fp32"
+
+
+def resolve_variant(weights=DEFAULT_MODEL_PATH, backend=None, device="cpu", precision=None, require_approval=True,
+                    warn=True):
+    """
+    (backend, precision) that load_model() serves for these arguments, worked out
+    without loading anything (cache keys use it to name the model actually in use).
+    """
+    backend, spec_precision = parse_variant(backend or DEFAULT_BACKEND)
+    precision = (spec_precision or precision or DEFAULT_PRECISION).lower()
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}'. Choose from {PRECISIONS}.")
+    backend = resolve_backend(backend, device, warn)
+    return backend, _resolve_precision(weights, backend, precision, require_approval, warn)
+
+
+def variant_name(backend, precision):
+    """"onnx", "openvino:int8", ...: the backend, suffixed with ":<precision>" when not fp32."""
+    return backend if precision == "fp32" else f"{backend}:{precision}"
+
+
+def load_model(weights=DEFAULT_MODEL_PATH, backend=None, imgsz=640, device="cpu", precision=None, require_approval=True):
+    """
+    Loads the detector through the requested backend, exporting it first if needed.
+    'backend' may carry a precision ("onnx:int8"); otherwise 'precision' or
+    MODEL_PRECISION applies. Returns (model, variant) where variant is the
+    backend actually used, suffixed with ":<precision>" when not fp32.
+    Every backend returns ultralytics Results, so callers don't need to care
+    which runtime is underneath.
+    """
+    from ultralytics import YOLO
+
+    backend, precision = resolve_variant(weights, backend, device, precision, require_approval)
+
+    if backend == "torch":
+        model = YOLO(weights).to(device)
+    elif precision == "fp32":
+        artifact = export_model(weights, backend, imgsz=imgsz)
+        model = YOLO(artifact, task="detect")
+    else:
+        model = YOLO(variant_path(weights, backend, precision), task="detect")
+
+    variant = variant_name(backend, precision)
+    print(f"[INFO] Loaded {weights} with {variant} backend.")
+    return model, variant
+
+
+if __name__ == "__main__":
+    import argparse
+
+    p = argparse.ArgumentParser(description="Export the detector for a CPU runtime")
+    p.add_argument("--weights", type=str, default=DEFAULT_MODEL_PATH, help="path to the .pt model")
+    p.add_argument("--backend", type=str, default="onnx", choices=["onnx", "openvino"], help="export format")
+    p.add_argument("--imgsz", type=int, default=640, help="input size baked into the export")
+    p.add_argument("--force", action="store_true", help="re-export even if an up-to-date artifact exists")
+    args = p.parse_args()
+    print(export_model(args.weights, args.backend, imgsz=args.imgsz, force=args.force))
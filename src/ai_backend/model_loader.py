@@ -0,0 +1,134 @@
+"""
+Background model loading for the AgniShakti AI service.
+The HTTP server binds immediately; the detector is loaded and warmed up on a
+worker thread, and readiness is reported through /readyz.
+torch / ultralytics are only imported on that thread.
+"""
+
+import os
+import time
+import threading
+
+from model_backend import DEFAULT_MODEL_PATH, load_model
+
+# ------------------------------
+# Config
+# ------------------------------
+# Frame sizes (WxH) the service sees in production; each one gets warmup passes
+# so the first real frame doesn't pay for graph setup / allocator growth.
+WARMUP_SIZES = os.getenv("MODEL_WARMUP_SIZES", "640x480,1280x720")
+WARMUP_RUNS = int(os.getenv("MODEL_WARMUP_RUNS", "2"))
+
+
+def parse_sizes(spec):
+    """Parses "640x480,1280x720" into [(640, 480), (1280, 720)]."""
+    sizes = []
+    for item in (spec or "").split(","):
+        item = item.strip().lower()
+        if not item:
+            continue
+        w, _, h = item.partition("x")
+        sizes.append((int(w), int(h)))
+    return sizes
+
+
+class ModelNotReady(RuntimeError):
+    """Raised when the model is requested before it finished loading."""
+
+
+class ModelLoader:
+    """Loads the detector once in the background and hands it out when ready."""
+
+    def __init__(self, weights=DEFAULT_MODEL_PATH, imgsz=640, backend=None, warmup_sizes=WARMUP_SIZES, warmup_runs=WARMUP_RUNS,
+                 threads=None):
+        self.weights = weights
+        self.imgsz = imgsz
+        self.backend = backend
+        self.threads = threads   # torch intra-op threads per model call (None = torch default)
+        self.warmup_sizes = parse_sizes(warmup_sizes) if isinstance(warmup_sizes, str) else list(warmup_sizes or [])
+        self.warmup_runs = warmup_runs
+
+        self.model = None
+        self.class_names = None
+        self.device = None
+        self.state = "pending"   # pending -> loading -> warming -> ready | failed
+        self.error = None
+        self.timings = {}
+
+        self._ready = threading.Event()
+        self._done = threading.Event()   # set once loading finished, successfully or not
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def start(self):
+        """Starts loading on a daemon thread. Safe to call more than once."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._load, name="model-loader", daemon=True)
+            self._thread.start()
+
+    def _load(self):
+        t0 = time.time()
+        try:
+            self.state = "loading"
+            import torch
+
+            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+            print(f"[INFO] Using device: {self.device}")
+            if self.threads:
+                torch.set_num_threads(self.threads)
+            model, self.backend = load_model(self.weights, backend=self.backend, imgsz=self.imgsz, device=self.device)
+            self.timings["load_s"] = round(time.time() - t0, 3)
+
+            self.state = "warming"
+            t1 = time.time()
+            self._warmup(model)
+            self.timings["warmup_s"] = round(time.time() - t1, 3)
+
+            self.model = model
+            self.class_names = model.names
+            self.state = "ready"
+            self._ready.set()
+            print(f"[INFO] YOLO model ready ({self.backend}) in {time.time() - t0:.1f}s.")
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            print(f"[ERROR] Failed to load model: {e}")
+        finally:
+            self._done.set()
+
+    def _warmup(self, model):
+        import numpy as np
+
+        for w, h in self.warmup_sizes:
+            dummy = np.zeros((h, w, 3), dtype=np.uint8)
+            for _ in range(self.warmup_runs):
+                model(dummy, imgsz=self.imgsz, verbose=False)
+            print(f"[INFO] Warmed up model at {w}x{h}")
+
+    def get(self, timeout=0):
+        """Returns the model, waiting up to 'timeout' seconds. Raises ModelNotReady otherwise."""
+        self._done.wait(timeout)
+        if not self.ready:
+            raise ModelNotReady(self.error or f"Model is {self.state}")
+        return self.model
+
+    def wait(self, timeout=None):
+        """Starts loading if needed and blocks until the model is ready (for CLI tools)."""
+        self.start()
+        return self.get(timeout)
+
+    def status(self):
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "backend": self.backend,
+            "device": self.device,
+            "error": self.error,
+            "timings": self.timings,
+        }
@@ -0,0 +1,484 @@
+#!/usr/bin/env python3
+"""
+Shared model server for multi-process serving.
+
+One or more inference processes each hold a single copy of the detector.
+HTTP workers (uvicorn --workers N with SERVING_MODE=shared) write frames into
+a shared-memory ring owned by the worker and send only the slot index over a
+local connection, so frame pixels are never pickled. The inference process
+runs the normal infer_and_draw on the shared-memory view, drawing in place.
+
+Frames are routed to a server by a stable hash of the camera ID. Alert
+throttling is shared through the SQLite rate-limiter store (ALERT_LIMITER_DB,
+defaulting to alert_limits.db here), so HTTP workers that alert locally and the
+inference processes all draw from the same per-camera buckets.
+
+    python model_server.py --servers 2 --http-workers 4
+
+Connections are authenticated with MODEL_SERVER_AUTHKEY. The launcher above
+generates a random key per run and hands it to the servers and HTTP workers
+through the environment; processes started any other way refuse to run
+unless the same key is set for all of them.
+"""
+
+import os
+import zlib
+import time
+import secrets
+import queue
+import signal
+import threading
+import argparse
+from multiprocessing import Process
+from multiprocessing import shared_memory
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+import cpu_layout
+
+# ------------------------------
+# Config
+# ------------------------------
+MODEL_SERVER_HOST = os.getenv("MODEL_SERVER_HOST", "127.0.0.1")
+MODEL_SERVER_PORT = int(os.getenv("MODEL_SERVER_PORT", "8601"))   # first server; the rest follow
+MODEL_SERVERS = int(os.getenv("MODEL_SERVERS", "1"))
+
+# Per-worker ring: RING_SLOTS frames of up to SLOT_BYTES each (default fits 1080p BGR).
+# Larger frames fall back to sending raw bytes over the connection.
+RING_SLOTS = int(os.getenv("FRAME_RING_SLOTS", "8"))
+SLOT_BYTES = int(os.getenv("FRAME_SLOT_BYTES", str(1920 * 1080 * 3)))
+
+# How long a HTTP worker caches the servers' status
+STATUS_POLL_SECONDS = 1.0
+# How long the launcher waits for a stopped server (it flushes snapshots on SIGTERM)
+SHUTDOWN_TIMEOUT = 15.0
+
+
+def server_addresses(host=MODEL_SERVER_HOST, port=MODEL_SERVER_PORT, count=MODEL_SERVERS):
+    return [(host, port + i) for i in range(count)]
+
+
+def server_authkey():
+    """MODEL_SERVER_AUTHKEY as bytes, read when a server or client starts. There is no default key."""
+    key = os.getenv("MODEL_SERVER_AUTHKEY", "")
+    if not key:
+        raise RuntimeError("MODEL_SERVER_AUTHKEY is not set. Start the servers with model_server.py "
+                           "(it generates a key per launch) or set the same key for every server and HTTP worker.")
+    return key.encode()
+
+# ------------------------------
+# Shared-memory frame ring
+# ------------------------------
+class SharedFrameRing:
+    """
+    Fixed pool of frame-sized slots in one shared-memory segment.
+    The creating process hands out slots (FIFO, so slots rotate like a ring);
+    other processes attach by name and only read/write the slot they're told to.
+    """
+
+    def __init__(self, slots=RING_SLOTS, slot_bytes=SLOT_BYTES, name=None):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+            self._free = queue.Queue()
+            for i in range(slots):
+                self._free.put(i)
+        else:
+            self.shm = _attach_shm(name)
+            self._free = None
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def view(self, slot, shape, dtype=np.uint8):
+        """ndarray backed directly by the slot's shared memory (no copy)."""
+        return np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def fits(self, frame):
+        return frame.dtype == np.uint8 and frame.nbytes <= self.slot_bytes
+
+    def acquire(self, timeout=None):
+        return self._free.get(timeout=timeout)
+
+    def release(self, slot):
+        self._free.put(slot)
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _attach_shm(name):
+    """Attaches to an existing segment without letting this process' resource tracker unlink it on exit."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        from multiprocessing import resource_tracker
+
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+# ------------------------------
+# Inference process
+# ------------------------------
+class InferenceServer:
+    """Serves infer_and_draw / infer_detections / detect requests for one model copy."""
+
+    def __init__(self, address, authkey=None):
+        self.address = address
+        self.authkey = authkey or server_authkey()
+        self._lock = threading.Lock()   # one model, one inference at a time
+        self._rings = {}
+        self._rings_lock = threading.Lock()
+        self.service = None
+
+    def _ring(self, name, slot_bytes):
+        with self._rings_lock:
+            ring = self._rings.get(name)
+            if ring is None:
+                ring = SharedFrameRing(slots=0, slot_bytes=slot_bytes, name=name)
+                self._rings[name] = ring
+            return ring
+
+    def serve_forever(self):
+        # The inference process runs the regular single-process service code
+        os.environ["SERVING_MODE"] = "local"
+        import ai_service
+
+        self.service = ai_service
+        ai_service.clip_recorder.remote = True
+        ai_service.start_model_loading()
+        # the launcher stops servers with SIGTERM: write out staged alert snapshots first
+        signal.signal(signal.SIGTERM, self._on_sigterm)
+
+        listener = Listener(self.address, authkey=self.authkey)
+        print(f"[MODEL_SERVER] Listening on {self.address[0]}:{self.address[1]} (pid {os.getpid()})")
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _on_sigterm(self, signum, frame):
+        print(f"[MODEL_SERVER] Stopping (pid {os.getpid()}), flushing snapshots...")
+        self.service.flush_snapshots()
+        raise SystemExit(0)
+
+    def _handle(self, conn):
+        try:
+            while True:
+                try:
+                    msg = conn.recv()
+                except (EOFError, OSError):
+                    break
+                try:
+                    self._dispatch(conn, msg)
+                except Exception as e:
+                    print(f"[MODEL_SERVER] ❌ Request failed: {e}")
+                    conn.send({"ok": False, "error": str(e)})
+        finally:
+            conn.close()
+
+    def _dispatch(self, conn, msg):
+        op = msg["op"]
+        if op == "status":
+            conn.send({"ok": True, "status": self.service.model_status()})
+            return
+        if op == "cascade":
+            cascade = self.service.cascade
+            conn.send({"ok": True, "status": cascade.status() if cascade is not None else None})
+            return
+        if op == "local_verifier":
+            verifier = self.service.local_verifier
+            conn.send({"ok": True, "status": verifier.status() if verifier is not None else None})
+            return
+        if op == "snapshot":
+            # alert snapshots raised here that are still waiting for the writer
+            conn.send({"ok": True, "data": self.service.snapshot_writer.get(msg["image_id"])})
+            return
+
+        shape = tuple(msg["shape"])
+        if msg.get("shm"):
+            frame = self._ring(msg["shm"], msg["slot_bytes"]).view(msg["slot"], shape)
+        else:
+            frame = np.frombuffer(bytearray(conn.recv_bytes()), dtype=np.uint8).reshape(shape)
+
+        with self._lock:
+            # clip IDs are only issued for cameras the requesting worker buffers frames for
+            self.service.clip_recorder.note_remote_ring(self.service.alert_camera_id(msg.get("camera_id")),
+                                                        msg.get("clip_ring"))
+            if op == "infer_and_draw":
+                result = self.service.infer_and_draw(frame, msg.get("camera_id"))
+                if result is not frame:
+                    np.copyto(frame, result)
+                reply = {"ok": True}
+            elif op == "detect":
+                reply = {"ok": True, "detections": self.service.detect_objects(frame)}
+            elif op == "infer_detections":
+                reply = {"ok": True, "detections": self.service.infer_detections(frame, msg.get("camera_id"))}
+            else:
+                raise ValueError(f"Unknown op '{op}'")
+            # clips for alerts raised here are recorded by the worker that holds the camera's frames
+            reply["clips"] = self.service.clip_recorder.take_issued()
+
+        conn.send(reply)
+        if op == "infer_and_draw" and not msg.get("shm"):
+            conn.send_bytes(frame)
+
+
+def run_server(address, slot=None):
+    if slot is not None:
+        # this process is one worker of the layout: pin it, and let ai_service
+        # plan a single worker over the cores it is now restricted to
+        cpu_layout.apply_worker(slot)
+        cpu_layout.CPU_WORKERS = "1"
+        cpu_layout.CPU_THREADS_PER_WORKER = slot["threads"]
+        cpu_layout.CPU_RESERVED_CORES = 0
+    InferenceServer(address).serve_forever()
+
+# ------------------------------
+# HTTP worker side
+# ------------------------------
+class InferenceClient:
+    """Drop-in for the local model calls in ai_service when SERVING_MODE=shared."""
+
+    def __init__(self, addresses=None, authkey=None, slots=RING_SLOTS, slot_bytes=SLOT_BYTES):
+        self.addresses = addresses or server_addresses()
+        self.authkey = authkey or server_authkey()
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self._ring = None
+        self._ring_lock = threading.Lock()
+        self._local = threading.local()   # Connection objects aren't thread-safe
+        self._last_status = None
+        self._status_thread = None
+        self._status_lock = threading.Lock()
+        self.on_clip = None   # on_clip(camera_id, clip_id, alert_time) for alerts raised by a server
+        self.has_clip_ring = None   # has_clip_ring(camera_id): this worker buffers frames for the camera
+
+    @property
+    def ring(self):
+        with self._ring_lock:
+            if self._ring is None:
+                self._ring = SharedFrameRing(self.slots, self.slot_bytes)
+            return self._ring
+
+    def _server_for(self, camera_id):
+        # crc32, not hash(): must agree across processes
+        return zlib.crc32(str(camera_id or "").encode()) % len(self.addresses)
+
+    def _conn(self, idx):
+        conns = getattr(self._local, "conns", None)
+        if conns is None:
+            conns = self._local.conns = {}
+        conn = conns.get(idx)
+        if conn is None:
+            conn = conns[idx] = Client(self.addresses[idx], authkey=self.authkey)
+        return conn
+
+    def _drop_conn(self, idx):
+        conn = getattr(self._local, "conns", {}).pop(idx, None)
+        if conn is not None:
+            conn.close()
+
+    def _request(self, idx, msg, payload=None, expect_bytes=False):
+        try:
+            conn = self._conn(idx)
+            conn.send(msg)
+            if payload is not None:
+                conn.send_bytes(payload)
+            reply = conn.recv()
+            data = conn.recv_bytes() if expect_bytes and reply.get("ok") else None
+        except (EOFError, OSError):
+            self._drop_conn(idx)
+            raise
+        if not reply.get("ok"):
+            raise RuntimeError(f"Model server error: {reply.get('error')}")
+        return reply, data
+
+    def _call(self, op, frame, camera_id=None):
+        """Sends 'frame' to its server. For infer_and_draw the drawn pixels are copied back into 'frame'."""
+        idx = self._server_for(camera_id)
+        msg = {"op": op, "camera_id": camera_id, "shape": frame.shape,
+               "clip_ring": bool(self.has_clip_ring is not None and self.has_clip_ring(camera_id))}
+        ring = self.ring
+        if not (ring.fits(frame) and frame.flags["C_CONTIGUOUS"]):
+            # Doesn't fit a slot: send the raw bytes instead (still no pickling)
+            reply, data = self._request(idx, msg, payload=np.ascontiguousarray(frame, dtype=np.uint8),
+                                        expect_bytes=(op == "infer_and_draw"))
+            if data is not None:
+                frame[...] = np.frombuffer(data, dtype=np.uint8).reshape(frame.shape)
+            return reply
+
+        slot = ring.acquire()
+        try:
+            view = ring.view(slot, frame.shape)
+            np.copyto(view, frame)
+            msg.update({"shm": ring.name, "slot": slot, "slot_bytes": ring.slot_bytes})
+            reply, _ = self._request(idx, msg)
+            if op == "infer_and_draw":
+                np.copyto(frame, view)
+            return reply
+        finally:
+            ring.release(slot)
+
+    def _record_clips(self, reply):
+        for camera_id, clip_id, alert_time in reply.get("clips") or []:
+            if self.on_clip is not None:
+                self.on_clip(camera_id, clip_id, alert_time)
+
+    def infer_and_draw(self, frame, camera_id=None):
+        """Same contract as ai_service.infer_and_draw: returns the frame with detections drawn."""
+        self._record_clips(self._call("infer_and_draw", frame, camera_id))
+        return frame
+
+    def detect(self, frame, camera_id=None):
+        """Same contract as ai_service.detect_objects."""
+        return self._call("detect", frame, camera_id)["detections"]
+
+    def infer_detections(self, frame, camera_id=None):
+        """Same contract as ai_service.infer_detections (alerts are raised by the server)."""
+        reply = self._call("infer_detections", frame, camera_id)
+        self._record_clips(reply)
+        return reply["detections"]
+
+    def status(self):
+        """
+        Combined status of all servers (ready only when every server is). A background thread
+        refreshes it every STATUS_POLL_SECONDS, so a server that dies or restarts after startup
+        shows up as not ready, and callers (async handlers included) never wait on the network.
+        """
+        with self._status_lock:
+            if self._status_thread is None:
+                self._status_thread = threading.Thread(target=self._poll_status, name="model-server-status",
+                                                       daemon=True)
+                self._status_thread.start()
+        return self._last_status or {
+            "state": "waiting_for_model_servers",
+            "ready": False,
+            "mode": "shared",
+            "servers": [],
+        }
+
+    def _poll_status(self):
+        while True:
+            self._last_status = self._fetch_status()
+            time.sleep(STATUS_POLL_SECONDS)
+
+    def _fetch_status(self):
+        servers = []
+        for idx, address in enumerate(self.addresses):
+            try:
+                reply, _ = self._request(idx, {"op": "status"})
+                servers.append(reply["status"])
+            except Exception as e:
+                servers.append({"state": "unreachable", "ready": False, "error": str(e)})
+        ready = all(s.get("ready") for s in servers)
+        return {
+            "state": "ready" if ready else "waiting_for_model_servers",
+            "ready": ready,
+            "mode": "shared",
+            "servers": servers,
+        }
+
+    @property
+    def ready(self):
+        return self.status()["ready"]
+
+    def verifier_status(self):
+        """Local pre-verification statistics of every server (not cached)."""
+        servers = []
+        for idx in range(len(self.addresses)):
+            try:
+                reply, _ = self._request(idx, {"op": "local_verifier"})
+                servers.append(reply["status"])
+            except Exception as e:
+                servers.append({"error": str(e)})
+        return servers
+
+    def pending_snapshot(self, image_id):
+        """Bytes of a snapshot an inference server has staged but not written yet, or None."""
+        for idx in range(len(self.addresses)):
+            try:
+                reply, _ = self._request(idx, {"op": "snapshot", "image_id": image_id})
+            except Exception:
+                continue
+            if reply.get("data") is not None:
+                return reply["data"]
+        return None
+
+    def cascade_status(self):
+        """Cascade statistics of every server (not cached)."""
+        servers = []
+        for idx in range(len(self.addresses)):
+            try:
+                reply, _ = self._request(idx, {"op": "cascade"})
+                servers.append(reply["status"])
+            except Exception as e:
+                servers.append({"error": str(e)})
+        return servers
+
+# ------------------------------
+# CLI
+# ------------------------------
+def parse_args():
+    p = argparse.ArgumentParser(description="Run shared model server process(es)")
+    p.add_argument("--servers", type=int, default=MODEL_SERVERS, help="number of inference processes (0 = from the CPU layout)")
+    p.add_argument("--calibrate", action="store_true", help="with --servers 0: time candidate core splits first")
+    p.add_argument("--host", type=str, default=MODEL_SERVER_HOST)
+    p.add_argument("--port", type=int, default=MODEL_SERVER_PORT, help="port of the first server")
+    p.add_argument("--http-workers", type=int, default=0, help="also start uvicorn with this many workers")
+    p.add_argument("--http-port", type=int, default=8000)
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.servers > 0:
+        layout = cpu_layout.plan_layout(args.servers)
+    elif args.calibrate:
+        layout = cpu_layout.calibrate(os.getenv("MODEL_PATH", "best.pt"))
+    else:
+        layout = cpu_layout.resolve_layout()
+    args.servers = len(layout["workers"])
+    print(f"[MODEL_SERVER] CPU layout ({layout['source']}): "
+          + ", ".join(f"server {s['index']} -> cores {s['cores']} x{s['threads']} threads" for s in layout["workers"]))
+    addresses = server_addresses(args.host, args.port, args.servers)
+    # every process started from here shares one set of alert buckets
+    os.environ.setdefault("ALERT_LIMITER_DB", "alert_limits.db")
+    # and one connection key, random per launch unless the operator set one
+    if not os.getenv("MODEL_SERVER_AUTHKEY"):
+        os.environ["MODEL_SERVER_AUTHKEY"] = secrets.token_bytes(32).hex()
+    procs = [Process(target=run_server, args=(a, slot), daemon=True, name=f"model-server-{i}")
+             for i, (a, slot) in enumerate(zip(addresses, layout["workers"]))]
+    for proc in procs:
+        proc.start()
+
+    try:
+        if args.http_workers:
+            import uvicorn
+
+            os.environ.update({
+                "SERVING_MODE": "shared",
+                "MODEL_SERVER_HOST": args.host,
+                "MODEL_SERVER_PORT": str(args.port),
+                "MODEL_SERVERS": str(args.servers),
+            })
+            uvicorn.run("ai_service:app", host="0.0.0.0", port=args.http_port, workers=args.http_workers)
+        else:
+            for proc in procs:
+                proc.join()
+    finally:
+        for proc in procs:
+            proc.terminate()
+        # give each server time to flush its snapshots before the launcher exits
+        for proc in procs:
+            proc.join(timeout=SHUTDOWN_TIMEOUT)
+
+
+if __name__ == "__main__":
+    main()
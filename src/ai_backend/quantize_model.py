@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Builds reduced-precision (INT8 / FP16) variants of the fire/smoke detector and
+validates them against the FP32 model before they can be served.
+
+    python quantize_model.py --backend onnx --precision int8 \
+        --video clip.mp4 --annotations clip_gt.json --max-drop 0.02
+
+The variant is evaluated next to best.pt through InferenceRunner.evaluate_models_on_video
+on an annotated clip. It is only marked as approved in model_variants.json when
+precision and recall each drop by no more than --max-drop; load_model() refuses
+unapproved variants and serves FP32 instead.
+"""
+
+import os
+import json
+import shutil
+import argparse
+
+import cv2
+import numpy as np
+
+from model_backend import (
+    DEFAULT_MODEL_PATH, SUPPORTED_PRECISIONS, export_model, variant_path, record_variant,
+)
+
+DEFAULT_MAX_DROP = 0.02     # max absolute precision/recall drop vs FP32
+CALIB_FRAMES = 200          # frames used for INT8 calibration
+CALIB_STRIDE = 5            # take every Nth frame of the calibration video
+
+# ---------------------------
+# Helpers
+# ---------------------------
+def load_gt_annotations(path):
+    """
+    Reads ground truth for evaluate_models_on_video from JSON:
+    {"<frame_idx>": [[x1, y1, x2, y2, class], ...], ...}  (frame_idx is 1-based)
+    """
+    with open(path, "r") as f:
+        raw = json.load(f)
+    return {int(k): v for k, v in raw.items()}
+
+
+def _metric(value):
+    """Summary value as float, None where it couldn't be computed (e.g. no GT for a class)."""
+    return None if value is None or value != value else float(value)
+
+
+def read_calibration_frames(video_path, max_frames=CALIB_FRAMES, stride=CALIB_STRIDE):
+    """Samples up to max_frames frames from a video, every 'stride' frames."""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open calibration video: {video_path}")
+    frames = []
+    idx = 0
+    try:
+        while len(frames) < max_frames:
+            if not cap.grab():
+                break
+            if idx % stride == 0:
+                ret, frame = cap.retrieve()
+                if ret:
+                    frames.append(frame)
+            idx += 1
+    finally:
+        cap.release()
+    return frames
+
+
+def preprocess(frame, imgsz):
+    """Letterboxes a BGR frame the way ultralytics does and returns a 1x3xHxW float32 tensor."""
+    h, w = frame.shape[:2]
+    r = min(imgsz / h, imgsz / w)
+    new_w, new_h = int(round(w * r)), int(round(h * r))
+    resized = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top = (imgsz - new_h) // 2
+    left = (imgsz - new_w) // 2
+    canvas[top:top + new_h, left:left + new_w] = resized
+    blob = canvas[:, :, ::-1].transpose(2, 0, 1)  # BGR->RGB, HWC->CHW
+    return np.ascontiguousarray(blob, dtype=np.float32)[None] / 255.0
+
+# ---------------------------
+# Variant builders
+# ---------------------------
+def _quantize_onnx_int8(weights, imgsz, calib_video, max_frames):
+    """Static QDQ INT8 quantization of the ONNX export, calibrated on real frames."""
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    fp32_path = export_model(weights, "onnx", imgsz=imgsz)
+    out_path = variant_path(weights, "onnx", "int8")
+    input_name = ort.InferenceSession(fp32_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self, frames):
+            self._feeds = ({input_name: preprocess(f, imgsz)} for f in frames)
+
+        def get_next(self):
+            return next(self._feeds, None)
+
+    frames = read_calibration_frames(calib_video, max_frames)
+    print(f"[QUANT] Calibrating ONNX INT8 on {len(frames)} frames from {calib_video}")
+    quantize_static(
+        fp32_path, out_path, FrameReader(frames),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+    )
+    return out_path
+
+
+def _export_openvino(weights, precision, imgsz, data):
+    """FP16 / INT8 OpenVINO export through ultralytics."""
+    from ultralytics import YOLO
+
+    out_path = variant_path(weights, "openvino", precision)
+    if precision == "int8":
+        # ultralytics names this export <stem>_int8_openvino_model, which is our variant path
+        kwargs = {"int8": True}
+        if data:
+            kwargs["data"] = data
+        exported = YOLO(weights).export(format="openvino", imgsz=imgsz, verbose=False, **kwargs)
+    else:
+        # a half export would overwrite the FP32 <stem>_openvino_model, so export from a renamed copy
+        stem, ext = os.path.splitext(weights)
+        tmp_weights = f"{stem}_{precision}{ext}"
+        shutil.copy2(weights, tmp_weights)
+        try:
+            exported = YOLO(tmp_weights).export(format="openvino", imgsz=imgsz, half=True, verbose=False)
+        finally:
+            os.remove(tmp_weights)
+    if os.path.abspath(str(exported)) != os.path.abspath(out_path):
+        shutil.rmtree(out_path, ignore_errors=True)
+        shutil.move(str(exported), out_path)
+    return out_path
+
+
+def build_variant(weights, backend, precision, imgsz=640, calib_video=None, data=None, max_frames=CALIB_FRAMES):
+    """Produces the (backend, precision) artifact and returns its path."""
+    if precision not in SUPPORTED_PRECISIONS.get(backend, ()) or precision == "fp32":
+        raise ValueError(f"No {precision} variant for backend '{backend}'. Supported: {SUPPORTED_PRECISIONS}")
+    print(f"[QUANT] Building {backend}:{precision} variant of {weights}")
+    if backend == "onnx":
+        if not calib_video:
+            raise ValueError("ONNX INT8 needs a calibration video")
+        return _quantize_onnx_int8(weights, imgsz, calib_video, max_frames)
+    return _export_openvino(weights, precision, imgsz, data)
+
+# ---------------------------
+# Accuracy guardrail
+# ---------------------------
+def validate_variant(weights, backend, precision, video_path, gt_annotations, max_drop=DEFAULT_MAX_DROP,
+                     imgsz=640, iou_threshold=0.5, save_log_dir="logs"):
+    """
+    Runs the FP32 model and the variant side by side on an annotated clip and
+    approves the variant only if precision and recall each drop by <= max_drop.
+    Returns the report written to the manifest.
+    """
+    from main import InferenceRunner
+
+    spec = f"{backend}:{precision}"
+    runner = InferenceRunner([weights], imgsz=imgsz, save_log_dir=save_log_dir,
+                             backends=["torch", spec], require_approval=False)
+    if runner.backends[1] != spec:
+        raise RuntimeError(f"Could not load {spec} for validation (got {runner.backends[1]})")
+
+    summary = runner.evaluate_models_on_video(video_path, gt_annotations=gt_annotations,
+                                              iou_threshold=iou_threshold, reference_index=0)
+    if len(summary) < 2:
+        raise RuntimeError(f"Evaluation on {video_path} produced no results")
+    ref, var = summary.iloc[0], summary.iloc[1]
+
+    if ref["precision"] is None or not ref["n_gt"]:
+        raise RuntimeError(f"No ground truth in {video_path} matched any evaluated frame; nothing to validate against")
+
+    precision_drop = float(ref["precision"] - var["precision"])
+    recall_drop = float(ref["recall"] - var["recall"])
+    # drops measured against a reference that found nothing prove nothing about the variant
+    reference_ok = ref["tp"] > 0
+    approved = reference_ok and precision_drop <= max_drop and recall_drop <= max_drop
+    report = {
+        "approved": approved,
+        "video": video_path,
+        "max_drop": max_drop,
+        "fp32_precision": float(ref["precision"]),
+        "fp32_recall": float(ref["recall"]),
+        "precision": float(var["precision"]),
+        "recall": float(var["recall"]),
+        "precision_drop": precision_drop,
+        "recall_drop": recall_drop,
+        "fp32_map50_95": _metric(ref["map50_95"]),
+        "map50_95": _metric(var["map50_95"]),
+        "agreement": float(var["agreement"]),
+        "speedup_vs_fp32": float(var["speedup_vs_reference"]),
+        "fp32_tp": int(ref["tp"]),
+        "gt_boxes": int(ref["n_gt"]),
+    }
+    record_variant(weights, backend, precision, report, approved)
+
+    print(f"[QUANT] {spec}: precision {report['precision']:.3f} (-{precision_drop:.3f}), "
+          f"recall {report['recall']:.3f} (-{recall_drop:.3f}), speedup x{report['speedup_vs_fp32']:.2f}")
+    if approved:
+        print(f"[QUANT] ✅ {spec} approved. Serve it with MODEL_BACKEND={backend} MODEL_PRECISION={precision}")
+    elif not reference_ok:
+        print(f"[QUANT] ❌ {spec} rejected: the FP32 model matched none of the {report['gt_boxes']} ground-truth "
+              f"boxes, so the clip can't vouch for the variant. It will not be activated.")
+    else:
+        print(f"[QUANT] ❌ {spec} rejected: accuracy drop exceeds {max_drop}. It will not be activated.")
+    return report
+
+# ---------------------------
+# CLI
+# ---------------------------
+def parse_args():
+    p = argparse.ArgumentParser(description="Build and validate reduced-precision detector variants")
+    p.add_argument("--weights", type=str, default=DEFAULT_MODEL_PATH, help="path to the FP32 .pt model")
+    p.add_argument("--backend", type=str, required=True, choices=["onnx", "openvino"])
+    p.add_argument("--precision", type=str, required=True, choices=["fp16", "int8"])
+    p.add_argument("--video", type=str, required=True, help="annotated clip used for validation (and ONNX calibration)")
+    p.add_argument("--annotations", type=str, required=True, help="ground-truth JSON for --video")
+    p.add_argument("--max-drop", type=float, default=DEFAULT_MAX_DROP, help="max allowed precision/recall drop")
+    p.add_argument("--calib-video", type=str, help="calibration video for ONNX INT8 (defaults to --video)")
+    p.add_argument("--data", type=str, help="dataset yaml for OpenVINO INT8 calibration")
+    p.add_argument("--imgsz", type=int, default=640)
+    p.add_argument("--iou", type=float, default=0.5, help="IoU threshold for matching")
+    p.add_argument("--save_logs", type=str, default="logs", help="directory to save csv logs")
+    p.add_argument("--skip-build", action="store_true", help="re-validate an existing artifact")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not args.skip_build:
+        build_variant(args.weights, args.backend, args.precision, imgsz=args.imgsz,
+                      calib_video=args.calib_video or args.video, data=args.data)
+    gt = load_gt_annotations(args.annotations)
+    report = validate_variant(args.weights, args.backend, args.precision, args.video, gt,
+                              max_drop=args.max_drop, imgsz=args.imgsz, iou_threshold=args.iou,
+                              save_log_dir=args.save_logs)
+    raise SystemExit(0 if report["approved"] else 1)
+
+
+if __name__ == "__main__":
+    main()
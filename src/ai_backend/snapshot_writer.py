@@ -0,0 +1,255 @@
+"""
+Background writer for detection snapshots.
+
+Alert, capture and analyze paths hand over JPEG bytes they already encoded
+and get the imageId back immediately; a writer thread stores them in
+SNAPSHOT_DIR. Writes are grouped: each batch is written to temporary files,
+fsynced together, renamed into place and the directory is fsynced once, so a
+burst of detections costs one round of disk flushes instead of one per image.
+
+Until its file is in place, an image is kept in a staging cache and served
+from memory, so /snapshots never answers 404 for an imageId that was handed
+out. The queue is bounded (SNAPSHOT_QUEUE_SIZE); when it is full the caller
+writes the image itself rather than dropping it. A failed write (disk full,
+permissions) keeps the image staged and the writer thread retries it with
+backoff, up to SNAPSHOT_RETRY_MAX_SECONDS apart. An image is dropped (logged
+and counted) after SNAPSHOT_MAX_ATTEMPTS failed writes, or, oldest first,
+when failing images hold more than SNAPSHOT_MAX_STAGED_MB of memory.
+"""
+
+import os
+import time
+import heapq
+import queue
+import threading
+from collections import OrderedDict
+
+# ------------------------------
+# Config
+# ------------------------------
+SNAPSHOT_QUEUE_SIZE = int(os.getenv("SNAPSHOT_QUEUE_SIZE", "64"))     # images waiting to be written
+SNAPSHOT_BATCH_SIZE = int(os.getenv("SNAPSHOT_BATCH_SIZE", "16"))     # images per fsync round
+SNAPSHOT_FSYNC = os.getenv("SNAPSHOT_FSYNC", "1") == "1"              # "0" leaves flushing to the OS
+SNAPSHOT_JPEG_QUALITY = int(os.getenv("SNAPSHOT_JPEG_QUALITY", "80"))
+SNAPSHOT_RETRY_SECONDS = 1.0                                           # first retry of a failed write
+SNAPSHOT_RETRY_MAX_SECONDS = float(os.getenv("SNAPSHOT_RETRY_MAX_SECONDS", "30"))
+SNAPSHOT_MAX_ATTEMPTS = int(os.getenv("SNAPSHOT_MAX_ATTEMPTS", "8"))            # failed writes before dropping
+SNAPSHOT_MAX_STAGED_MB = float(os.getenv("SNAPSHOT_MAX_STAGED_MB", "256"))     # memory held by failing images
+
+_WAKE = None   # queue item that only wakes the writer thread to look at its retries
+
+
+def _fsync_dir(directory):
+    """Makes the renames in 'directory' durable (not possible on Windows)."""
+    if os.name == "nt":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class SnapshotWriter:
+    """Queues encoded snapshots for a background thread and serves them until they are on disk."""
+
+    def __init__(self, directory, max_queue=SNAPSHOT_QUEUE_SIZE, batch_size=SNAPSHOT_BATCH_SIZE,
+                 fsync=SNAPSHOT_FSYNC, max_attempts=SNAPSHOT_MAX_ATTEMPTS, max_staged_mb=SNAPSHOT_MAX_STAGED_MB):
+        self.directory = directory
+        self.batch_size = max(1, batch_size)
+        self.fsync = fsync
+        self.max_attempts = max(1, max_attempts)
+        self.max_staged_bytes = int(max_staged_mb * 1024 * 1024)
+        os.makedirs(directory, exist_ok=True)
+
+        self._queue = queue.Queue(maxsize=max(1, max_queue))
+        self._staged = OrderedDict()   # image_id -> bytes, oldest first
+        self._staged_bytes = 0
+        self._attempts = {}            # image_id -> failed writes so far
+        self._retry_at = []            # heap of (due time, image_id), served by the writer thread
+        self._lock = threading.Lock()
+        self._thread = None
+        self.written = 0
+        self.batches = 0
+        self.inline_writes = 0
+        self.failures = 0
+        self.retries = 0
+        self.dropped = 0
+        self.write_time = 0.0
+
+    def path(self, image_id):
+        return os.path.join(self.directory, image_id)
+
+    def submit(self, image_id, data):
+        """Stages 'data' (encoded image bytes) under image_id and queues it for writing."""
+        with self._lock:
+            self._unstage(image_id)
+            self._staged[image_id] = data
+            self._staged_bytes += len(data)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait(image_id)
+        except queue.Full:
+            # back-pressure: the writer is behind, so this caller pays for its own write
+            self.inline_writes += 1
+            self._write_batch([image_id])
+        return image_id
+
+    def get(self, image_id):
+        """Bytes of an image that is still waiting to be written, or None."""
+        with self._lock:
+            return self._staged.get(image_id)
+
+    def newest_pending(self):
+        with self._lock:
+            return next(reversed(self._staged), None)
+
+    def _unstage(self, image_id):
+        """Forgets a staged image (lock held)."""
+        data = self._staged.pop(image_id, None)
+        if data is not None:
+            self._staged_bytes -= len(data)
+        self._attempts.pop(image_id, None)
+
+    def _next_retry_in(self):
+        with self._lock:
+            return max(0.0, self._retry_at[0][0] - time.time()) if self._retry_at else None
+
+    def _due_retries(self, limit):
+        """Up to 'limit' images whose retry is due, skipping ones no longer staged."""
+        due = []
+        now = time.time()
+        with self._lock:
+            while self._retry_at and self._retry_at[0][0] <= now and len(due) < limit:
+                _, image_id = heapq.heappop(self._retry_at)
+                if image_id in self._staged:
+                    due.append(image_id)
+            self.retries += len(due)
+        return due
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self._next_retry_in())]
+            except queue.Empty:
+                batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            image_ids = [image_id for image_id in batch if image_id is not _WAKE]
+            image_ids += self._due_retries(self.batch_size - len(image_ids))
+            try:
+                if image_ids:
+                    self._write_batch(image_ids)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, image_ids):
+        t0 = time.time()
+        done = []
+        files = []
+        for image_id in image_ids:
+            data = self.get(image_id)
+            if data is None:
+                continue
+            tmp = f"{self.path(image_id)}.part"
+            f = None
+            try:
+                f = open(tmp, "wb")
+                f.write(data)
+                files.append((image_id, tmp, f))
+            except OSError as e:
+                if f is not None:
+                    f.close()
+                self._failed(image_id, e)
+        for image_id, tmp, f in files:
+            try:
+                with f:
+                    if self.fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+                os.replace(tmp, self.path(image_id))
+                done.append(image_id)
+            except OSError as e:
+                self._failed(image_id, e)
+        if done and self.fsync:
+            try:
+                _fsync_dir(self.directory)
+            except OSError as e:
+                print(f"[SNAPSHOT] ⚠️ Could not sync {self.directory}: {e}")
+        with self._lock:
+            for image_id in done:
+                self._unstage(image_id)
+            self.written += len(done)
+            self.batches += 1
+            self.write_time += time.time() - t0
+
+    def _failed(self, image_id, error):
+        """
+        Keeps the image staged (still served from memory) and schedules another attempt,
+        unless it has failed max_attempts times or failing images hold too much memory.
+        """
+        try:
+            os.remove(f"{self.path(image_id)}.part")
+        except OSError:
+            pass
+        with self._lock:
+            self.failures += 1
+            attempts = self._attempts[image_id] = self._attempts.get(image_id, 0) + 1
+            if attempts >= self.max_attempts:
+                self._drop(image_id, f"giving up after {attempts} failed writes: {error}")
+                return
+            delay = min(SNAPSHOT_RETRY_MAX_SECONDS, SNAPSHOT_RETRY_SECONDS * 2 ** (attempts - 1))
+            heapq.heappush(self._retry_at, (time.time() + delay, image_id))
+            # oldest failing images go first when they hold too much memory
+            for failing in [i for i in self._staged if i in self._attempts]:
+                if self._staged_bytes <= self.max_staged_bytes:
+                    break
+                self._drop(failing, f"failing snapshots exceed {self.max_staged_bytes / (1024 * 1024):g} MB")
+            if image_id not in self._staged:
+                return
+        print(f"[SNAPSHOT] ❌ Failed to write {image_id} (attempt {attempts}): {error}. Retrying in {delay:.1f}s")
+        if threading.current_thread() is not self._thread:
+            # an inline write failed; make sure the writer thread sees the new retry
+            try:
+                self._queue.put_nowait(_WAKE)
+            except queue.Full:
+                pass   # the writer is busy and will look at its retries after this batch
+
+    def _drop(self, image_id, reason):
+        """Gives up on an image (lock held); its imageId answers 404 from now on."""
+        self._unstage(image_id)
+        self.dropped += 1
+        print(f"[SNAPSHOT] ❌ Dropped {image_id}, {reason}")
+
+    def flush(self, timeout=None):
+        """Waits until everything queued so far is on disk (or 'timeout' seconds passed)."""
+        deadline = None if timeout is None else time.time() + timeout
+        while deadline is None or time.time() < deadline:
+            with self._lock:
+                if not self._staged:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def status(self):
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "staged": len(self._staged),
+                "staged_bytes": self._staged_bytes,
+                "written": self.written,
+                "batches": self.batches,
+                "inline_writes": self.inline_writes,
+                "failures": self.failures,
+                "retries": self.retries,
+                "retrying": len(self._attempts),
+                "dropped": self.dropped,
+                "mean_batch_ms": round(1000 * self.write_time / self.batches, 2) if self.batches else 0.0,
+                "fsync": self.fsync,
+            }
@@ -0,0 +1,34 @@
+"""
+StreamingEvaluator checks: ground truth labelled with class names must match
+detections that carry the model's integer class ids.
+
+    python -m pytest test_streaming_evaluator.py
+"""
+
+import pytest
+
+pytest.importorskip("cv2")
+
+from main import StreamingEvaluator  # noqa: E402
+
+
+def test_named_gt_matches_int_detections():
+    ev = StreamingEvaluator(0.5, class_names={0: "fire", 1: "smoke"})
+    tp, fp, fn = ev.add_frame(0.01, [[10, 10, 50, 50]], [0.9], [0], gts=[[10, 10, 50, 50, "fire"]])
+    assert (tp, fp, fn) == (1, 0, 0)
+    summary = ev.summary()
+    assert summary["precision"] == 1.0
+    assert summary["recall"] == 1.0
+    assert "fire" in ev.per_class()
+
+
+def test_named_gt_with_list_class_names():
+    ev = StreamingEvaluator(0.5, class_names=["fire", "smoke"])
+    tp, _, _ = ev.add_frame(0.01, [[0, 0, 20, 20]], [0.8], [1], gts=[[0, 0, 20, 20, "smoke"]])
+    assert tp == 1
+
+
+def test_unknown_gt_class_name_raises():
+    ev = StreamingEvaluator(0.5, class_names=["fire", "smoke"])
+    with pytest.raises(ValueError):
+        ev.add_frame(0.01, [], [], [], gts=[[0, 0, 20, 20, "flame"]])
@@ -0,0 +1,421 @@
+"""
+Offline analysis jobs for uploaded footage.
+
+Instead of streaming through /video_feed at viewer pace, a job splits the video
+into chunks and runs them on a pool of worker processes (each with its own
+model copy). The pool is started with the first job and kept for the life of
+the service, so later jobs reuse the loaded models; the model is exported once
+in the service process before the workers start loading it.
+
+Workers skip frames with grab() and only decode every 'stride'-th frame with
+retrieve(), and never encode for display. With the torch backend, sampled
+frames are batched into one model call; ONNX / OpenVINO exports have a fixed
+batch size of 1, so they get one frame per call. The result is a detection
+timeline (JSON + CSV) with a snapshot of the peak frame of every fire/smoke
+event. Only the last ANALYSIS_MAX_JOBS finished jobs (and their output) are kept.
+"""
+
+import os
+import csv
+import json
+import shutil
+import time
+import uuid
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+
+from model_backend import DEFAULT_MODEL_PATH, default_device, export_model, resolve_variant, variant_name
+from content_store import file_fingerprint, model_version
+from cpu_layout import plan_layout
+
+# ------------------------------
+# Config
+# ------------------------------
+JOBS_DIR = os.getenv("ANALYSIS_JOBS_DIR", "analysis_jobs")
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))   # size of the shared worker pool
+ANALYSIS_MAX_JOBS = int(os.getenv("ANALYSIS_MAX_JOBS", "100"))  # finished jobs kept, older ones are deleted
+DEFAULT_STRIDE = 5          # analyze every Nth frame
+DEFAULT_BATCH_SIZE = 8      # frames per model call
+CHUNK_FRAMES = 600          # raw frames per task; also the progress granularity
+EVENT_CONFIDENCE = 0.75     # same threshold the live alert path uses
+EVENT_GAP_SECONDS = 2.0     # detections closer than this belong to one event
+
+# ------------------------------
+# Worker process side
+# ------------------------------
+_worker_model = None
+_worker_names = None
+_worker_batched = False   # only torch models take several frames per call
+
+
+def _init_worker(weights, imgsz, threads):
+    """Loads one model per worker process and caps its torch threads so workers don't oversubscribe."""
+    global _worker_model, _worker_names, _worker_batched
+    import torch
+    from model_backend import default_device, load_model
+
+    torch.set_num_threads(max(1, threads))
+    cv2.setNumThreads(1)
+    _worker_model, variant = load_model(weights, imgsz=imgsz, device=default_device())
+    _worker_names = _worker_model.names
+    _worker_batched = variant.split(":")[0] == "torch"
+
+
+def _detect_batch(frames, frame_indices, fps, imgsz):
+    if _worker_batched:
+        results = _worker_model(frames, imgsz=imgsz, verbose=False)
+    else:
+        # exported graphs have a static batch dimension of 1
+        results = [r for frame in frames for r in _worker_model(frame, imgsz=imgsz, verbose=False)]
+    rows = []
+    for idx, r in zip(frame_indices, results):
+        detections = []
+        for box in r.boxes:
+            detections.append({
+                "class": _worker_names[int(box.cls[0].item())],
+                "confidence": round(float(box.conf[0].item()), 4),
+                "bbox": [round(v, 1) for v in box.xyxy[0].tolist()]
+            })
+        if detections:
+            rows.append({"frame": idx, "time_s": round(idx / fps, 3), "detections": detections})
+    return rows
+
+
+def analyze_chunk(video_path, start, end, stride, batch_size, imgsz):
+    """Analyzes frames [start, end) and returns the sampled frames that had detections."""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open video: {video_path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    rows = []
+    batch, batch_idx = [], []
+    sampled = 0
+    idx = start
+    try:
+        while idx < end:
+            if not cap.grab():
+                break
+            if idx % stride == 0:
+                ret, frame = cap.retrieve()
+                if ret:
+                    batch.append(frame)
+                    batch_idx.append(idx)
+                    sampled += 1
+                if len(batch) >= batch_size:
+                    rows.extend(_detect_batch(batch, batch_idx, fps, imgsz))
+                    batch, batch_idx = [], []
+            idx += 1
+        if batch:
+            rows.extend(_detect_batch(batch, batch_idx, fps, imgsz))
+    finally:
+        cap.release()
+    return {"start": start, "end": end, "frames": idx - start, "sampled": sampled, "rows": rows}
+
+# ------------------------------
+# Timeline helpers
+# ------------------------------
+def build_events(rows, min_confidence=EVENT_CONFIDENCE, gap_seconds=EVENT_GAP_SECONDS):
+    """Groups fire/smoke detections into events and picks each event's peak frame."""
+    events = []
+    current = None
+    for row in rows:
+        hits = [d for d in row["detections"] if d["class"] in ("fire", "smoke") and d["confidence"] >= min_confidence]
+        if not hits:
+            continue
+        best = max(hits, key=lambda d: d["confidence"])
+        if current and row["time_s"] - current["end_s"] <= gap_seconds:
+            current["end_s"] = row["time_s"]
+            current["classes"] = sorted(set(current["classes"]) | {d["class"] for d in hits})
+            if best["confidence"] > current["peak_confidence"]:
+                current.update(peak_frame=row["frame"], peak_confidence=best["confidence"])
+        else:
+            current = {
+                "start_s": row["time_s"],
+                "end_s": row["time_s"],
+                "classes": sorted({d["class"] for d in hits}),
+                "peak_frame": row["frame"],
+                "peak_confidence": best["confidence"],
+            }
+            events.append(current)
+    return events
+
+
+def save_event_snapshots(video_path, events, rows, out_dir):
+    """Re-reads each event's peak frame, draws its boxes and saves it as a JPEG."""
+    by_frame = {row["frame"]: row["detections"] for row in rows}
+    cap = cv2.VideoCapture(video_path)
+    try:
+        for i, event in enumerate(events):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, event["peak_frame"])
+            ret, frame = cap.read()
+            if not ret:
+                continue
+            for det in by_frame.get(event["peak_frame"], []):
+                x1, y1, x2, y2 = map(int, det["bbox"])
+                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
+                cv2.putText(frame, f"{det['class']} {det['confidence']:.2f}", (x1, y1 - 10),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+            name = f"event_{i:03d}_frame{event['peak_frame']}.jpg"
+            if cv2.imwrite(os.path.join(out_dir, name), frame):
+                event["snapshot"] = name
+    finally:
+        cap.release()
+
+
+def write_timeline(out_dir, summary, rows):
+    with open(os.path.join(out_dir, "timeline.json"), "w") as f:
+        json.dump({**summary, "detections": rows}, f, indent=2)
+    with open(os.path.join(out_dir, "timeline.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["frame", "time_s", "class", "confidence", "x1", "y1", "x2", "y2"])
+        for row in rows:
+            for det in row["detections"]:
+                writer.writerow([row["frame"], row["time_s"], det["class"], det["confidence"], *det["bbox"]])
+
+# ------------------------------
+# Jobs
+# ------------------------------
+class AnalysisJob:
+    def __init__(self, video_path, camera_id=None, stride=DEFAULT_STRIDE, batch_size=DEFAULT_BATCH_SIZE, workers=ANALYSIS_WORKERS):
+        self.id = uuid.uuid4().hex
+        self.video_path = video_path
+        self.camera_id = camera_id
+        self.stride = max(1, int(stride))
+        self.batch_size = max(1, int(batch_size))
+        self.workers = max(1, int(workers))
+        self.state = "queued"      # queued -> running -> done | failed
+        self.error = None
+        self.total_frames = 0
+        self.processed_frames = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.events = 0
+        self.cached = False
+        self.out_dir = os.path.join(JOBS_DIR, self.id)
+
+    def status(self):
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        fps = self.processed_frames / elapsed if elapsed > 0 else 0.0
+        remaining = self.total_frames - self.processed_frames
+        return {
+            "jobId": self.id,
+            "state": self.state,
+            "video": os.path.basename(self.video_path),
+            "cameraId": self.camera_id,
+            "stride": self.stride,
+            "batchSize": self.batch_size,
+            "workers": self.workers,
+            "totalFrames": self.total_frames,
+            "processedFrames": self.processed_frames,
+            "progress": round(self.processed_frames / self.total_frames, 4) if self.total_frames else 0.0,
+            "framesPerSecond": round(fps, 1),
+            "etaSeconds": round(remaining / fps, 1) if fps > 0 and self.state == "running" else None,
+            "events": self.events,
+            "cached": self.cached,
+            "error": self.error,
+        }
+
+
+class AnalysisJobManager:
+    """
+    Runs jobs one at a time (each one already uses all its workers) on a background thread.
+    All jobs share one pool of ANALYSIS_WORKERS processes; a job's 'workers' caps how
+    many of them it keeps busy.
+    With a DetectionCache, a video already analyzed with the same model and settings
+    completes instantly from the earlier job's output.
+    """
+
+    def __init__(self, weights=DEFAULT_MODEL_PATH, imgsz=640, store=None, cache=None, workers=ANALYSIS_WORKERS,
+                 max_jobs=ANALYSIS_MAX_JOBS):
+        self.weights = weights
+        self.imgsz = imgsz
+        self.workers = max(1, int(workers))
+        self.max_jobs = max(1, int(max_jobs))
+        self.store = store
+        self.cache = cache
+        self._jobs = {}
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pool = None
+        self._variant = None   # backend[:precision] the workers load, known once the pool is started
+        self._lock = threading.Lock()
+
+    def _cache_key(self, job):
+        content_hash = (self.store.hash_for(job.video_path) if self.store else None) or file_fingerprint(job.video_path)
+        settings = {"stride": job.stride, "imgsz": self.imgsz}
+        return content_hash, model_version(self.weights, self._variant), settings
+
+    def _from_cache(self, job):
+        """Completes 'job' from a cached earlier run. Returns False on a miss."""
+        if self.cache is None:
+            return False
+        entry = self.cache.get("analysis", *self._cache_key(job))
+        if not entry or not os.path.exists(os.path.join(entry["out_dir"], "timeline.json")):
+            return False
+        job.out_dir = entry["out_dir"]
+        job.total_frames = job.processed_frames = entry["total_frames"]
+        job.events = entry["events"]
+        job.cached = True
+        job.started_at = job.finished_at = time.time()
+        job.state = "done"
+        print(f"[ANALYSIS] ✅ Job {job.id} served from cache ({job.out_dir})")
+        return True
+
+    def submit(self, video_path, **params):
+        job = AnalysisJob(video_path, **params)
+        if self._from_cache(job):
+            with self._lock:
+                self._jobs[job.id] = job
+                self._prune()
+            return job
+        with self._lock:
+            self._jobs[job.id] = job
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="analysis-jobs", daemon=True)
+                self._thread.start()
+        self._queue.put(job)
+        print(f"[ANALYSIS] Queued job {job.id} for {video_path}")
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def all(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.status() for job in jobs]
+
+    def _prune(self):
+        """Forgets the oldest finished jobs beyond max_jobs and deletes output no kept job shares (lock held)."""
+        finished = sorted((j for j in self._jobs.values() if j.state in ("done", "failed")),
+                          key=lambda j: j.created_at)
+        for job in finished[:max(0, len(finished) - self.max_jobs)]:
+            del self._jobs[job.id]
+            # cached jobs point at an earlier job's output; cache entries whose output is gone are misses
+            if not any(j.out_dir == job.out_dir for j in self._jobs.values()):
+                shutil.rmtree(job.out_dir, ignore_errors=True)
+
+    def _loop(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            except Exception as e:
+                job.state = "failed"
+                job.error = str(e)
+                print(f"[ANALYSIS] ❌ Job {job.id} failed: {e}")
+            finally:
+                job.finished_at = time.time()
+                with self._lock:
+                    self._prune()
+
+    def _get_pool(self):
+        """The shared worker pool, started on first use after exporting the model once."""
+        if self._pool is None:
+            backend, precision = resolve_variant(self.weights, device=default_device(), warn=False)
+            self._variant = variant_name(backend, precision)
+            if precision == "fp32":
+                # workers would otherwise all find the export missing and run it at the same time
+                export_model(self.weights, backend, imgsz=self.imgsz)
+            threads = min(slot["threads"] for slot in plan_layout(self.workers)["workers"])
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.weights, self.imgsz, threads),
+            )
+            print(f"[ANALYSIS] Started {self.workers} analysis worker(s)")
+        return self._pool
+
+    def _shutdown_pool(self):
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def close(self):
+        """Stops the worker processes (service shutdown)."""
+        with self._lock:
+            self._shutdown_pool()
+
+    def _run(self, job):
+        cap = cv2.VideoCapture(job.video_path)
+        if not cap.isOpened():
+            raise RuntimeError(f"Could not open video: {job.video_path}")
+        job.total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        cap.release()
+
+        os.makedirs(job.out_dir, exist_ok=True)
+        job.state = "running"
+        job.started_at = time.time()
+
+        if job.total_frames > 0:
+            chunks = [(s, min(s + CHUNK_FRAMES, job.total_frames)) for s in range(0, job.total_frames, CHUNK_FRAMES)]
+        else:
+            # container doesn't report a frame count: one sequential chunk to the end
+            chunks = [(0, 2 ** 31)]
+        pool = self._get_pool()
+        job.workers = min(job.workers, self.workers)
+        results = []
+        pending = set()
+        chunks = iter(chunks)
+        try:
+            while True:
+                # keep at most job.workers chunks in flight
+                for s, e in chunks:
+                    pending.add(pool.submit(analyze_chunk, job.video_path, s, e, job.stride, job.batch_size,
+                                            self.imgsz))
+                    if len(pending) >= job.workers:
+                        break
+                if not pending:
+                    break
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    result = future.result()
+                    results.append(result)
+                    job.processed_frames += result["frames"]
+        except BrokenProcessPool:
+            # a worker died (e.g. out of memory); the next job starts fresh processes
+            self._shutdown_pool()
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+
+        results.sort(key=lambda r: r["start"])
+        rows = [row for r in results for row in r["rows"]]
+        events = build_events(rows)
+        save_event_snapshots(job.video_path, events, rows, job.out_dir)
+        job.events = len(events)
+
+        elapsed = time.time() - job.started_at
+        summary = {
+            "jobId": job.id,
+            "video": os.path.basename(job.video_path),
+            "cameraId": job.camera_id,
+            "fps": fps,
+            "totalFrames": job.total_frames,
+            "sampledFrames": sum(r["sampled"] for r in results),
+            "stride": job.stride,
+            "processingSeconds": round(elapsed, 2),
+            "realtimeFactor": round((job.total_frames / fps) / elapsed, 2) if elapsed > 0 else None,
+            "events": events,
+        }
+        write_timeline(job.out_dir, summary, rows)
+        if self.cache is not None:
+            self.cache.put("analysis", *self._cache_key(job), {
+                "out_dir": job.out_dir,
+                "total_frames": job.total_frames,
+                "events": job.events,
+            })
+        job.state = "done"
+        print(f"[ANALYSIS] ✅ Job {job.id} done: {job.total_frames} frames in {elapsed:.1f}s, {len(events)} event(s)")
@@ -24,7 +24,7 @@ export async function POST(req) {
       console.log(`[NEXT_API] [cleanup] Deleted alert ${alertId}`);
     } else if (cameraId) {
       // Clean up all stale alerts for this camera
-      const activeStatuses = ["PENDING", "CONFIRMED_BY_GEMINI", "SENDING_NOTIFICATIONS", "NOTIFIED_COOLDOWN"];
+      const activeStatuses = ["PENDING", "CONFIRMED_BY_GEMINI", "CONFIRMED_LOCALLY", "SENDING_NOTIFICATIONS", "NOTIFIED_COOLDOWN"];
       const alertsSnapshot = await db.collection("alerts")
         .where("cameraId", "==", cameraId)
         .where("status", "in", activeStatuses)
@@ -22,13 +22,13 @@ export async function POST(req) {
 
         // Get old CONFIRMED alerts
         const oldConfirmedAlerts = await db.collection('alerts')
-            .where('status', '==', 'CONFIRMED_BY_GEMINI')
+            .where('status', 'in', ['CONFIRMED_BY_GEMINI', 'CONFIRMED_LOCALLY'])
             .where('createdAt', '<', oneHourAgo)
             .get();
 
         // Get old REJECTED alerts
         const oldRejectedAlerts = await db.collection('alerts')
-            .where('status', '==', 'REJECTED_BY_GEMINI')
+            .where('status', 'in', ['REJECTED_BY_GEMINI', 'REJECTED_LOCALLY'])
             .where('createdAt', '<', oneHourAgo)
             .get();
 
@@ -96,12 +96,12 @@ export async function GET(req) {
             .get();
 
         const oldConfirmedAlerts = await db.collection('alerts')
-            .where('status', '==', 'CONFIRMED_BY_GEMINI')
+            .where('status', 'in', ['CONFIRMED_BY_GEMINI', 'CONFIRMED_LOCALLY'])
             .where('createdAt', '<', oneHourAgo)
             .get();
 
         const oldRejectedAlerts = await db.collection('alerts')
-            .where('status', '==', 'REJECTED_BY_GEMINI')
+            .where('status', 'in', ['REJECTED_BY_GEMINI', 'REJECTED_LOCALLY'])
             .where('createdAt', '<', oneHourAgo)
             .get();
 
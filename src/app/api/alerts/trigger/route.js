@@ -21,7 +21,7 @@ export async function POST(req) {
 
     // Get the full payload from the request body
     const body = await req.json();
-    const { cameraId, imageId, className, confidence, bbox, timestamp } = body;
+    const { cameraId, imageId, className, confidence, bbox, timestamp, localCheck } = body;
 
     if (!cameraId || !imageId || !className) {
       return NextResponse.json({ error: "Missing required fields: cameraId, imageId, className" }, { status: 400 });
@@ -46,7 +46,8 @@ export async function POST(req) {
       className,
       confidence: confidence || 0,
       bbox: bbox || null,
-      timestamp: timestamp || null
+      timestamp: timestamp || null,
+      localCheck: localCheck || null
     };
 
     // Use the new alert pipeline
@@ -18,7 +18,7 @@ export async function POST(req) {
     // Find the active alert for this camera
     const alertsSnap = await db.collection("alerts")
       .where("cameraId", "==", cameraId)
-      .where("status", "in", ["NOTIFIED_COOLDOWN", "DISPATCHED", "CONFIRMED_BY_GEMINI", "SENDING_NOTIFICATIONS"])
+      .where("status", "in", ["NOTIFIED_COOLDOWN", "DISPATCHED", "CONFIRMED_BY_GEMINI", "CONFIRMED_LOCALLY", "SENDING_NOTIFICATIONS"])
       .limit(1)
       .get();
 
@@ -7,6 +7,7 @@ import admin from "firebase-admin";
 import bcrypt from "bcryptjs";
 import nodemailer from "nodemailer";
 import fs from "fs";
+import crypto from "crypto";
 import path from "path";
 
 const DEFAULT_SNAPSHOT_TTL_SEC = 60 * 60 * 24 * 7; // 7 days signed url expiry
@@ -47,6 +48,21 @@ export function haversineKm(lat1, lon1, lat2, lon2) {
   return R * c;
 }
 
+/**
+ * True if localCheck was signed by the Python service for this imageId (HMAC-SHA256
+ * with LOCAL_CHECK_SECRET over "imageId|result|score", see local_verifier.py).
+ * The check arrives through the browser, so an unsigned one is only advisory.
+ */
+function isSignedLocalCheck(localCheck, imageId) {
+  const secret = process.env.LOCAL_CHECK_SECRET;
+  if (!secret || !localCheck || typeof localCheck.signature !== "string" || !imageId) return false;
+  const score = localCheck.classifierScore;
+  const message = `${imageId}|${localCheck.result || ""}|${score == null ? "" : Number(score).toFixed(4)}`;
+  const expected = crypto.createHmac("sha256", secret).update(message).digest();
+  const given = Buffer.from(localCheck.signature, "hex");
+  return given.length === expected.length && crypto.timingSafeEqual(given, expected);
+}
+
 /** Get Storage bucket (admin.storage) */
 function getStorageBucket() {
   const bucketName = process.env.FIREBASE_STORAGE_BUCKET || null;
@@ -566,7 +582,7 @@ export async function getProviderDashboardData(providerEmail) {
         const chunk = houseIds.slice(i, i + chunkSize);
         const alertsSnap = await db.collection("alerts")
           .where("houseId", "in", chunk)
-          .where("status", "in", ["CONFIRMED_BY_GEMINI", "SENDING_NOTIFICATIONS", "NOTIFIED_COOLDOWN", "DISPATCHED"])
+          .where("status", "in", ["CONFIRMED_BY_GEMINI", "CONFIRMED_LOCALLY", "SENDING_NOTIFICATIONS", "NOTIFIED_COOLDOWN", "DISPATCHED"])
           .get();
         alertsSnap.forEach((a) => {
           const ad = a.data();
@@ -634,6 +650,7 @@ export async function checkActiveAlert(cameraId) {
     .where("status", "in", [
       "PENDING",
       "CONFIRMED_BY_GEMINI",
+      "CONFIRMED_LOCALLY",
       "SENDING_NOTIFICATIONS",
       "NOTIFIED_COOLDOWN",
       "DISPATCHED"
@@ -659,7 +676,7 @@ export async function checkActiveAlert(cameraId) {
   // If alert is PENDING and older than 2 minutes, or last updated more than 90 seconds ago, it's stale
   // More aggressive cleanup to prevent blocking
   const isStalePending = alertData.status === "PENDING" && (ageSeconds > 120 || lastUpdateSeconds > 90);
-  const isStaleConfirmed = alertData.status === "CONFIRMED_BY_GEMINI" && lastUpdateSeconds > 180; // 3 minutes without email sending
+  const isStaleConfirmed = (alertData.status === "CONFIRMED_BY_GEMINI" || alertData.status === "CONFIRMED_LOCALLY") && lastUpdateSeconds > 180; // 3 minutes without email sending
 
   if (isStalePending || isStaleConfirmed) {
     console.warn(`[NEXT_BACKEND] [Alert Spam Check] ⚠️ Alert ${alertId} is STALE (status: ${alertData.status}, age: ${ageSeconds.toFixed(0)}s, lastUpdate: ${lastUpdateSeconds.toFixed(0)}s). Auto-cleaning...`);
@@ -713,7 +730,7 @@ export async function checkActiveAlert(cameraId) {
  * It creates the alert and starts the Gemini check in the background.
  */
 export async function createPendingAlert(payload) {
-  const { cameraId, className, confidence, bbox, timestamp, imageId, imageBase64 } = payload;
+  const { cameraId, className, confidence, bbox, timestamp, imageId, imageBase64, localCheck } = payload;
 
   console.log(`[NEXT_BACKEND] [Alert Pipeline] 1. createPendingAlert called for: ${cameraId}`);
 
@@ -745,6 +762,12 @@ export async function createPendingAlert(payload) {
     console.log(`[NEXT_BACKEND] [Alert Pipeline] 1b. No imageBase64 received. Using URL fallback only.`);
   }
 
+  // Only a check signed by the Python service may settle the alert without Gemini
+  const trustedLocalCheck = isSignedLocalCheck(localCheck, imageId);
+  if (localCheck && !trustedLocalCheck) {
+    console.warn(`[NEXT_BACKEND] [Alert Pipeline] 1c. localCheck is not signed with LOCAL_CHECK_SECRET; keeping it as advisory only.`);
+  }
+
   // 4. Create PENDING alert
   const alertRef = db.collection("alerts").doc();
   const alertPayload = {
@@ -757,6 +780,7 @@ export async function createPendingAlert(payload) {
     className, confidence, bbox,
     createdAt: timestamp ? new Date(timestamp) : new Date(),
     geminiCheck: null,
+    localCheck: localCheck ? { ...localCheck, trusted: trustedLocalCheck } : null, // Python's local pre-verification (color / flicker / classifier)
   };
   await alertRef.set(alertPayload);
 
@@ -765,7 +789,7 @@ export async function createPendingAlert(payload) {
   // 5. Start Gemini check (Fire-and-forget, no await)
   // This runs in the background
   console.log(`[NEXT_BACKEND] [Alert Pipeline] 3. Starting Gemini check (fire-and-forget) for alert ${alertRef.id}...`);
-  runGeminiVerification(alertRef.id, snapshotUrl).catch(err => {
+  runGeminiVerification(alertRef.id, snapshotUrl, trustedLocalCheck ? localCheck : null).catch(err => {
     // Catch any unhandled errors in the background task
     console.error(`[NEXT_BACKEND] [Alert Pipeline] 3x. Unhandled error in runGeminiVerification for ${alertRef.id}:`, err);
   });
@@ -776,14 +800,30 @@ export async function createPendingAlert(payload) {
 
 /**
  * [ALERT_PIPELINE] STEP 3 (NEW - Stolen from friend): Run Gemini check.
- * This is the background task.
+ * This is the background task. localCheck is only passed when its signature checked out.
  */
-async function runGeminiVerification(alertId, snapshotUrl) {
+async function runGeminiVerification(alertId, snapshotUrl, localCheck = null) {
   try {
     console.log(`[NEXT_BACKEND] [Alert Pipeline] 3a. (Background) Gemini verification starting for ${alertId}...`);
     console.log(`[NEXT_BACKEND] [Alert Pipeline] 3b. (Background) Snapshot URL: ${snapshotUrl}`);
 
-    const geminiRes = await verifyWithGemini({ imageUrl: snapshotUrl });
+    // Clear cases were already settled by Python's local pre-verification; skip the Gemini call.
+    // A local REAL_FIRE only counts when the classifier backed it: color + flicker alone never send emails.
+    const settledLocally = localCheck && (
+      localCheck.result === "NOT_REAL_FIRE" ||
+      (localCheck.result === "REAL_FIRE" && localCheck.classifierScore != null)
+    );
+    if (settledLocally) {
+      console.log(`[NEXT_BACKEND] [Alert Pipeline] 3b. (Background) Settled locally: ${localCheck.result} (${localCheck.reason})`);
+    }
+    const geminiRes = settledLocally
+      ? {
+        isFire: localCheck.result === "REAL_FIRE",
+        score: localCheck.classifierScore ?? null,
+        reason: `Local check: ${localCheck.reason}`,
+        source: "local",
+      }
+      : await verifyWithGemini({ imageUrl: snapshotUrl });
     console.log(`[NEXT_BACKEND] [Alert Pipeline] 3c. (Background) Gemini response received:`, {
       isFire: geminiRes.isFire,
       score: geminiRes.score,
@@ -804,7 +844,9 @@ async function runGeminiVerification(alertId, snapshotUrl) {
     // Only update if the alert is still PENDING (i.e., user hasn't cancelled)
     if (currentStatus === "PENDING") {
       const updateData = {
-        status: geminiRes.isFire ? "CONFIRMED_BY_GEMINI" : "REJECTED_BY_GEMINI",
+        status: settledLocally
+          ? (geminiRes.isFire ? "CONFIRMED_LOCALLY" : "REJECTED_LOCALLY")
+          : (geminiRes.isFire ? "CONFIRMED_BY_GEMINI" : "REJECTED_BY_GEMINI"),
         geminiCheck: geminiRes,
         updatedAt: admin.firestore.FieldValue.serverTimestamp() // Track when status was updated
       };
@@ -819,7 +861,7 @@ async function runGeminiVerification(alertId, snapshotUrl) {
       console.log(`[NEXT_BACKEND] [Alert Pipeline] 3g. (Background) Update verified. New status: ${verifyStatus}`);
 
       if (geminiRes.isFire) {
-        console.log(`[NEXT_BACKEND] [Alert Pipeline] 4a. (Background) ✅ Gemini confirmed REAL fire for ${alertId}.`);
+        console.log(`[NEXT_BACKEND] [Alert Pipeline] 4a. (Background) ✅ ${settledLocally ? "Local check" : "Gemini"} confirmed REAL fire for ${alertId}.`);
 
         try {
           // --- DISPATCH LOGIC START ---
@@ -893,7 +935,7 @@ async function runGeminiVerification(alertId, snapshotUrl) {
         }
 
       } else {
-        console.log(`[NEXT_BACKEND] [Alert Pipeline] 4b. (Background) ❌ Gemini rejected FAKE fire for ${alertId}.`);
+        console.log(`[NEXT_BACKEND] [Alert Pipeline] 4b. (Background) ❌ ${settledLocally ? "Local check" : "Gemini"} rejected FAKE fire for ${alertId}.`);
         // No need to notify Python - cooldown is handled by Firebase via checkActiveAlert()
       }
     } else {
@@ -938,7 +980,8 @@ export async function cancelAlertByUser(alertId, userEmail) {
 
   const status = doc.data().status;
   // Allow cancellation if it's PENDING or if Gemini just rejected it (the race condition)
-  if (status === "PENDING" || status === "REJECTED_BY_GEMINI" || status === "CONFIRMED_BY_GEMINI") {
+  if (status === "PENDING" || status === "REJECTED_BY_GEMINI" || status === "CONFIRMED_BY_GEMINI" ||
+    status === "REJECTED_LOCALLY" || status === "CONFIRMED_LOCALLY") {
     await alertRef.set({
       status: "CANCELLED_BY_USER",
       canceledBy: userEmail || "unknown_user",
@@ -977,10 +1020,10 @@ export async function confirmAndSendAlerts(alertId) {
     return { ok: true, message: "Alert was cancelled by user." };
   }
 
-  if (status === "REJECTED_BY_GEMINI") {
-    console.log(`[NEXT_BACKEND] [Alert Pipeline] 7b. Alert ${alertId} was REJECTED BY GEMINI. Deleting.`);
+  if (status === "REJECTED_BY_GEMINI" || status === "REJECTED_LOCALLY") {
+    console.log(`[NEXT_BACKEND] [Alert Pipeline] 7b. Alert ${alertId} was ${status}. Deleting.`);
     await deleteAlert(alertId);
-    return { ok: true, message: "Alert was rejected by Gemini." };
+    return { ok: true, message: status === "REJECTED_LOCALLY" ? "Alert was rejected by the local check." : "Alert was rejected by Gemini." };
   }
 
   if (status === "NOTIFIED_COOLDOWN" || status === "SENDING_NOTIFICATIONS") {
@@ -988,14 +1031,14 @@ export async function confirmAndSendAlerts(alertId) {
     return { ok: true, message: "Alert already processed." };
   }
 
-  if (status !== "CONFIRMED_BY_GEMINI") {
+  if (status !== "CONFIRMED_BY_GEMINI" && status !== "CONFIRMED_LOCALLY") {
     // This can happen if the timer expires *before* Gemini finishes (e.g., Gemini is slow)
     console.warn(`[NEXT_BACKEND] [Alert Pipeline] 7d. ⏳ Alert ${alertId} is NOT YET confirmed by Gemini. Status: ${status}. Will retry.`);
     return { ok: false, message: `Alert not confirmed. Status: ${status}` };
   }
 
   // --- IF WE REACH HERE, IT'S A "GO" ---
-  console.log(`[NEXT_BACKEND] [Alert Pipeline] 8. ✅ GO SIGNAL! Alert ${alertId} is CONFIRMED_BY_GEMINI. Sending emails...`);
+  console.log(`[NEXT_BACKEND] [Alert Pipeline] 8. ✅ GO SIGNAL! Alert ${alertId} is ${status}. Sending emails...`);
   await alertRef.set({ status: "SENDING_NOTIFICATIONS" }, { merge: true });
 
   try {
@@ -1080,7 +1123,7 @@ export async function confirmAndSendAlerts(alertId) {
 
   } catch (emailErr) {
     console.error(`[NEXT_BACKEND] [Alert Pipeline] 10. ❌ CRITICAL: Email sending failed for ${alertId}.`, emailErr);
-    await alertRef.set({ status: "CONFIRMED_BY_GEMINI", error: "Failed to send emails" }, { merge: true }); // Reset
+    await alertRef.set({ status, error: "Failed to send emails" }, { merge: true }); // Reset
     return { ok: false, message: "Email sending failed." };
   }
 }
@@ -1111,7 +1154,7 @@ export async function updateActiveAlertImages() {
     console.log(`[NEXT_BACKEND] [Image Update] Starting periodic image update for active alerts...`);
 
     // Get all active alerts
-    const activeStatuses = ["CONFIRMED_BY_GEMINI", "SENDING_NOTIFICATIONS", "NOTIFIED_COOLDOWN", "DISPATCHED"];
+    const activeStatuses = ["CONFIRMED_BY_GEMINI", "CONFIRMED_LOCALLY", "SENDING_NOTIFICATIONS", "NOTIFIED_COOLDOWN", "DISPATCHED"];
     const activeAlertsSnapshot = await db.collection("alerts")
       .where("status", "in", activeStatuses)
       .get();
@@ -1520,7 +1563,7 @@ export async function getActiveAlertsForOwner(ownerEmail) {
   const results = [];
   for (let i = 0; i < houseIds.length; i += chunkSize) {
     const chunk = houseIds.slice(i, i + chunkSize);
-    const snap = await db.collection("alerts").where("houseId", "in", chunk).where("status", "in", ["PENDING", "CONFIRMED_BY_GEMINI", "SENDING_NOTIFICATIONS", "NOTIFIED_COOLDOWN"]).get();
+    const snap = await db.collection("alerts").where("houseId", "in", chunk).where("status", "in", ["PENDING", "CONFIRMED_BY_GEMINI", "CONFIRMED_LOCALLY", "SENDING_NOTIFICATIONS", "NOTIFIED_COOLDOWN"]).get();
     snap.forEach((d) => results.push(d.data()));
   }
   return results;
@@ -1551,7 +1594,7 @@ export async function getAlertsByOwnerEmail(ownerEmail) {
       // Fetch active alerts
       const activeSnap = await db.collection("alerts")
         .where("houseId", "in", chunk)
-        .where("status", "in", ["PENDING", "CONFIRMED_BY_GEMINI", "SENDING_NOTIFICATIONS", "NOTIFIED_COOLDOWN"])
+        .where("status", "in", ["PENDING", "CONFIRMED_BY_GEMINI", "CONFIRMED_LOCALLY", "SENDING_NOTIFICATIONS", "NOTIFIED_COOLDOWN"])
         .get();
       activeSnap.forEach(doc => {
         alerts.push({ id: doc.id, ...doc.data() });
@@ -1565,7 +1608,7 @@ export async function getAlertsByOwnerEmail(ownerEmail) {
         const tenMinutesAgo = admin.firestore.Timestamp.fromMillis(Date.now() - 10 * 60 * 1000);
         const recentSnap = await db.collection("alerts")
           .where("houseId", "in", chunk)
-          .where("status", "in", ["REJECTED_BY_GEMINI", "CANCELLED_BY_USER"])
+          .where("status", "in", ["REJECTED_BY_GEMINI", "REJECTED_LOCALLY", "CANCELLED_BY_USER"])
           .where("createdAt", ">=", tenMinutesAgo)
           .get();
 
@@ -1583,7 +1626,7 @@ export async function getAlertsByOwnerEmail(ownerEmail) {
           console.warn("[NEXT_BACKEND] Index required for recent alerts query. Fetching all rejected/cancelled alerts for this chunk as fallback.");
           const allRejectedSnap = await db.collection("alerts")
             .where("houseId", "in", chunk)
-            .where("status", "in", ["REJECTED_BY_GEMINI", "CANCELLED_BY_USER"])
+            .where("status", "in", ["REJECTED_BY_GEMINI", "REJECTED_LOCALLY", "CANCELLED_BY_USER"])
             .get();
 
           allRejectedSnap.forEach(doc => {
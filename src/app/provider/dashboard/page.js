@@ -195,6 +195,12 @@ const STATUS_CONFIGS = {
     icon: CheckCircle,
     pulse: true
   },
+  CONFIRMED_LOCALLY: {
+    label: 'Fire Confirmed',
+    color: 'bg-green-500/20 border-green-500/30 text-green-300',
+    icon: CheckCircle,
+    pulse: true
+  },
   SENDING_NOTIFICATIONS: {
     label: 'Sending Alerts',
     color: 'bg-yellow-500/20 border-yellow-500/30 text-yellow-300',
@@ -570,7 +576,7 @@ const ProviderDashboard = () => {
   // Flatten alerts from all houses
   const getAllAlerts = () => {
     const alerts = [];
-    const activeStatuses = ['CONFIRMED_BY_GEMINI', 'SENDING_NOTIFICATIONS', 'NOTIFIED_COOLDOWN', 'DISPATCHED'];
+    const activeStatuses = ['CONFIRMED_BY_GEMINI', 'CONFIRMED_LOCALLY', 'SENDING_NOTIFICATIONS', 'NOTIFIED_COOLDOWN', 'DISPATCHED'];
 
     dashboardData.forEach(house => {
       if (house.activeAlerts && house.activeAlerts.length > 0) {
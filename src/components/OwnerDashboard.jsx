@@ -122,10 +122,11 @@ const CameraFeed = ({ camera, onCameraDeleted, onToggleMonitoring, activeAlert }
 
             // 4. --- SPAM CHECK ---
             // Check if there's an active alert that should block new detections
-            // Only block if alert is PENDING, CONFIRMED_BY_GEMINI, SENDING_NOTIFICATIONS, or NOTIFIED_COOLDOWN
-            // Don't block if REJECTED_BY_GEMINI or CANCELLED_BY_USER (these are resolved)
+            // Only block if alert is PENDING, CONFIRMED_BY_GEMINI / CONFIRMED_LOCALLY, SENDING_NOTIFICATIONS, or NOTIFIED_COOLDOWN
+            // Don't block if REJECTED_BY_GEMINI, REJECTED_LOCALLY or CANCELLED_BY_USER (these are resolved)
             const shouldBlock = activeAlert &&
               activeAlert.status !== "REJECTED_BY_GEMINI" &&
+              activeAlert.status !== "REJECTED_LOCALLY" &&
               activeAlert.status !== "CANCELLED_BY_USER";
 
             if (shouldBlock) {
@@ -148,6 +149,7 @@ const CameraFeed = ({ camera, onCameraDeleted, onToggleMonitoring, activeAlert }
                 className: result.detection.class,
                 confidence: result.detection.confidence,
                 bbox: result.detection.bbox,
+                localCheck: result.localCheck || null, // Python's local pre-verification, settles clear cases without Gemini
                 timestamp: new Date().toISOString(),
               }),
             });
@@ -538,19 +540,21 @@ const OwnerDashboard = ({ email }) => {
           // We are ALREADY showing a modal. Let's check its status.
           const newStatus = mainAlertUpdated.status;
 
-          if (newStatus === "REJECTED_BY_GEMINI") {
-            // Gemini rejected it! Close the modal and show a toast.
-            console.log(`[REACT_FRONTEND] Poll: Gemini REJECTED alert ${mainAlertUpdated.alertId}.`);
-            toast.error(`False Alarm: Gemini verification failed. Reason: ${mainAlertUpdated.geminiCheck?.reason || 'Unknown reason'}`);
+          if (newStatus === "REJECTED_BY_GEMINI" || newStatus === "REJECTED_LOCALLY") {
+            // Gemini (or the local check) rejected it! Close the modal and show a toast.
+            const verifier = newStatus === "REJECTED_LOCALLY" ? "Local check" : "Gemini";
+            console.log(`[REACT_FRONTEND] Poll: ${verifier} REJECTED alert ${mainAlertUpdated.alertId}.`);
+            toast.error(`False Alarm: ${verifier} verification failed. Reason: ${mainAlertUpdated.geminiCheck?.reason || 'Unknown reason'}`);
             clearInterval(alertCountdownInterval.current); // Stop the timer
             setActiveAlert(null); // Close the modal
             setAlertCountdown(0);
 
-          } else if (newStatus === "CONFIRMED_BY_GEMINI") {
-            // Gemini confirmed! Show a success toast.
-            if (currentActiveAlert?.status !== "CONFIRMED_BY_GEMINI") { // Only show once
-              console.log(`[REACT_FRONTEND] Poll: Gemini CONFIRMED alert ${mainAlertUpdated.alertId}.`);
-              toast.success(`Gemini Verified: This is a real fire. Confirming action...`);
+          } else if (newStatus === "CONFIRMED_BY_GEMINI" || newStatus === "CONFIRMED_LOCALLY") {
+            // Gemini (or the local check) confirmed! Show a success toast.
+            if (currentActiveAlert?.status !== newStatus) { // Only show once
+              const verifier = newStatus === "CONFIRMED_LOCALLY" ? "Local check" : "Gemini";
+              console.log(`[REACT_FRONTEND] Poll: ${verifier} CONFIRMED alert ${mainAlertUpdated.alertId}.`);
+              toast.success(`${verifier} Verified: This is a real fire. Confirming action...`);
             }
             setActiveAlert(mainAlertUpdated); // Update the alert state
 
@@ -577,7 +581,7 @@ const OwnerDashboard = ({ email }) => {
             const isRecent = alertCreatedAt > fiveMinutesAgo;
 
             // Only show if: status is PENDING or CONFIRMED, is recent, and not already showing
-            return (a.status === 'PENDING' || a.status === 'CONFIRMED_BY_GEMINI') &&
+            return (a.status === 'PENDING' || a.status === 'CONFIRMED_BY_GEMINI' || a.status === 'CONFIRMED_LOCALLY') &&
               isRecent &&
               (!currentActiveAlert || currentActiveAlert.alertId !== a.alertId);
           });
@@ -602,8 +606,8 @@ const OwnerDashboard = ({ email }) => {
             alertsByCamera[alert.cameraId] = alert;
           } else {
             // Priority: active statuses > rejected/cancelled
-            const isActive = ["PENDING", "CONFIRMED_BY_GEMINI", "SENDING_NOTIFICATIONS", "NOTIFIED_COOLDOWN"].includes(alert.status);
-            const existingIsActive = ["PENDING", "CONFIRMED_BY_GEMINI", "SENDING_NOTIFICATIONS", "NOTIFIED_COOLDOWN"].includes(existing.status);
+            const isActive = ["PENDING", "CONFIRMED_BY_GEMINI", "CONFIRMED_LOCALLY", "SENDING_NOTIFICATIONS", "NOTIFIED_COOLDOWN"].includes(alert.status);
+            const existingIsActive = ["PENDING", "CONFIRMED_BY_GEMINI", "CONFIRMED_LOCALLY", "SENDING_NOTIFICATIONS", "NOTIFIED_COOLDOWN"].includes(existing.status);
             if (isActive && !existingIsActive) {
               alertsByCamera[alert.cameraId] = alert; // Replace with active alert
             }
@@ -1652,9 +1656,9 @@ const OwnerDashboard = ({ email }) => {
                             initial={{ opacity: 0, y: 10 }}
                             animate={{ opacity: 1, y: 0 }}
                             transition={{ delay: index * 0.05 }}
-                            className={`p-4 rounded-xl border ${alert.status === 'PENDING' || alert.status === 'CONFIRMED_BY_GEMINI'
+                            className={`p-4 rounded-xl border ${alert.status === 'PENDING' || alert.status === 'CONFIRMED_BY_GEMINI' || alert.status === 'CONFIRMED_LOCALLY'
                               ? 'bg-red-500/10 border-red-500/30'
-                              : alert.status === 'REJECTED_BY_GEMINI' || alert.status === 'CANCELLED_BY_USER'
+                              : alert.status === 'REJECTED_BY_GEMINI' || alert.status === 'REJECTED_LOCALLY' || alert.status === 'CANCELLED_BY_USER'
                                 ? 'bg-gray-500/10 border-gray-500/30'
                                 : 'bg-orange-500/10 border-orange-500/30'
                               }`}
@@ -1662,8 +1666,8 @@ const OwnerDashboard = ({ email }) => {
                             <div className="flex items-start justify-between">
                               <div className="flex items-center gap-3">
                                 <div className={`w-3 h-3 rounded-full ${alert.status === 'PENDING' ? 'bg-yellow-400 animate-pulse' :
-                                  alert.status === 'CONFIRMED_BY_GEMINI' ? 'bg-red-500 animate-pulse' :
-                                    alert.status === 'REJECTED_BY_GEMINI' ? 'bg-gray-500' :
+                                  alert.status === 'CONFIRMED_BY_GEMINI' || alert.status === 'CONFIRMED_LOCALLY' ? 'bg-red-500 animate-pulse' :
+                                    alert.status === 'REJECTED_BY_GEMINI' || alert.status === 'REJECTED_LOCALLY' ? 'bg-gray-500' :
                                       alert.status === 'CANCELLED_BY_USER' ? 'bg-gray-500' :
                                         alert.status === 'NOTIFIED_COOLDOWN' ? 'bg-green-500' :
                                           'bg-orange-400'
@@ -1671,8 +1675,8 @@ const OwnerDashboard = ({ email }) => {
                                 <div>
                                   <p className="text-white font-medium">
                                     {alert.status === 'PENDING' && 'Verifying...'}
-                                    {alert.status === 'CONFIRMED_BY_GEMINI' && '🔥 Fire Confirmed'}
-                                    {alert.status === 'REJECTED_BY_GEMINI' && '❌ False Alarm'}
+                                    {(alert.status === 'CONFIRMED_BY_GEMINI' || alert.status === 'CONFIRMED_LOCALLY') && '🔥 Fire Confirmed'}
+                                    {(alert.status === 'REJECTED_BY_GEMINI' || alert.status === 'REJECTED_LOCALLY') && '❌ False Alarm'}
                                     {alert.status === 'CANCELLED_BY_USER' && '🚫 Cancelled'}
                                     {alert.status === 'NOTIFIED_COOLDOWN' && '✅ Notified'}
                                     {alert.status === 'SENDING_NOTIFICATIONS' && '📤 Sending...'}